@@ -91,6 +91,10 @@ INYOKA_SYSTEM_USER_EMAIL = '@'.join(['system', BASE_DOMAIN_NAME])
 INYOKA_CONTACT_EMAIL = '@'.join(['contact', BASE_DOMAIN_NAME])
 DEFAULT_FROM_EMAIL = INYOKA_SYSTEM_USER_EMAIL
 
+# Number of subscribers notified by one celery task, the mails of a task are
+# sent through one connection.
+NOTIFICATION_CHUNK_SIZE = 200
+
 # Disable portal registration, useful in case of a spam problem
 INYOKA_DISABLE_REGISTRATION = False
 
@@ -138,6 +142,15 @@ FORUM_SURGE_PROTECTION_TIMEOUT = 90  # seconds
 
 FORUM_DISABLE_POSTING = False
 
+# time in seconds a process uses the forum privileges of the anonymous user
+# before checking whether they are still up to date
+FORUM_ANONYMOUS_PRIVILEGES_TIMEOUT = 60
+
+# The unread topics of a user are indexed for this many seconds after the
+# user looked at them the last time, up to FORUM_UNREAD_INDEX_SIZE topics.
+FORUM_UNREAD_INDEX_TIMEOUT = 60 * 60 * 24
+FORUM_UNREAD_INDEX_SIZE = 1500
+
 # Number of days a user is allowed to perform the respective action with his
 # user account.
 USER_REACTIVATION_LIMIT = 31
@@ -155,6 +168,12 @@ USER_INACTIVE_DAYS = 365
 PRIVATE_MESSAGE_TRASH_DURATION = 90
 PRIVATE_MESSAGE_INBOX_SENT_DURATION = 180
 
+# search settings. Only the SEARCH_MAX_TERMS first words of a query are
+# searched for and only the SEARCH_MAX_CANDIDATES newest documents
+# containing the rarest word are ranked.
+SEARCH_MAX_TERMS = 8
+SEARCH_MAX_CANDIDATES = 2000
+
 # wiki settings
 WIKI_MAIN_PAGE = 'Welcome'
 
@@ -167,6 +186,9 @@ WIKI_DISCUSSION_FORUM = 'discussions'
 # rules
 WIKI_TEMPLATE_BASE = 'Wiki/Templates'
 
+# number of parsed wiki templates every process keeps
+WIKI_TEMPLATE_CACHE_SIZE = 500
+
 WIKI_PRIVILEGED_PAGES = []
 
 WIKI_RECENTCHANGES_MAX = 250
@@ -178,6 +200,32 @@ WIKI_REVISIONS_PER_PAGE = 100
 # wiki internal stuff like page or attachment lists.
 WIKI_CACHE_TIMEOUT = 60 * 60 * 2
 
+# how long the location of a rendered thumbnail is cached (one week)
+WIKI_THUMBNAIL_INDEX_TIMEOUT = 60 * 60 * 24 * 7
+
+# how long the diff between two wiki texts is cached (one week)
+WIKI_DIFF_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+# maximum number of wiki texts that are stored as deltas in a row, see
+# the `pack_wiki_texts` command
+WIKI_TEXT_SNAPSHOT_INTERVAL = 16
+
+# number of pages every task of `render_all_pages` renders
+WIKI_RENDER_BATCH_SIZE = 100
+
+# Compiled markup is shared between all processes for this many seconds.
+# Additionally every process keeps up to MARKUP_INSTRUCTION_CACHE_SIZE bytes
+# of recently used instructions for MARKUP_INSTRUCTION_CACHE_LOCAL_TIMEOUT
+# seconds.
+MARKUP_INSTRUCTION_CACHE_TIMEOUT = 60 * 60 * 2
+MARKUP_INSTRUCTION_CACHE_SIZE = 16 * 1024 * 1024
+MARKUP_INSTRUCTION_CACHE_LOCAL_TIMEOUT = 60
+
+# The markup lexer either tries the rules of a state one after another
+# ('sequential') or searches for all of them at once ('combined').  Both
+# produce the same tokens.
+MARKUP_LEXER = 'combined'
+
 # Make this unique, and don't share it with anybody.
 SECRET_KEY = None
 
@@ -276,6 +324,7 @@ CELERY_IMPORTS = [
     'inyoka.wiki.tasks',
     'inyoka.utils.notification',
     'inyoka.forum.notifications',
+    'inyoka.forum.tasks',
 ]
 
 # Run tasks at specific time
@@ -308,6 +357,10 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'inyoka.wiki.tasks.update_page_by_slug',
         'schedule': timedelta(hours=1),
     },
+    'flush_forum_topic_views': {
+        'task': 'inyoka.forum.tasks.flush_topic_views',
+        'schedule': timedelta(minutes=5),
+    },
     'render_all_wiki_pages': {
         'task': 'inyoka.wiki.tasks.render_all_pages',
         'schedule': crontab(hour=23, minute=5),
@@ -0,0 +1,182 @@
+"""
+    inyoka.forum.acl
+    ~~~~~~~~~~~~~~~~
+
+    Precomputed forum privileges.
+
+    Checking ``user.has_perm('forum.view_forum', forum)`` for every forum goes
+    through django-guardian for every single forum.  This module instead
+    collects all object permissions of a user for all forums at once into a
+    dictionary that maps forum ids to privilege bit fields.
+
+    The privileges of every group and user are cached under a version key that
+    is replaced whenever a forum permission changes.  The privileges of the
+    anonymous user are additionally kept per process.
+
+    :copyright: (c) 2007-2025 by the Inyoka Team, see AUTHORS for more details.
+    :license: BSD, see LICENSE for more details.
+"""
+from time import monotonic
+from uuid import uuid4
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from guardian.models import GroupObjectPermission, UserObjectPermission
+
+from inyoka.forum.models import Forum
+
+#: Object permissions of forums.  The position of a permission is its bit in
+#: the privilege bit fields, so only append new permissions.
+PRIVILEGES = (
+    'view_forum',
+    'add_topic_forum',
+    'add_reply_forum',
+    'sticky_forum',
+    'poll_forum',
+    'vote_forum',
+    'upload_forum',
+    'moderate_forum',
+    'delete_topic_forum',
+    'add_forum',
+    'change_forum',
+    'delete_forum',
+)
+
+#: Maps the full permission names to their bits
+PRIVILEGE_BITS = {'forum.%s' % codename: 1 << index
+                  for index, codename in enumerate(PRIVILEGES)}
+_codename_bits = {codename: 1 << index for index, codename in enumerate(PRIVILEGES)}
+
+PRIV_NONE = 0
+PRIV_ALL = (1 << len(PRIVILEGES)) - 1
+
+#: ``(checked_at, version, privileges)`` of the anonymous user
+_anonymous_privileges = None
+
+
+def get_version():
+    """Return the current version of the cached privileges."""
+    return cache.get_or_set('forum/privileges_version', lambda: uuid4().hex, None)
+
+
+def invalidate_privileges():
+    """Drop the cached privileges of all users and groups."""
+    global _anonymous_privileges
+    _anonymous_privileges = None
+    cache.set('forum/privileges_version', uuid4().hex, None)
+
+
+def invalidate_user_privileges(user_ids):
+    """Drop the cached privileges of the users with the ids `user_ids`."""
+    global _anonymous_privileges
+    _anonymous_privileges = None
+    version = get_version()
+    cache.delete_many([f'forum/privileges/{version}/user/{user_id}'
+                       for user_id in user_ids])
+
+
+def get_cached_privileges(user_ids):
+    """
+    Return a dictionary mapping the ids of the users in `user_ids` to their
+    privileges, if they are in the cache.  Missing privileges are not
+    computed.
+    """
+    version = get_version()
+    keys = {f'forum/privileges/{version}/user/{user_id}': user_id for user_id in user_ids}
+    return {keys[key]: privileges for key, privileges in cache.get_many(keys).items()}
+
+
+def _merge(privileges, rows):
+    for forum_id, codename in rows:
+        forum_id = int(forum_id)
+        privileges[forum_id] = privileges.get(forum_id, PRIV_NONE) | _codename_bits[codename]
+
+
+def get_group_privileges(group_ids, version=None):
+    """
+    Return the privileges the groups with the ids `group_ids` have together.
+
+    The privileges of every group are materialized in the cache.
+    """
+    if version is None:
+        version = get_version()
+    keys = {f'forum/privileges/{version}/group/{group_id}': group_id
+            for group_id in group_ids}
+    cached = cache.get_many(keys)
+
+    missing = {group_id: {} for key, group_id in keys.items() if key not in cached}
+    if missing:
+        rows = GroupObjectPermission.objects.filter(
+            content_type=ContentType.objects.get_for_model(Forum),
+            group_id__in=missing,
+            permission__codename__in=PRIVILEGES,
+        ).values_list('group_id', 'object_pk', 'permission__codename')
+        for group_id, forum_id, codename in rows:
+            _merge(missing[group_id], [(forum_id, codename)])
+        cache.set_many({f'forum/privileges/{version}/group/{group_id}': group_privileges
+                        for group_id, group_privileges in missing.items()})
+        cached.update((f'forum/privileges/{version}/group/{group_id}', group_privileges)
+                      for group_id, group_privileges in missing.items())
+
+    privileges = {}
+    for group_privileges in cached.values():
+        for forum_id, bits in group_privileges.items():
+            privileges[forum_id] = privileges.get(forum_id, PRIV_NONE) | bits
+    return privileges
+
+
+def _compute_privileges(user, version):
+    # This resembles `guardian.core.ObjectPermissionChecker.get_perms`
+    if not user.is_active:
+        return {}
+    if user.is_superuser:
+        return dict.fromkeys(Forum.objects.get_ids(), PRIV_ALL)
+
+    group_ids = user.groups.values_list('id', flat=True)
+    privileges = get_group_privileges(group_ids, version)
+    _merge(privileges, UserObjectPermission.objects.filter(
+        content_type=ContentType.objects.get_for_model(Forum),
+        user=user,
+        permission__codename__in=PRIVILEGES,
+    ).values_list('object_pk', 'permission__codename'))
+    return privileges
+
+
+def get_privileges(user):
+    """
+    Return a dictionary mapping forum ids to the privilege bits of `user`.
+
+    Forums the user has no privileges for are missing in the dictionary.
+    """
+    global _anonymous_privileges
+    if user.is_anonymous:
+        local = _anonymous_privileges
+        if local is not None and monotonic() - local[0] < settings.FORUM_ANONYMOUS_PRIVILEGES_TIMEOUT:
+            return local[2]
+
+    if not user.is_active or user.is_superuser:
+        return _compute_privileges(user, None)
+
+    version = get_version()
+    if user.is_anonymous and local is not None and local[1] == version:
+        _anonymous_privileges = (monotonic(), version, local[2])
+        return local[2]
+
+    key = f'forum/privileges/{version}/user/{user.id}'
+    privileges = cache.get(key)
+    if privileges is None:
+        privileges = _compute_privileges(user, version)
+        cache.set(key, privileges)
+
+    if user.is_anonymous:
+        _anonymous_privileges = (monotonic(), version, privileges)
+    return privileges
+
+
+def has_privilege(user, forum, privilege):
+    """
+    Return whether `user` has `privilege` (for example ``'forum.view_forum'``)
+    for `forum`.
+    """
+    return bool(get_privileges(user).get(forum.id, PRIV_NONE) & PRIVILEGE_BITS[privilege])
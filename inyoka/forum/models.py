@@ -10,6 +10,9 @@
 import os
 import pickle
 import re
+import struct
+import sys
+from array import array
 from datetime import datetime, timezone
 from functools import reduce
 from hashlib import md5
@@ -18,6 +21,7 @@ from operator import attrgetter, itemgetter
 from os import path
 from time import time
 from typing import Optional
+from uuid import uuid4
 
 from django.conf import settings
 from django.contrib.auth.models import Group
@@ -25,7 +29,18 @@ from django.contrib.contenttypes.models import ContentType
 from django.core.cache import cache
 from django.core.exceptions import PermissionDenied
 from django.db import models, transaction
-from django.db.models import Count, F, Max, QuerySet, Sum
+from django.db.models import (
+    Case,
+    Count,
+    F,
+    IntegerField,
+    Max,
+    Q,
+    QuerySet,
+    Sum,
+    Value,
+    When,
+)
 from django.utils import timezone as dj_timezone
 from django.utils.encoding import DjangoUnicodeDecodeError, force_str
 from django.utils.html import escape, format_html
@@ -60,6 +75,9 @@ from inyoka.wiki.models import Page as WikiPage
 
 _newline_re = re.compile(r'\r?\n')
 
+#: The forum tree snapshot of this process, see `ForumManager.get_tree`
+_forum_tree = None
+
 
 def fix_plaintext(text):
     text = escape(text)
@@ -67,6 +85,89 @@ def fix_plaintext(text):
     return text
 
 
+class ForumTree:
+    """
+    Immutable snapshot of the forum hierarchy.
+
+    The forums are stored in flat tuples in depth-first order with the
+    children of each forum sorted by position.  Thus the descendants of the
+    forum at `index` are exactly the ids from ``index + 1`` up to
+    ``ends[index]`` and no tree walking is needed to look them up.  The
+    ancestors of every forum are precomputed as well.
+    """
+
+    def __init__(self, version, rows):
+        """
+        :param version: The cache version this snapshot belongs to.
+        :param rows: Iterable of ``(id, parent_id, position)`` tuples.
+        """
+        self.version = version
+
+        children = {}
+        positions = {}
+        for forum_id, parent_id, position in rows:
+            children.setdefault(parent_id, []).append(forum_id)
+            positions[forum_id] = position
+        for child_ids in children.values():
+            child_ids.sort(key=lambda forum_id: (positions[forum_id], forum_id))
+
+        ids, parent_ids, depths, ends, ancestors = [], [], [], [], []
+
+        def visit(forum_id, parents):
+            index = len(ids)
+            ids.append(forum_id)
+            parent_ids.append(parents[0] if parents else None)
+            depths.append(len(parents))
+            ends.append(None)
+            ancestors.append(parents)
+            for child_id in children.get(forum_id, ()):
+                visit(child_id, (forum_id,) + parents)
+            ends[index] = len(ids)
+
+        for forum_id in children.get(None, ()):
+            visit(forum_id, ())
+
+        self.ids = tuple(ids)
+        self.parent_ids = tuple(parent_ids)
+        self.positions = tuple(positions[forum_id] for forum_id in ids)
+        self.depths = tuple(depths)
+        self.ends = tuple(ends)
+        self._ancestors = tuple(ancestors)
+        self._index = {forum_id: index for index, forum_id in enumerate(ids)}
+        self._children = {parent_id: tuple(child_ids)
+                          for parent_id, child_ids in children.items()}
+
+    def __contains__(self, forum_id):
+        return forum_id in self._index
+
+    def __len__(self):
+        return len(self.ids)
+
+    def children(self, forum_id):
+        """Return the ids of the direct children, sorted by position."""
+        return self._children.get(forum_id, ())
+
+    def descendants(self, forum_id):
+        """Return the ids of all descendants in depth-first order."""
+        index = self._index.get(forum_id)
+        if index is None:
+            return ()
+        return self.ids[index + 1:self.ends[index]]
+
+    def ancestors(self, forum_id):
+        """Return the ids of all ancestors, starting with the parent."""
+        index = self._index.get(forum_id)
+        if index is None:
+            return ()
+        return self._ancestors[index]
+
+    def is_outdated(self, forum):
+        """Return whether `forum` is placed differently in this snapshot."""
+        index = self._index.get(forum.id)
+        return (index is None or self.parent_ids[index] != forum.parent_id or
+                self.positions[index] != forum.position)
+
+
 class ForumManager(models.Manager):
 
     def get_slugs(self):
@@ -150,6 +251,43 @@ class ForumManager(models.Manager):
         # return all forums instead
         return list(self.get_all_forums_cached().values())
 
+    def get_cached_by_id(self):
+        """Return a dictionary mapping forum ids to the cached forums."""
+        return {forum.id: forum for forum in self.get_cached()}
+
+    def get_tree(self):
+        """Return the :class:`ForumTree` snapshot of the forum hierarchy.
+
+        The snapshot is kept per process and is only rebuilt if the version
+        stored in the cache changed, see :meth:`invalidate_tree`.
+        """
+        global _forum_tree
+        version = cache.get_or_set('forum/tree_version', lambda: uuid4().hex, None)
+        tree = _forum_tree
+        if tree is None or tree.version != version:
+            rows = self.get_queryset().values_list('id', 'parent_id', 'position')
+            tree = _forum_tree = ForumTree(version, rows)
+        return tree
+
+    def invalidate_tree(self, forum=None):
+        """Force every process to rebuild its forum tree snapshot.
+
+        If `forum` is given, nothing is done as long as the current snapshot
+        of this process places `forum` the same way.
+        """
+        tree = _forum_tree
+        if (forum is not None and tree is not None and
+                tree.version == cache.get('forum/tree_version') and
+                not tree.is_outdated(forum)):
+            return
+        self._replace_tree_version()
+        # other processes may build a snapshot before the commit
+        if transaction.get_connection().in_atomic_block:
+            transaction.on_commit(self._replace_tree_version)
+
+    def _replace_tree_version(self):
+        cache.set('forum/tree_version', uuid4().hex, None)
+
     def get_forums_filtered(self, user, priv='forum.view_forum', reverse=False, sort=False):
         """Return all forums the `user` has proper privileges for.
 
@@ -159,15 +297,24 @@ class ForumManager(models.Manager):
                         that only visible forums are returned.
         :param sort: Sort the output by position.
         """
+        from inyoka.forum.acl import PRIVILEGE_BITS
+
         if sort:
             forums = self.get_sorted()
         else:
             forums = self.get_cached()
 
+        bit = PRIVILEGE_BITS.get(priv)
+        if bit is None:
+            has_priv = lambda forum: user.has_perm(priv, forum)
+        else:
+            privileges = user.forum_privileges()
+            has_priv = lambda forum: privileges.get(forum.id, 0) & bit
+
         if reverse:
-            forums = [forum for forum in forums if not user.has_perm(priv, forum)]
+            forums = [forum for forum in forums if not has_priv(forum)]
         else:
-            forums = [forum for forum in forums if user.has_perm(priv, forum)]
+            forums = [forum for forum in forums if has_priv(forum)]
         return forums
 
     def get_categories(self):
@@ -178,6 +325,18 @@ class ForumManager(models.Manager):
         forums = sorted(forums, key=attrgetter(attr))
         return forums
 
+    def push_last_post(self, forums: list["Forum"], post: "Post") -> None:
+        """
+        Set the new `post` as last_post of the given forums.
+
+        This is a conditional ``UPDATE``, forums that already point to a more
+        recent post are left untouched.  Thus no aggregate is needed when
+        posts are created.
+        """
+        (self.filter(id__in=[forum.id for forum in forums])
+             .filter(Q(last_post__isnull=True) | Q(last_post__lt=post.id))
+             .update(last_post=post))
+
     @staticmethod
     def update_last_post(forums: list["Forum"],
                          exclude_topic: Optional["Topic"] = None,
@@ -195,27 +354,101 @@ class ForumManager(models.Manager):
 
         Both parameters are needed, as a topic/post can not be deleted, if they are
         still referenced by a forum.
+
+        The maxima of ``Topic.last_post`` of all affected forums are fetched
+        in one grouped query.  Only the topic of `exclude_post` has to look
+        at its posts.  Forums that already point to the right post are not
+        written.
         """
-        for forum in forums:
-            descendants_with_forum = [descendant.id for descendant in forum.descendants] + [forum.id]
+        if not forums:
+            return
 
-            if exclude_post is not None:
-                last_post = Post.objects.exclude(hidden=True).exclude(id=exclude_post.pk).filter(
-                    topic__forum__in=descendants_with_forum).aggregate(count=Max('id'))
+        tree = Forum.objects.get_tree()
+        subtrees = {forum.id: (forum.id,) + tree.descendants(forum.id)
+                    for forum in forums}
+        forum_ids = set().union(*subtrees.values())
+
+        topics = Topic.objects.filter(forum__in=forum_ids)
+        if exclude_topic is not None:
+            topics = topics.exclude(id=exclude_topic.pk)
+        if exclude_post is not None:
+            topics = topics.exclude(id=exclude_post.topic_id)
+        maxima = dict(topics.order_by().values_list('forum_id')
+                            .annotate(Max('last_post')))
+
+        if exclude_post is not None:
+            last_post = Post.objects.filter(topic=exclude_post.topic_id, hidden=False) \
+                                    .exclude(id=exclude_post.pk) \
+                                    .aggregate(id=Max('id'))['id']
+            forum_id = exclude_post.topic.forum_id
+            if last_post is not None and (maxima.get(forum_id) or 0) < last_post:
+                maxima[forum_id] = last_post
+
+        updates = {}
+        for forum in forums:
+            last_post_id = max((maxima[forum_id] for forum_id in subtrees[forum.id]
+                                if maxima.get(forum_id) is not None), default=None)
+            forum.last_post_id = last_post_id
+            updates.setdefault(last_post_id, []).append(forum.id)
+
+        for last_post_id, ids in updates.items():
+            query = Forum.objects.filter(id__in=ids)
+            if last_post_id is None:
+                query = query.exclude(last_post__isnull=True)
             else:
-                # if no post to exclude is given, it's possible to rely on Topic.last_post
-                # → this makes the query faster
-                query = Topic.objects
-                if exclude_topic is not None:
-                    query = query.exclude(id=exclude_topic.pk)
-                last_post = query.filter(forum__in=descendants_with_forum).aggregate(count=Max('last_post'))
-
-            forum.last_post_id = last_post['count']
-            forum.save()
+                query = query.exclude(last_post=last_post_id)
+            query.update(last_post=last_post_id)
+
+        cache.delete_many([f'forum/forums/{forum.slug}' for forum in forums])
+
+
+#: Redis hash that buffers the views of topics, see `Topic.touch`
+TOPIC_VIEWS_KEY = 'forum/topic_views'
 
 
 class TopicManager(models.Manager):
 
+    def add_pending_views(self, topics):
+        """
+        Add the buffered views (see `Topic.touch`) to the `view_count` of
+        `topics`, so that the displayed numbers are up to date.
+        """
+        if not topics:
+            return
+        redis = cache.client.get_client()
+        pending = redis.hmget(cache.make_key(TOPIC_VIEWS_KEY), [topic.id for topic in topics])
+        for topic, views in zip(topics, pending):
+            if views is not None:
+                topic.view_count += int(views)
+
+    def flush_views(self):
+        """
+        Write the buffered views to the database with a single query and
+        return the number of updated topics.
+        """
+        redis = cache.client.get_client()
+        key = cache.make_key(TOPIC_VIEWS_KEY)
+        pipe = redis.pipeline()
+        pipe.hgetall(key)
+        pipe.delete(key)
+        views, __ = pipe.execute()
+        if not views:
+            return 0
+
+        views = {int(topic_id): int(count) for topic_id, count in views.items()}
+        delta = Case(*[When(id=topic_id, then=Value(count)) for topic_id, count in views.items()],
+                     default=Value(0), output_field=IntegerField())
+        try:
+            self.filter(id__in=views).update(view_count=F('view_count') + delta)
+        except Exception:
+            # Don't lose the views, the next flush tries again
+            pipe = redis.pipeline()
+            for topic_id, count in views.items():
+                pipe.hincrby(key, topic_id, count)
+            pipe.execute()
+            raise
+        return len(views)
+
     def prepare_for_overview(self, topic_ids):
         related = ('author', 'last_post', 'last_post__author', 'first_post',
                    'first_post__author')
@@ -252,14 +485,15 @@ class TopicManager(models.Manager):
             user = User.objects.get_anonymous_user()
 
         if forum:
-            if not user.has_perm('forum.view_forum', forum):
+            visible = {f.id for f in Forum.objects.get_forums_filtered(user)}
+            if forum.id not in visible:
                 raise PermissionDenied
-            allowed_forums = [forum]
-
-            allowed_forums += [child for child in forum.descendants if user.has_perm('forum.view_forum', child)]
+            allowed_forums = [forum.id]
+            allowed_forums += [forum_id for forum_id in Forum.objects.get_tree().descendants(forum.id)
+                               if forum_id in visible]
         else:
             # no specific forum passed, use all forums the user has view-permission
-            allowed_forums = Forum.objects.get_forums_filtered(user)
+            allowed_forums = [f.id for f in Forum.objects.get_forums_filtered(user)]
 
         if not allowed_forums:
             raise PermissionDenied
@@ -382,9 +616,18 @@ class Forum(models.Model):
 
     def get_parents(self, cached=True):
         """Return a list of all parent forums up to the root level."""
+        if cached:
+            tree = Forum.objects.get_tree()
+            if self.id in tree:
+                forums = Forum.objects.get_cached_by_id()
+                try:
+                    return [forums[forum_id] for forum_id in tree.ancestors(self.id)]
+                except KeyError:
+                    pass
+            # the forum was created after the snapshot or the cache was taken
+
         parents = []
-        forums = Forum.objects.get_cached() if cached else Forum.objects.all()
-        qdct = {forum.id: forum for forum in forums}
+        qdct = {forum.id: forum for forum in Forum.objects.all()}
 
         forum = qdct[self.id]
         while not forum.is_category:
@@ -398,24 +641,22 @@ class Forum(models.Model):
 
     @property
     def is_category(self):
-        return self.parent is None
+        return self.parent_id is None
 
     @property
     def children(self):
-        forums = Forum.objects.get_cached()
-        children = [forum for forum in forums if forum.parent_id == self.id]
-        return children
+        forums = Forum.objects.get_cached_by_id()
+        return [forums[forum_id] for forum_id
+                in Forum.objects.get_tree().children(self.id) if forum_id in forums]
 
     @property
     def descendants(self):
         """
         Linke children but also returns the children of the children and so on.
         """
-        descedants = []
-        for child in self.children:
-            descedants.append(child)
-            descedants.extend(child.descendants)
-        return descedants
+        forums = Forum.objects.get_cached_by_id()
+        return [forums[forum_id] for forum_id
+                in Forum.objects.get_tree().descendants(self.id) if forum_id in forums]
 
     def filter_children(self, forums):
         return [forum for forum in forums if forum.parent_id == self.id]
@@ -439,6 +680,8 @@ class Forum(models.Model):
         if user._readstatus.mark(self, user):
             user.forum_read_status = user._readstatus.serialize()
             user.save(update_fields=('forum_read_status',))
+            from inyoka.forum.unread import invalidate_index
+            invalidate_index(user)
 
     def find_welcome(self, user):
         """
@@ -500,10 +743,16 @@ class Forum(models.Model):
         """
         if isinstance(parent, Forum):
             parent = parent.id
-        matched_forums = [f for f in forums if f.parent_id == parent]
-        for f in matched_forums:
-            yield offset, f
-            yield from Forum.get_children_recursive(forums, f, offset + 1)
+        children = {}
+        for f in forums:
+            children.setdefault(f.parent_id, []).append(f)
+
+        def walk(parent_id, offset):
+            for f in children.get(parent_id, ()):
+                yield offset, f
+                yield from walk(f.id, offset + 1)
+
+        yield from walk(parent, offset)
 
     def get_supporters(self):
         if self.support_group is None:
@@ -604,8 +853,11 @@ class Topic(models.Model):
         return Forum.objects.get(self.forum_id)
 
     def touch(self):
-        """Increment the view count in a safe way."""
-        Topic.objects.filter(id=self.id).update(view_count=F('view_count') + 1)
+        """
+        Count a view of this topic.  The views are buffered in redis and
+        written to the database by the `flush_topic_views` task.
+        """
+        cache.client.get_client().hincrby(cache.make_key(TOPIC_VIEWS_KEY), self.id, 1)
 
     def move(self, new_forum):
         """Move the topic to another forum."""
@@ -754,6 +1006,8 @@ class Topic(models.Model):
         if user._readstatus.mark(self, user):
             user.forum_read_status = user._readstatus.serialize()
             user.save(update_fields=('forum_read_status',))
+            from inyoka.forum.unread import remove_topic
+            remove_topic(user, self)
 
     @property
     def post_count(self):
@@ -1416,10 +1670,81 @@ class Poll(models.Model):
 class ReadStatus:
     """
     Manages the read status of forums and topics for a specific user.
+
+    The read status is stored per forum as a watermark (every post with an id
+    lower or equal to it is read) and a bounded set of ids of the last posts
+    of read topics newer than the watermark.
+
+    It is serialized into a compact binary format::
+
+        header:   b'IRS' + version (uint8)
+        per row:  forum id, watermark (0 if unset), n (uint32 each)
+                  followed by n sorted post ids (uint32 each)
+
+    All integers are little endian.  Rows that were not changed since
+    loading are written back as they were read, so marking a single topic
+    only re-encodes the row of its forum.  Data in the old pickle based
+    format is still understood and converted on the next write.
     """
 
+    MAGIC = b'IRS'
+    VERSION = 1
+
+    _header = struct.Struct('<3sB')
+    _row = struct.Struct('<III')
+
     def __init__(self, serialized_data):
-        self.data = pickle.loads(serialized_data) if serialized_data else {}
+        self._data = {}
+        self._segments = {}
+        if serialized_data:
+            self._load(bytes(serialized_data))
+
+    def _load(self, blob):
+        if not blob.startswith(self.MAGIC):
+            # legacy format, converted on the next call to `serialize`
+            for forum_id, (watermark, post_ids) in pickle.loads(blob).items():
+                self._data[forum_id] = (watermark, set(post_ids))
+            return
+
+        magic, version = self._header.unpack_from(blob)
+        if version != self.VERSION:
+            raise ValueError('Unsupported read status version %d' % version)
+
+        offset = self._header.size
+        while offset < len(blob):
+            forum_id, watermark, count = self._row.unpack_from(blob, offset)
+            start = offset + self._row.size
+            end = start + count * 4
+            post_ids = array('I', blob[start:end])
+            if sys.byteorder == 'big':
+                post_ids.byteswap()
+            self._data[forum_id] = (watermark or None, set(post_ids))
+            self._segments[forum_id] = blob[offset:end]
+            offset = end
+
+    def _encode_row(self, forum_id, row):
+        watermark, post_ids = row
+        post_ids = array('I', sorted(post_ids))
+        if sys.byteorder == 'big':
+            post_ids.byteswap()
+        return (self._row.pack(forum_id, watermark or 0, len(post_ids)) +
+                post_ids.tobytes())
+
+    def _set_row(self, forum_id, watermark, post_ids):
+        self._data[forum_id] = (watermark, post_ids)
+        self._segments.pop(forum_id, None)
+
+    @property
+    def data(self):
+        """
+        Mapping of forum ids to ``(watermark, post_ids)`` tuples.
+        """
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+        self._segments = {}
 
     def __call__(self, item):
         """
@@ -1434,8 +1759,48 @@ class ReadStatus:
         else:
             raise ValueError('Can\'t determine read status of an unknown type')
 
-        row = self.data.get(forum_id, (None, []))
-        if row[0] and row[0] >= post_id:
+        return self._is_read(forum_id, post_id, is_forum)
+
+    def bulk_status(self, items):
+        """
+        Determine the read status of many forums and topics at once.
+
+        Returns a dictionary that maps every item to its read status.  The
+        items are grouped by forum, so the row of each forum is looked up
+        only once, no matter how many topics of it are listed.
+        """
+        by_forum = {}
+        for item in items:
+            if isinstance(item, Forum):
+                by_forum.setdefault(item.id, []).append((item, True))
+            elif isinstance(item, Topic):
+                by_forum.setdefault(item.forum_id, []).append((item, False))
+            else:
+                raise ValueError('Can\'t determine read status of an unknown type')
+
+        status = {}
+        for forum_id, forum_items in by_forum.items():
+            watermark, post_ids = self._data.get(forum_id, (None, ()))
+            watermark = watermark or 0
+            for item, is_forum in forum_items:
+                post_id = item.last_post_id
+                status[item] = post_id is not None and (
+                    post_id <= watermark or
+                    (not is_forum and post_id in post_ids))
+        return status
+
+    def is_post_read(self, forum_id, post_id):
+        """
+        Return whether the post with the id `post_id` in a topic of the forum
+        with the id `forum_id` was read.
+        """
+        return self._is_read(forum_id, post_id)
+
+    def _is_read(self, forum_id, post_id, is_forum=False):
+        row = self._data.get(forum_id)
+        if row is None:
+            return False
+        if row[0] and post_id is not None and row[0] >= post_id:
             return True
         elif is_forum:
             return False
@@ -1449,10 +1814,10 @@ class ReadStatus:
         if self(item):
             return False
         forum_id = item.id if isinstance(item, Forum) else item.forum_id
-        post_id = item.last_post.id
+        post_id = item.last_post_id
 
         if isinstance(item, Forum):
-            self.data[forum_id] = (post_id, set())
+            self._set_row(forum_id, post_id, set())
             for child in item.children:
                 self.mark(child, user)
             if item.parent_id:
@@ -1466,43 +1831,82 @@ class ReadStatus:
         self.__add_topics_read_state_to_forum(forum_id, post_id)
 
         # Mark the containing forum as read, if this was the last unread topic
-        children = item.forum.children
-        if children:
+        forum = item.forum
+        if forum.children:
             return True
-        topics = Topic.objects.filter(forum=item.forum)\
-                      .order_by('-sticky', '-last_post')[:settings.FORUM_LIMIT_UNREAD]
-        for topic in topics:
-            if not topic.get_read_status(user):
+        # The last post of the forum belongs to one of its topics; as long as
+        # it is unread there is no need to look at the other topics.
+        if (forum.last_post_id is not None and
+                not self._is_read(forum_id, forum.last_post_id)):
+            return True
+        last_post_ids = Topic.objects.filter(forum=forum) \
+            .order_by('-sticky', '-last_post') \
+            .values_list('last_post_id', flat=True)[:settings.FORUM_LIMIT_UNREAD]
+        for last_post_id in last_post_ids:
+            if not self._is_read(forum_id, last_post_id):
                 return True
-        self.mark(item.forum, user)
+        self.mark(forum, user)
         return True
 
+    def mark_all(self, last_posts):
+        """
+        Mark all forums as read at once.
+
+        `last_posts` is an iterable of ``(forum_id, last_post_id)`` tuples.
+        Returns whether the read status changed.
+        """
+        changed = False
+        for forum_id, last_post_id in last_posts:
+            if last_post_id is None or self._is_read(forum_id, last_post_id, True):
+                continue
+            self._set_row(forum_id, last_post_id, set())
+            changed = True
+        return changed
+
     def __add_topics_read_state_to_forum(self, parent_forum_id, last_post_id_in_topic):
         """
         This saves the read state to the parent forum.
         It also_limits the number of topics for which the read status is stored to FORUM_LIMIT_UNREAD.
         If this number is reached, the older half of the stored entries will be discarded.
         """
-        row = self.data.get(parent_forum_id, (None, set()))
-        row[1].add(last_post_id_in_topic)
-        if len(row[1]) > settings.FORUM_LIMIT_UNREAD:
-            r = sorted(row[1])
-            row = (
-                r[settings.FORUM_LIMIT_UNREAD // 2],
-                set(r[settings.FORUM_LIMIT_UNREAD // 2:])
-            )
-        self.data[parent_forum_id] = row
+        watermark, post_ids = self._data.get(parent_forum_id, (None, set()))
+        post_ids = set(post_ids)
+        post_ids.add(last_post_id_in_topic)
+        if len(post_ids) > settings.FORUM_LIMIT_UNREAD:
+            r = sorted(post_ids)
+            watermark = r[settings.FORUM_LIMIT_UNREAD // 2]
+            post_ids = set(r[settings.FORUM_LIMIT_UNREAD // 2:])
+        self._set_row(parent_forum_id, watermark, post_ids)
 
     def serialize(self):
-        return pickle.dumps(self.data)
+        parts = [self._header.pack(self.MAGIC, self.VERSION)]
+        for forum_id, row in self._data.items():
+            segment = self._segments.get(forum_id)
+            if segment is None:
+                segment = self._segments[forum_id] = self._encode_row(forum_id, row)
+            parts.append(segment)
+        return b''.join(parts)
+
+
+def get_read_status_map(user, items):
+    """
+    Return a dictionary mapping the forums and topics in `items` to their
+    read status for `user`.  Use this for listings instead of calling
+    `get_read_status` for every single object.
+    """
+    if user.is_anonymous:
+        return dict.fromkeys(items, True)
+    return user._readstatus.bulk_status(items)
 
 
 def mark_all_forums_read(user):
-    """Shortcut to mark all forums as read to prevent serializing to often."""
+    """Mark all forums as read with a single query and a single write."""
     if user.is_anonymous:
         return
-    for forum in Forum.objects.filter(parent=None):
-        user._readstatus.mark(forum, user)
-    user.forum_read_status = user._readstatus.serialize()
-    user.save(update_fields=('forum_read_status',))
+    last_posts = Forum.objects.values_list('id', 'last_post_id')
+    if user._readstatus.mark_all(last_posts):
+        user.forum_read_status = user._readstatus.serialize()
+        user.save(update_fields=('forum_read_status',))
+        from inyoka.forum.unread import invalidate_index
+        invalidate_index(user)
 
@@ -7,12 +7,20 @@
     :copyright: (c) 2011-2025 by the Inyoka Team, see AUTHORS for more details.
     :license: BSD, see LICENSE for more details.
 """
+from functools import partial
+
+from django.contrib.contenttypes.models import ContentType
 from django.core.cache import cache
+from django.db import transaction
 from django.db.models import Max
-from django.db.models.signals import post_delete, post_save, pre_save
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
 from django.dispatch import receiver
+from guardian.models import GroupObjectPermission, UserObjectPermission
 
+from inyoka.forum.acl import invalidate_privileges, invalidate_user_privileges
 from inyoka.forum.models import Forum, Post, Topic
+from inyoka.forum.tasks import add_unread_topic
+from inyoka.portal.user import User
 from inyoka.utils.database import find_next_increment
 from inyoka.utils.text import slugify
 
@@ -39,12 +47,14 @@ def post_save_forum(sender, **kwargs):
     cache.delete('forum/forums/{}'.format(kwargs['instance'].slug))
     if kwargs.get('created', False):
         cache.delete('forum/slugs')
+    Forum.objects.invalidate_tree(kwargs['instance'])
 
 
 @receiver(post_delete, sender=Forum)
 def post_delete_forum(sender, **kwargs):
     cache.delete('forum/forums/{}'.format(kwargs['instance'].slug))
     cache.delete('forum/slugs')
+    Forum.objects.invalidate_tree()
 
 
 @receiver(post_save, sender=Topic)
@@ -98,10 +108,36 @@ def post_save_post(sender, instance, created, raw, **kwargs):
 
         # Update last_post of the forum and its parents
         parent_forums = [instance.topic.forum] + instance.topic.forum.parents
-        (Forum.objects.filter(id__in=[forum.id for forum in parent_forums])
-              .update(last_post=instance))
+        Forum.objects.push_last_post(parent_forums, instance)
+        transaction.on_commit(partial(add_unread_topic.delay, instance.topic.id,
+                                      instance.topic.forum_id, instance.id,
+                                      instance.author_id))
 
         # Invalidate Cache
         instance.topic.forum.invalidate_topic_cache()
         cache_keys = [f'forum/forums/{forum.slug}' for forum in parent_forums]
         cache.delete_many(cache_keys)
+
+
+@receiver(post_save, sender=GroupObjectPermission)
+@receiver(post_delete, sender=GroupObjectPermission)
+@receiver(post_save, sender=UserObjectPermission)
+@receiver(post_delete, sender=UserObjectPermission)
+def invalidate_forum_privileges(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    if instance.content_type_id == ContentType.objects.get_for_model(Forum).id:
+        invalidate_privileges()
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_forum_privileges_of_members(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        invalidate_user_privileges([instance.pk])
+    elif pk_set:
+        invalidate_user_privileges(pk_set)
+    else:
+        # all members of a group were removed
+        invalidate_privileges()
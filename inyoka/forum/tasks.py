@@ -0,0 +1,29 @@
+"""
+    inyoka.forum.tasks
+    ~~~~~~~~~~~~~~~~~~
+
+    Forum related tasks that are executed by celery.
+
+    :copyright: (c) 2007-2025 by the Inyoka Team, see AUTHORS for more details.
+    :license: BSD, see LICENSE for more details.
+"""
+from celery import shared_task
+
+
+@shared_task
+def flush_topic_views():
+    """
+    Write the views of topics that are buffered in redis to the database.
+    """
+    from inyoka.forum.models import Topic
+    Topic.objects.flush_views()
+
+
+@shared_task
+def add_unread_topic(topic_id, forum_id, last_post_id, author_id=None):
+    """
+    Add a topic with a new post to the unread indexes of all users that
+    may see it.
+    """
+    from inyoka.forum import unread
+    unread.add_topic(topic_id, forum_id, last_post_id, author_id)
@@ -0,0 +1,170 @@
+"""
+    inyoka.forum.unread
+    ~~~~~~~~~~~~~~~~~~~
+
+    Index of the unread topics of a user.
+
+    Listing the new posts of a user had to exclude every read topic of the
+    read status in the database query, which gets slow for users that read
+    a lot.  Instead, the unread topics of every user that recently looked at
+    the list are kept in a redis sorted set, scored by the ids of their last
+    posts.  New posts add their topic to all of these indexes in a task and
+    reading a topic removes it from the index of the user.
+
+    An index contains the member :data:`SENTINEL`, so an index that was
+    created by a new post after the complete index expired is recognized and
+    built again.
+
+    :copyright: (c) 2007-2025 by the Inyoka Team, see AUTHORS for more details.
+    :license: BSD, see LICENSE for more details.
+"""
+from time import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from inyoka.forum import acl
+from inyoka.forum.models import Forum, Topic
+from inyoka.portal.user import User
+
+#: Member of every complete index, its score is lower than every post id.
+SENTINEL = 'complete'
+
+#: Sorted set of the ids of the users with an index, scored by the time
+#: their index expires.
+USERS_KEY = 'forum/unread/users'
+
+
+def _get_key(user_id):
+    return cache.make_key(f'forum/unread/{user_id}')
+
+
+def build_index(user):
+    """Build the index of the unread topics of `user` from the read status."""
+    read_status = user._readstatus
+    invisible = {forum.id for forum in Forum.objects.get_forums_filtered(user, reverse=True)}
+
+    # Topics older than the lowest watermark of the visible forums are read
+    watermarks = [read_status.data.get(forum_id, (None, ()))[0] or 0
+                  for forum_id in Forum.objects.get_ids() if forum_id not in invisible]
+    topics = Topic.objects.exclude(first_post_id__isnull=True) \
+                          .filter(last_post__gt=min(watermarks, default=0)) \
+                          .order_by('-last_post') \
+                          .values_list('id', 'forum_id', 'last_post_id')
+    if invisible:
+        topics = topics.exclude(forum__id__in=invisible)
+
+    unread = {SENTINEL: -1}
+    for topic_id, forum_id, last_post_id in topics.iterator():
+        if read_status.is_post_read(forum_id, last_post_id):
+            continue
+        unread[topic_id] = last_post_id
+        if len(unread) > settings.FORUM_UNREAD_INDEX_SIZE:
+            break
+
+    key = _get_key(user.id)
+    timeout = settings.FORUM_UNREAD_INDEX_TIMEOUT
+    pipe = cache.client.get_client().pipeline()
+    pipe.delete(key)
+    pipe.zadd(key, unread)
+    pipe.expire(key, timeout)
+    pipe.zadd(cache.make_key(USERS_KEY), {user.id: int(time()) + timeout})
+    pipe.execute()
+
+
+def add_topic(topic_id, forum_id, last_post_id, author_id=None):
+    """
+    Add the topic with the id `topic_id` and its last post to the indexes of
+    all users that are allowed to see it, except for the author of the post.
+
+    Privileges that are not cached anymore are computed, so this runs in
+    the task :func:`inyoka.forum.tasks.add_unread_topic`.
+    """
+    redis = cache.client.get_client()
+    users_key = cache.make_key(USERS_KEY)
+    pipe = redis.pipeline()
+    pipe.zremrangebyscore(users_key, '-inf', time())
+    pipe.zrange(users_key, 0, -1, withscores=True)
+    __, users = pipe.execute()
+    if not users:
+        return
+
+    users = {int(user_id): int(expires) for user_id, expires in users}
+    privileges = acl.get_cached_privileges(users)
+    missing = set(users) - set(privileges)
+    if missing:
+        for user in User.objects.filter(id__in=missing):
+            privileges[user.id] = acl.get_privileges(user)
+    view_bit = acl.PRIVILEGE_BITS['forum.view_forum']
+
+    pipe = redis.pipeline(transaction=False)
+    for user_id, expires in users.items():
+        if user_id == author_id:
+            continue
+        if not privileges.get(user_id, {}).get(forum_id, 0) & view_bit:
+            continue
+        key = _get_key(user_id)
+        pipe.zadd(key, {topic_id: last_post_id})
+        pipe.zremrangebyrank(key, 1, -(settings.FORUM_UNREAD_INDEX_SIZE + 1))
+        # don't keep an index longer than it is updated
+        pipe.expireat(key, expires)
+    pipe.execute()
+
+
+def remove_topic(user, topic):
+    """Remove `topic` from the index of `user`, as the user read it."""
+    cache.client.get_client().zrem(_get_key(user.id), topic.id)
+
+
+def remove_read_topics(user, topics):
+    """
+    Return the topics of `topics` that are unread and remove the others from
+    the index of `user`.  Topics also become read without `remove_topic`,
+    e.g. if the read status of their forum drops old entries.
+    """
+    read_status = user._readstatus
+    unread, read = [], []
+    for topic in topics:
+        if read_status.is_post_read(topic.forum_id, topic.last_post_id):
+            read.append(topic.id)
+        else:
+            unread.append(topic)
+    if read:
+        cache.client.get_client().zrem(_get_key(user.id), *read)
+    return unread
+
+
+def invalidate_index(user):
+    """Drop the index of `user`, e.g. because whole forums were read."""
+    cache.client.get_client().delete(_get_key(user.id))
+
+
+class UnreadTopics:
+    """
+    The ids of the unread topics of a user, newest first.
+
+    It supports slicing and `count`, so it can be passed to
+    :class:`~inyoka.utils.pagination.Pagination`.
+    """
+
+    def __init__(self, user):
+        self.key = _get_key(user.id)
+        redis = cache.client.get_client()
+        if redis.zscore(self.key, SENTINEL) is None:
+            build_index(user)
+            return
+
+        timeout = settings.FORUM_UNREAD_INDEX_TIMEOUT
+        pipe = redis.pipeline()
+        pipe.expire(self.key, timeout)
+        pipe.zadd(cache.make_key(USERS_KEY), {user.id: int(time()) + timeout})
+        pipe.execute()
+
+    def count(self):
+        return cache.client.get_client().zcard(self.key) - 1
+
+    def __getitem__(self, index):
+        start = index.start or 0
+        stop = -1 if index.stop is None else index.stop - 1
+        topic_ids = cache.client.get_client().zrevrange(self.key, start, stop)
+        return [int(topic_id) for topic_id in topic_ids if topic_id != SENTINEL.encode()]
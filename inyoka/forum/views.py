@@ -48,6 +48,7 @@ from inyoka.forum.models import (
     Post,
     PostRevision,
     Topic,
+    get_read_status_map,
     mark_all_forums_read,
 )
 from inyoka.forum.notifications import (
@@ -58,12 +59,13 @@ from inyoka.forum.notifications import (
     send_newtopic_notifications,
     send_notification_for_topics,
 )
+from inyoka.forum.unread import UnreadTopics, remove_read_topics
 from inyoka.markup.base import RenderContext, parse
 from inyoka.markup.parsertools import flatten_iterator
 from inyoka.portal.models import Subscription
 from inyoka.portal.user import User
 from inyoka.portal.utils import abort_access_denied
-from inyoka.utils.database import get_simplified_queryset
+from inyoka.utils.database import get_simplified_queryset, prefetch_rendered
 from inyoka.utils.dates import _localtime, format_datetime
 from inyoka.utils.feeds import InyokaAtomFeed
 from inyoka.utils.flash_confirmation import confirm_action
@@ -129,6 +131,7 @@ def index(request, category=None):
         'forum_hierarchy': forum_hierarchy,
         'forum': category,
         'last_posts': last_post_map,
+        'read_status': get_read_status_map(request.user, forums),
     }
 
 
@@ -167,6 +170,11 @@ def forum(request, slug, page=1):
 
     for topic in topics:
         topic.forum = forum
+    Topic.objects.add_pending_views(topics)
+
+    listed = [child for subforum in subforums for child in subforum.children]
+    listed.extend(subforums)
+    listed.extend(topics)
 
     context = {
         'forum': forum,
@@ -178,6 +186,7 @@ def forum(request, slug, page=1):
         'supporters': forum.get_supporters(),
         'topics': topics,
         'pagination': pagination,
+        'read_status': get_read_status_map(request.user, listed),
     }
     return context
 
@@ -255,6 +264,11 @@ def viewtopic(request, topic_slug, page=1):
     for p in posts:
         p.topic = topic
 
+    # fetch the rendered posts and signatures in one go
+    prefetch_rendered([p for p in posts if not p.is_plaintext], 'text')
+    if not request.user.settings.get('hide_signatures'):
+        prefetch_rendered([p.author for p in posts if p.author.signature], 'signature')
+
     # clear read status and subscriptions
     if request.user.is_authenticated:
         topic.mark_read(request.user)
@@ -1613,6 +1627,7 @@ def topiclist(request, page=1, action='newposts', hours=24, user=None, forum=Non
         return HttpResponseRedirect(href('forum'))
 
     topics = Topic.objects.exclude(first_post_id__isnull=True).order_by('-last_post')
+    unread_topics = None
 
     if 'version' in request.GET:
         topics = topics.filter(ubuntu_version=request.GET['version'])
@@ -1651,6 +1666,10 @@ def topiclist(request, page=1, action='newposts', hours=24, user=None, forum=Non
         else:
             title = _('Involved topics')
             url = href('forum', 'egosearch', forum)
+    elif action == 'newposts' and not forum and 'version' not in request.GET:
+        unread_topics = UnreadTopics(request.user)
+        url = href('forum', 'newposts', forum)
+        title = _('New posts')
     elif action == 'newposts':
         forum_ids = tuple(forum.id for forum in Forum.objects.get_cached())
         # get read status data
@@ -1673,10 +1692,16 @@ def topiclist(request, page=1, action='newposts', hours=24, user=None, forum=Non
         if forum_obj and forum_obj.id not in invisible:
             topics = topics.filter(forum=forum_obj)
 
-    total_topics = get_simplified_queryset(topics).count()
-    topics = topics.values_list('id', flat=True)
-    pagination = Pagination(request, topics, page, TOPICS_PER_PAGE, url,
-                            total=total_topics, max_pages=MAX_PAGES_TOPICLIST)
+    if unread_topics is not None:
+        # `unread_topics` may contain topics of forums that became invisible
+        pagination = Pagination(request, unread_topics, page, TOPICS_PER_PAGE, url,
+                                total=unread_topics.count(), max_pages=MAX_PAGES_TOPICLIST)
+    else:
+        total_topics = get_simplified_queryset(topics).count()
+        topics = topics.values_list('id', flat=True)
+        pagination = Pagination(request, topics, page, TOPICS_PER_PAGE, url,
+                                total=total_topics, max_pages=MAX_PAGES_TOPICLIST,
+                                keyset=('-last_post',))
     topic_ids = [tid for tid in pagination.get_queryset()]
 
     # check for moderation permissions
@@ -1691,13 +1716,19 @@ def topiclist(request, page=1, action='newposts', hours=24, user=None, forum=Non
     if topic_ids:
         related = ('forum', 'author', 'last_post', 'last_post__author',
                    'first_post')
-        topics = Topic.objects.filter(id__in=topic_ids).select_related(*related) \
-                              .order_by('-last_post__id')
+        topics = Topic.objects.filter(id__in=topic_ids).select_related(*related)
+        if invisible:
+            topics = topics.exclude(forum__id__in=invisible)
+        topics = list(topics.order_by('-last_post__id'))
+        if unread_topics is not None:
+            topics = remove_read_topics(request.user, topics)
+        Topic.objects.add_pending_views(topics)
     else:
         topics = []
 
     return {
         'topics': topics,
+        'read_status': get_read_status_map(request.user, topics),
         'pagination': pagination,
         'title': title,
         'can_moderate': can_moderate,
@@ -1737,10 +1768,10 @@ def postlist(request, page=1, user=None, topic_slug=None, forum_slug=None):
     posts = posts.values_list('id', flat=True)
 
     pagination = Pagination(request, posts, page, TOPICS_PER_PAGE, pagination_url,
-        total=total_posts, max_pages=MAX_PAGES_TOPICLIST)
+        total=total_posts, max_pages=MAX_PAGES_TOPICLIST, keyset=('-pub_date', '-id'))
     post_ids = [post_id for post_id in pagination.get_queryset()]
 
-    posts = Post.objects.filter(id__in=post_ids).order_by('-pub_date').select_related('topic', 'topic__forum', 'author')
+    posts = list(Post.objects.filter(id__in=post_ids).order_by('-pub_date').select_related('topic', 'topic__forum', 'author'))
 
     # check for moderation permissions
     moderatable_forums = [
@@ -1765,6 +1796,7 @@ def postlist(request, page=1, user=None, topic_slug=None, forum_slug=None):
 
     return {
         'posts': posts,
+        'read_status': get_read_status_map(request.user, [post.topic for post in posts]),
         'pagination': pagination,
         'title': title,
         'can_moderate': can_moderate,
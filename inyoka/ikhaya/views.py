@@ -53,6 +53,7 @@ from inyoka.portal.models import (
     Subscription,
 )
 from inyoka.utils import ctype, generic
+from inyoka.utils.database import prefetch_rendered
 from inyoka.utils.dates import _localtime
 from inyoka.utils.feeds import InyokaAtomFeed
 from inyoka.utils.flash_confirmation import confirm_action
@@ -186,6 +187,12 @@ def index(request, year=None, month=None, category_slug=None, page=1,
     if not full:
         articles = articles.defer('text')
 
+    articles = list(articles)
+    markup_articles = [article for article in articles if not article.is_xhtml]
+    prefetch_rendered(markup_articles, 'intro')
+    if full:
+        prefetch_rendered(markup_articles, 'text')
+
     return {
         'articles': articles,
         'pagination': pagination,
@@ -238,9 +245,12 @@ def detail(request, year, month, day, slug):
     else:
         form = EditCommentForm()
 
+    comments = list(article.comment_set.select_related('author'))
+    prefetch_rendered(comments, 'text')
+
     return {
         'article': article,
-        'comments': article.comment_set.select_related('author'),
+        'comments': comments,
         'form': form,
         'preview': preview,
         'can_post_comment': request.user.is_authenticated,
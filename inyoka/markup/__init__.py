@@ -69,9 +69,10 @@
     are called during rendering, not during compiling.  This gives us the
     possibility to cache things in the cached stream.
 
-    The code format is either a static string with a header prefix or a
-    pickled list with references to dynamic elements.  It may and will most
-    likely contain binary data, thus it should not be saved in the database.
+    The code format is either a static string with a header prefix or
+    bytes holding a pickled list with references to dynamic elements, thus
+    it should not be saved in the database.  `inyoka.markup.cache` keeps
+    compiled instructions in the cache, keyed by a hash of the source.
 
 
     Syntax
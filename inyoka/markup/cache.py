@@ -0,0 +1,223 @@
+"""
+    inyoka.markup.cache
+    ~~~~~~~~~~~~~~~~~~~
+
+    Cache for compiled instruction sets.
+
+    Parsing is by far the most expensive part of rendering markup.  Identical
+    texts (quotes, signatures, template heavy wiki pages …) are therefore
+    compiled only once and the compiled instructions are shared between all
+    processes via the cache.  Dynamic instructions like runtime macros are
+    still rendered for every request, see :class:`~inyoka.markup.machine.Renderer`.
+
+    The cache key is a hash of the markup source together with
+    :data:`PARSER_VERSION` and the parser options, so changed texts never
+    need to be invalidated.  Additionally every process keeps the most
+    recently used instruction sets in memory, limited by
+    ``MARKUP_INSTRUCTION_CACHE_SIZE`` bytes.
+
+    The links and metadata of a text (see :func:`find_meta`) are collected
+    from the same parse and cached next to the instructions.
+
+    :copyright: (c) 2007-2025 by the Inyoka Team, see AUTHORS for more details.
+    :license: BSD, see LICENSE for more details.
+"""
+from collections import OrderedDict
+from hashlib import sha256
+from pickle import PicklingError
+from threading import Lock
+from time import monotonic
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import get_language
+
+from inyoka.markup import nodes
+from inyoka.markup.base import parse
+from inyoka.markup.machine import Renderer
+from inyoka.utils.logger import logger
+
+#: Increase this whenever the parser, the transformers or the nodes produce
+#: different instructions, so that old instruction sets are not used anymore.
+PARSER_VERSION = 1
+
+
+def find_meta(tree):
+    """
+    Return all sort of metadata that is available in the parsed `tree`.  This
+    includes links, commented metadata and the simplified text.
+    """
+    links = []
+    metadata = []
+
+    def walk(node):
+        for child in node.children:
+            if child.is_container:
+                walk(child)
+            if child.__class__ is nodes.InternalLink:
+                # the leading slash enforces an absolute link.
+                links.append('/' + child.page)
+            elif child.__class__ is nodes.MetaData:
+                for value in child.values:
+                    metadata.append((child.key, value))
+    walk(tree)
+
+    return {
+        'links': links,
+        'metadata': metadata,
+        'text': tree.text
+    }
+
+
+class InstructionCache:
+    """
+    Two level cache for compiled instruction sets.
+
+    The first level is a per process LRU that is limited by the total size of
+    the stored instruction sets and by their age.  The second level is the
+    cache shared by all processes.
+    """
+
+    def __init__(self):
+        self._local = OrderedDict()
+        self._local_size = 0
+        self._lock = Lock()
+        self.reset_stats()
+
+    def make_key(self, text, format='html', wiki_force_existing=False, kind='instructions'):
+        """Return the cache key for the instructions (or the `kind`) of `text`."""
+        digest = sha256(text.encode('utf-8')).hexdigest()
+        return 'markup/{kind}/{version}/{format}/{language}/{existing}/{digest}'.format(
+            kind=kind,
+            version=PARSER_VERSION,
+            format=format,
+            language=get_language() or settings.LANGUAGE_CODE,
+            existing=int(bool(wiki_force_existing)),
+            digest=digest,
+        )
+
+    def get_or_compile(self, text, format='html', wiki_force_existing=False):
+        """
+        Return the compiled instructions for `text`.
+
+        If the instructions can not be compiled because a dynamic node can't
+        be pickled, the parsed node is returned instead.  Both can be passed
+        to :class:`~inyoka.markup.machine.Renderer`.
+        """
+        key = self.make_key(text, format, wiki_force_existing)
+
+        code = self._get_local(key)
+        if code is not None:
+            self.stats['local_hits'] += 1
+            return code
+
+        code = cache.get(key)
+        if code is not None:
+            self.stats['shared_hits'] += 1
+            self._set_local(key, code)
+            return code
+
+        self.stats['misses'] += 1
+        return self._compile(text, format, wiki_force_existing)[0]
+
+    def get_meta(self, text, format='html', wiki_force_existing=False):
+        """
+        Return the metadata of `text` as returned by :func:`find_meta`.
+
+        On a cache miss the text is compiled as well, so that rendering it
+        afterwards does not parse it again.
+        """
+        meta = cache.get(self.make_key(text, kind='meta'))
+        if meta is None:
+            self.stats['misses'] += 1
+            meta = self._compile(text, format, wiki_force_existing)[1]
+        return meta
+
+    def invalidate(self, text, format='html', wiki_force_existing=False):
+        """
+        Drop the instructions and the metadata of `text`, for example because
+        they contain a link to a wiki page that was created in the meantime.
+        """
+        key = self.make_key(text, format, wiki_force_existing)
+        cache.delete_many([key, self.make_key(text, kind='meta')])
+        with self._lock:
+            self._pop_local(key)
+
+    def _compile(self, text, format, wiki_force_existing):
+        """
+        Parse `text` once and cache both the compiled instructions and the
+        metadata.  Return a ``(code, meta)`` tuple, where `code` is the
+        parsed node if it can not be compiled.
+        """
+        timeout = settings.MARKUP_INSTRUCTION_CACHE_TIMEOUT
+        node = parse(text, wiki_force_existing=wiki_force_existing)
+        meta = find_meta(node)
+        cache.set(self.make_key(text, kind='meta'), meta, timeout)
+        try:
+            code = node.compile(format)
+        except PicklingError as exc:
+            # a dynamic instruction set with an object that can't be pickled
+            logger.warning('Markup instructions are not cached: %s', exc)
+            return node, meta
+        key = self.make_key(text, format, wiki_force_existing)
+        cache.set(key, code, timeout)
+        self._set_local(key, code)
+        return code, meta
+
+    def clear_local(self):
+        """Empty the in-process cache."""
+        with self._lock:
+            self._local.clear()
+            self._local_size = 0
+
+    def reset_stats(self):
+        self.stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0,
+                      'evictions': 0}
+
+    @property
+    def hit_rate(self):
+        """Ratio of lookups that did not need to parse the markup."""
+        hits = self.stats['local_hits'] + self.stats['shared_hits']
+        total = hits + self.stats['misses']
+        return hits / total if total else 0.0
+
+    def _get_local(self, key):
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return None
+            stored_at, code = entry
+            if monotonic() - stored_at >= settings.MARKUP_INSTRUCTION_CACHE_LOCAL_TIMEOUT:
+                self._pop_local(key)
+                return None
+            self._local.move_to_end(key)
+            return code
+
+    def _set_local(self, key, code):
+        max_size = settings.MARKUP_INSTRUCTION_CACHE_SIZE
+        if len(code) > max_size // 16:
+            # A few huge pages should not push everything else out
+            return
+        with self._lock:
+            self._pop_local(key)
+            self._local[key] = (monotonic(), code)
+            self._local_size += len(code)
+            while self._local_size > max_size:
+                __, (__, evicted) = self._local.popitem(last=False)
+                self._local_size -= len(evicted)
+                self.stats['evictions'] += 1
+
+    def _pop_local(self, key):
+        entry = self._local.pop(key, None)
+        if entry is not None:
+            self._local_size -= len(entry[1])
+
+
+#: The instruction cache of this process
+instruction_cache = InstructionCache()
+
+
+def render_cached(text, context, format='html', wiki_force_existing=False):
+    """Render `text` using the cached instructions."""
+    code = instruction_cache.get_or_compile(text, format, wiki_force_existing)
+    return Renderer(code).render(context, format)
@@ -11,6 +11,7 @@
 """
 import re
 
+from django.conf import settings
 from django.utils.encoding import smart_str
 
 from inyoka.markup.parsertools import TokenStream
@@ -69,10 +70,12 @@ class rule:
     """
     This represents a parsing rule.
     """
-    __slots__ = ('match', 'token', 'enter', 'silententer', 'switch', 'leave')
+    __slots__ = ('regexp', 'match', 'token', 'enter', 'silententer', 'switch',
+                 'leave')
 
     def __init__(self, regexp, token=None, enter=None, silententer=None,
                  switch=None, leave=0):
+        self.regexp = regexp
         self.match = re.compile(regexp, re.U).match
         self.token = token
         self.enter = enter
@@ -361,6 +364,12 @@ _block_start_re = re.compile(r'(?<!\\)\{\{\{')
 _block_end_re = re.compile(r'(?<!\\)\}\}\}')
 
 
+_inline_flags_re = re.compile(r'\(\?([a-z]+)\)')
+
+#: combined regular expressions of the states, see `combine_rules`
+_combined_rules = {}
+
+
 def iter_rules(x):
     for rule in rules[x]:
         if rule.__class__ is include:
@@ -369,11 +378,33 @@ def iter_rules(x):
             yield rule
 
 
-def tokenize_block(string, _escape_hint=None):
+def combine_rules(state):
+    """
+    Return one regular expression that matches all rules of `state`.  The
+    alternative of the n-th rule is the group named ``rn``.  As alternatives
+    are tried in order, the first rule that matches at a position wins, just
+    like if the rules are tried one after another.
+    """
+    combined = _combined_rules.get(state)
+    if combined is None:
+        alternatives = []
+        for index, rule in enumerate(iter_rules(state)):
+            regexp = rule.regexp
+            # global inline flags are only allowed at the start of a pattern
+            m = _inline_flags_re.match(regexp)
+            if m is not None:
+                regexp = '(?%s:%s)' % (m.group(1), regexp[m.end():])
+            alternatives.append('(?P<r%d>%s)' % (index, regexp))
+        combined = _combined_rules[state] = re.compile('|'.join(alternatives), re.U)
+    return combined
+
+
+def tokenize_block(string, _escape_hint=None, engine=None):
     """
     This tokenizes a block.  It's used by the normal tokenize function to
     lex quotes and normal markup isolated, so that breakage in one block
-    does not affect outer areas.
+    does not affect outer areas.  `engine` defaults to the ``MARKUP_LEXER``
+    setting.
     """
     escaped = False
     pos = 0
@@ -385,11 +416,40 @@ def tokenize_block(string, _escape_hint=None):
     push = stack.append
     flatten = ''.join
 
+    # With the combined lexer one search per state finds the next position
+    # where a rule matches, the text up to there is taken over at once.
+    if engine is None:
+        engine = settings.MARKUP_LEXER
+    combined = _escape_hint is None and engine == 'combined'
+    next_match = next_state = None
+    next_pos = end
+
     while pos < end:
         state = stack[-1][1]
         if state not in rule_cache:
             rule_cache[state] = list(iter_rules(state))
-        for rule in rule_cache[state]:
+        candidates = rule_cache[state]
+        if combined and not escaped:
+            if next_state is not state or next_pos < pos:
+                next_match = combine_rules(state).search(string, pos)
+                next_state = state
+                next_pos = end if next_match is None else next_match.start()
+            stop = next_pos
+            if stop > pos:
+                backslash = string.find('\\', pos, stop)
+                if backslash != -1:
+                    stop = backslash
+            if stop > pos:
+                add_text(string[pos:stop])
+                pos = stop
+                continue
+            if next_pos == pos:
+                candidates = (candidates[int(next_match.lastgroup[1:])],)
+                next_state = None
+            else:
+                # a backslash that does not start a rule
+                candidates = ()
+        for rule in candidates:
             m = rule.match(string, pos)
             if m is not None:
                 # if the token is escaped we push the lexed
@@ -490,6 +550,10 @@ def escape(text):
 
 class Lexer:
 
+    def __init__(self, engine=None):
+        #: ``'sequential'`` or ``'combined'``, the ``MARKUP_LEXER`` setting by default
+        self.engine = engine
+
     def tokenize(self, string):
         """
         Resolve quotes and parse quote for quote in an isolated environment.
@@ -499,7 +563,8 @@ class Lexer:
         open_blocks = [False]
 
         def tokenize_buffer():
-            yield from tokenize_block('\n'.join(smart_str(obj) for obj in buffer))
+            yield from tokenize_block('\n'.join(smart_str(obj) for obj in buffer),
+                                      engine=self.engine)
             del buffer[:]
 
         def changes_block_state(line, reverse):
@@ -44,7 +44,7 @@ class NodeCompiler:
 
         if not is_dynamic:
             return '!%s\0%s' % (format, ''.join(result))
-        return '@' + dumps((format, result), HIGHEST_PROTOCOL)
+        return b'@' + dumps((format, result), HIGHEST_PROTOCOL)
 
 
 class NodeRenderer:
@@ -175,8 +175,9 @@ class Renderer:
                 pos = obj.index('\0')
                 self.format = obj[1:pos]
                 self.instructions = [obj[pos + 1:]]
-            elif obj[0] == '@':
-                self.format, self.instructions = loads(obj[1:])
+        elif isinstance(obj, bytes):
+            self.node = None
+            self.format, self.instructions = loads(obj[1:])
         else:
             self.instructions = None
             self.node = obj
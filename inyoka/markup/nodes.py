@@ -381,6 +381,17 @@ class Document(Container):
     is_document = True
     allowed_in_signatures = True
 
+    def prepare_html(self):
+        # look up the targets of all internal links at once
+        links = [link for link in self.query.by_type(InternalLink) if not link.existing]
+        if links:
+            from inyoka.wiki.models import Page
+
+            existing = Page.objects.exists_many({link.page for link in links})
+            for link in links:
+                link.existing = link.page in existing
+        yield from Container.prepare_html(self)
+
 
 class Raw(Container):
     """
@@ -27,12 +27,15 @@ r"""
 import operator
 import random
 import re
+from collections import OrderedDict
 from functools import partial, total_ordering
+from threading import Lock
 
+from django.conf import settings
 from django.utils.encoding import smart_str
 from django.utils.translation import gettext as _
 
-from inyoka.markup.base import escape, unescape_string
+from inyoka.markup.base import escape, parse, unescape_string
 from inyoka.markup.parsertools import TokenStream
 from inyoka.markup.utils import (
     debug_repr,
@@ -43,12 +46,40 @@ from inyoka.markup.utils import (
 )
 from inyoka.wiki.exceptions import CaseSensitiveException
 
+#: Parsed templates of this process, see `get_compiled_template`
+_compiled_templates = OrderedDict()
+_compiled_templates_lock = Lock()
+
 
 def process(source, context=()):
     """Parse and evaluate a template."""
     return Parser(source).parse().to_markup(Context(context))
 
 
+def get_compiled_template(key, source):
+    """
+    Return the parsed template of `source`.  `key` has to identify the source
+    uniquely, for example the name and the revision of a wiki page.
+
+    The parsed templates are kept per process, up to
+    ``WIKI_TEMPLATE_CACHE_SIZE`` of them.  The nodes don't keep any state
+    while they are evaluated, so a parsed template can be evaluated with
+    any number of contexts.
+    """
+    with _compiled_templates_lock:
+        template = _compiled_templates.get(key)
+        if template is not None:
+            _compiled_templates.move_to_end(key)
+            return template
+
+    template = Parser(source).parse()
+    with _compiled_templates_lock:
+        _compiled_templates[key] = template
+        while len(_compiled_templates) > settings.WIKI_TEMPLATE_CACHE_SIZE:
+            _compiled_templates.popitem(last=False)
+    return template
+
+
 def expand_page_template(template, context, macro_behavior=False):
     """A helper for the template macro and wiki-parser."""
     from inyoka.markup import nodes
@@ -68,7 +99,8 @@ def expand_page_template(template, context, macro_behavior=False):
                                % {'name': template})
     except CaseSensitiveException as e:
         page = e.page
-    doc = page.rev.text.parse(context)
+    compiled = get_compiled_template((page.name, page.rev.id), page.rev.text.value)
+    doc = parse(compiled.to_markup(Context(context)))
     children, is_block_tag = doc.get_fragment_nodes(True)
 
     # children is a reference to a list in a node.  We don't want to
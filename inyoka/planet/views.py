@@ -65,7 +65,8 @@ def index(request, page=1):
     if not request.user.has_perm('planet.hide_entry'):
         entries = entries.filter(hidden=False)
 
-    pagination = Pagination(request, entries, page, 25, href('planet'))
+    pagination = Pagination(request, entries, page, 25, href('planet'),
+                            keyset=('-pub_date', '-id'))
     queryset = pagination.get_queryset()
     return {
         'planet_description_rendered': storage['planet_description_rendered'],
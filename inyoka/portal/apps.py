@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class PortalAppConfig(AppConfig):
     name = 'inyoka.portal'
     verbose_name = 'Portal'
+
+    def ready(self):
+        import inyoka.portal.signals
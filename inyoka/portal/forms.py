@@ -37,6 +37,7 @@ from django.views.decorators.debug import sensitive_variables
 from guardian.shortcuts import assign_perm, get_perms, remove_perm
 from PIL import Image
 
+from inyoka.forum.acl import get_group_privileges
 from inyoka.forum.constants import get_simple_version_choices
 from inyoka.forum.models import Forum
 from inyoka.portal.models import Linkmap, StaticFile, StaticPage
@@ -911,6 +912,8 @@ class GroupForumPermissionForm(forms.Form):
             for perm in delete_permissions:
                 remove_perm(perm, self.instance, forum)
         cache.delete_pattern('/acl/*')
+        # materialize the new privileges of the group
+        get_group_privileges([self.instance.id])
 
 
 class PrivateMessageForm(forms.Form):
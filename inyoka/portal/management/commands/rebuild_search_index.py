@@ -0,0 +1,27 @@
+"""
+    inyoka.portal.management.commands.rebuild_search_index
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Build the search index of forum posts, wiki pages and Ikhaya articles
+    from scratch, see :mod:`inyoka.portal.search`.
+
+    :copyright: (c) 2007-2025 by the Inyoka Team, see AUTHORS for more details.
+    :license: BSD, see LICENSE for more details.
+"""
+from django.core.management.base import BaseCommand
+
+from inyoka.portal.search import KINDS, rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Build the search index from scratch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kinds', nargs='*', choices=list(KINDS),
+            help='Only rebuild the index of these kinds of documents.')
+        parser.add_argument('-b', '--batch-size', type=int, default=500,
+            help='Number of documents written at once.')
+
+    def handle(self, *args, **options):
+        count = rebuild_index(options['kinds'] or None, options['batch_size'])
+        self.stdout.write('Indexed %d documents' % count)
@@ -492,3 +492,36 @@ class Linkmap(models.Model):
 class Storage(models.Model):
     key = models.CharField(max_length=200, db_index=True)
     value = InyokaMarkupField(application='portal')
+
+
+class SearchDocument(models.Model):
+    """
+    A forum post, wiki page or Ikhaya article in the search index, see
+    `inyoka.portal.search`.
+    """
+    kind = models.CharField(max_length=10)
+    object_id = models.PositiveIntegerField()
+    title = models.CharField(max_length=255)
+    url = models.CharField(max_length=255)
+    excerpt = models.TextField()
+    date = models.DateTimeField()
+    #: number of terms of the document
+    length = models.PositiveIntegerField()
+
+    # needed to filter the results by the privileges of the user
+    forum_id = models.PositiveIntegerField(null=True)
+    hidden = models.BooleanField(default=False)
+
+    class Meta:
+        unique_together = ('kind', 'object_id')
+
+
+class SearchPosting(models.Model):
+    """How often a term appears in a `SearchDocument`."""
+    term = models.CharField(max_length=64, db_index=True)
+    document = models.ForeignKey(SearchDocument, related_name='postings',
+                                 on_delete=models.CASCADE)
+    frequency = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ('term', 'document')
@@ -0,0 +1,272 @@
+"""
+    inyoka.portal.search
+    ~~~~~~~~~~~~~~~~~~~~
+
+    Full-text search for forum posts, wiki pages and Ikhaya articles.
+
+    Every searchable object is stored as a :class:`SearchDocument` together
+    with an inverted index (:class:`SearchPosting`) mapping every term of its
+    plain text to its frequency.  A query returns the documents containing
+    all of its terms, ranked with BM25.  To keep queries on common terms
+    fast, only the newest ``SEARCH_MAX_CANDIDATES`` documents containing the
+    rarest term of the query are ranked.
+
+    The index is updated by a celery task whenever an object is saved or
+    deleted, ``manage.py rebuild_search_index`` builds it from scratch.
+
+    :copyright: (c) 2007-2025 by the Inyoka Team, see AUTHORS for more details.
+    :license: BSD, see LICENSE for more details.
+"""
+import re
+from collections import Counter
+from math import log
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Avg, Count, Q
+from django.utils import timezone as dj_timezone
+
+from inyoka.markup.base import parse
+from inyoka.portal.models import SearchDocument, SearchPosting
+from inyoka.utils.html import striptags
+
+TERM_RE = re.compile(r'\w+')
+MIN_TERM_LENGTH = 2
+MAX_TERM_LENGTH = 64
+EXCERPT_LENGTH = 300
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+#: The searchable kinds of documents and their names
+KINDS = {
+    'forum': 'Forum',
+    'wiki': 'Wiki',
+    'ikhaya': 'Ikhaya',
+}
+
+
+def tokenize(text):
+    """Return the lowercased terms of `text`."""
+    return [term for term in TERM_RE.findall(text.lower())
+            if MIN_TERM_LENGTH <= len(term) <= MAX_TERM_LENGTH]
+
+
+def markup_to_text(text):
+    return parse(text).text
+
+
+def _post_documents(ids=None):
+    from inyoka.forum.models import Post
+
+    posts = Post.objects.select_related('topic').order_by('id')
+    if ids is not None:
+        posts = posts.filter(id__in=ids)
+    for post in posts.iterator():
+        yield post.id, {
+            'title': post.topic.title,
+            'url': post.get_absolute_url(),
+            'date': post.pub_date,
+            'text': post.text if post.is_plaintext else markup_to_text(post.text),
+            'forum_id': post.topic.forum_id,
+            'hidden': post.hidden or post.topic.hidden,
+        }
+
+
+def _page_documents(ids=None):
+    from inyoka.wiki.models import Page
+
+    pages = Page.objects.filter(last_rev__deleted=False,
+                                last_rev__attachment__isnull=True) \
+                        .select_related('last_rev__text').order_by('id')
+    if ids is not None:
+        pages = pages.filter(id__in=ids)
+    for page in pages.iterator():
+        yield page.id, {
+            'title': page.name,
+            'url': page.get_absolute_url(),
+            'date': page.last_rev.change_date,
+            'text': markup_to_text(page.last_rev.text.value),
+        }
+
+
+def _article_documents(ids=None):
+    from inyoka.ikhaya.models import Article
+
+    articles = Article.objects.order_by('id')
+    if ids is not None:
+        articles = articles.filter(id__in=ids)
+    for article in articles.iterator():
+        to_text = striptags if article.is_xhtml else markup_to_text
+        yield article.id, {
+            'title': article.subject,
+            'url': article.get_absolute_url(),
+            'date': article.publication_datetime,
+            'text': '%s\n%s' % (to_text(article.intro), to_text(article.text)),
+            'hidden': not article.public,
+        }
+
+
+_sources = {
+    'forum': _post_documents,
+    'wiki': _page_documents,
+    'ikhaya': _article_documents,
+}
+
+
+def _build(kind, object_id, fields):
+    text = fields.pop('text')
+    terms = Counter(tokenize('%s\n%s' % (fields['title'], text)))
+    document = SearchDocument(kind=kind, object_id=object_id,
+                              excerpt=' '.join(text.split())[:EXCERPT_LENGTH],
+                              length=sum(terms.values()), **fields)
+    return document, terms
+
+
+def _postings(document, terms):
+    return [SearchPosting(term=term, document=document, frequency=frequency)
+            for term, frequency in terms.items()]
+
+
+def index_object(kind, object_id):
+    """
+    Update the document of the object of `kind` with the id `object_id`.
+    The document is removed if the object does not exist anymore.
+    """
+    documents = list(_sources[kind](ids=[object_id]))
+    with transaction.atomic():
+        SearchDocument.objects.filter(kind=kind, object_id=object_id).delete()
+        if not documents:
+            return
+        document, terms = _build(kind, *documents[0])
+        document.save()
+        SearchPosting.objects.bulk_create(_postings(document, terms))
+
+
+def update_topic(topic_id):
+    """
+    Update the title and the visibility of the documents of the posts of a
+    topic, e.g. after it was renamed, hidden or moved to another forum.
+    """
+    from inyoka.forum.models import Post, Topic
+
+    try:
+        topic = Topic.objects.get(id=topic_id)
+    except Topic.DoesNotExist:
+        return
+    post_ids = Post.objects.filter(topic_id=topic_id)
+    documents = SearchDocument.objects.filter(kind='forum', object_id__in=post_ids.values('id'))
+    # The topic is saved for every new post, so only touch changed rows
+    with transaction.atomic():
+        documents.exclude(title=topic.title, forum_id=topic.forum_id) \
+                 .update(title=topic.title, forum_id=topic.forum_id)
+        if topic.hidden:
+            documents.filter(hidden=False).update(hidden=True)
+        else:
+            documents.filter(hidden=True) \
+                     .exclude(object_id__in=post_ids.filter(hidden=True).values('id')) \
+                     .update(hidden=False)
+
+
+def rebuild_index(kinds=None, batch_size=500):
+    """
+    Build the index of `kinds` (all by default) from scratch.  Return the
+    number of indexed documents.
+    """
+    count = 0
+    for kind in kinds or _sources:
+        SearchDocument.objects.filter(kind=kind).delete()
+        batch = []
+        for object_id, fields in _sources[kind]():
+            batch.append(_build(kind, object_id, fields))
+            if len(batch) >= batch_size:
+                count += _save_batch(batch)
+                batch = []
+        count += _save_batch(batch)
+    return count
+
+
+def _save_batch(batch):
+    with transaction.atomic():
+        documents = SearchDocument.objects.bulk_create([document for document, __ in batch])
+        SearchPosting.objects.bulk_create(
+            [posting for document, (__, terms) in zip(documents, batch)
+             for posting in _postings(document, terms)])
+    return len(batch)
+
+
+def _get_visible_documents(user, kinds):
+    from inyoka.forum.acl import PRIVILEGE_BITS
+    from inyoka.forum.models import Forum
+
+    documents = SearchDocument.objects.filter(kind__in=kinds)
+    conditions = Q(kind='wiki')
+
+    privileges = user.forum_privileges()
+    moderated = [forum_id for forum_id, bits in privileges.items()
+                 if bits & PRIVILEGE_BITS['forum.moderate_forum']]
+    visible = [forum.id for forum in Forum.objects.get_forums_filtered(user)]
+    conditions |= Q(kind='forum', forum_id__in=visible) & (Q(hidden=False) | Q(forum_id__in=moderated))
+
+    if user.has_perm('ikhaya.view_unpublished_article'):
+        conditions |= Q(kind='ikhaya')
+    else:
+        conditions |= Q(kind='ikhaya', hidden=False, date__lte=dj_timezone.now())
+    return documents.filter(conditions)
+
+
+def search(query, user, kinds=None):
+    """
+    Return the ids of the documents `user` is allowed to see that contain
+    all terms of `query`, best match first.  `kinds` restricts the results
+    to some kinds of documents.
+    """
+    from inyoka.wiki.acl import MultiPrivilegeTest
+
+    terms = list(dict.fromkeys(tokenize(query)))[:settings.SEARCH_MAX_TERMS]
+    if not terms:
+        return []
+
+    frequencies = dict(SearchPosting.objects.filter(term__in=terms)
+                                            .values_list('term')
+                                            .annotate(Count('id'))
+                                            .order_by())
+    if len(frequencies) < len(terms):
+        return []
+
+    rarest = min(terms, key=frequencies.get)
+    candidates = _get_visible_documents(user, kinds or list(KINDS)) \
+        .filter(postings__term=rarest) \
+        .order_by('-date') \
+        .values_list('id', flat=True)[:settings.SEARCH_MAX_CANDIDATES]
+
+    postings = SearchPosting.objects.filter(document__in=list(candidates), term__in=terms) \
+                                    .values_list('document_id', 'term', 'frequency',
+                                                 'document__length', 'document__kind',
+                                                 'document__title')
+    stats = SearchDocument.objects.aggregate(count=Count('id'), average=Avg('length'))
+    total, average_length = stats['count'], stats['average'] or 1
+    idf = {term: log(1 + (total - frequency + 0.5) / (frequency + 0.5))
+           for term, frequency in frequencies.items()}
+
+    scores = {}
+    matched = Counter()
+    wiki_pages = {}
+    for document_id, term, frequency, length, kind, title in postings:
+        norm = K1 * (1 - B + B * length / average_length)
+        scores[document_id] = scores.get(document_id, 0) + \
+            idf[term] * frequency * (K1 + 1) / (frequency + norm)
+        matched[document_id] += 1
+        if kind == 'wiki':
+            wiki_pages[document_id] = title
+
+    if wiki_pages:
+        privileges = MultiPrivilegeTest(user)
+        for document_id, title in wiki_pages.items():
+            if not privileges.has_privilege(title, 'read'):
+                matched[document_id] = 0
+
+    results = [document_id for document_id in scores if matched[document_id] == len(terms)]
+    results.sort(key=lambda document_id: (-scores[document_id], -document_id))
+    return results
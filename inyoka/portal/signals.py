@@ -0,0 +1,57 @@
+"""
+    inyoka.portal.signals
+    ~~~~~~~~~~~~~~~~~~~~~
+
+    Keep the search index up to date.
+
+    :copyright: (c) 2007-2025 by the Inyoka Team, see AUTHORS for more details.
+    :license: BSD, see LICENSE for more details.
+"""
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from inyoka.forum.models import Post, Topic
+from inyoka.ikhaya.models import Article
+from inyoka.portal.tasks import update_search_index
+from inyoka.wiki.models import Page, Revision
+
+
+def queue_search_update(kind, object_id):
+    """Update the search index once the current transaction is committed."""
+    transaction.on_commit(partial(update_search_index.delay, kind, object_id))
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def index_post(sender, instance, **kwargs):
+    if not kwargs.get('raw'):
+        queue_search_update('forum', instance.id)
+
+
+@receiver(post_save, sender=Topic)
+def index_topic(sender, instance, created, update_fields, **kwargs):
+    if created or kwargs['raw']:
+        return
+    if update_fields is None or {'title', 'forum', 'hidden'} & set(update_fields):
+        queue_search_update('topic', instance.id)
+
+
+@receiver(post_save, sender=Revision)
+def index_revision(sender, instance, **kwargs):
+    if not kwargs['raw']:
+        queue_search_update('wiki', instance.page_id)
+
+
+@receiver(post_delete, sender=Page)
+def index_page(sender, instance, **kwargs):
+    queue_search_update('wiki', instance.id)
+
+
+@receiver(post_save, sender=Article)
+@receiver(post_delete, sender=Article)
+def index_article(sender, instance, **kwargs):
+    if not kwargs.get('raw'):
+        queue_search_update('ikhaya', instance.id)
@@ -19,6 +19,7 @@ from django.utils import timezone as dj_timezone
 from inyoka.portal.models import PrivateMessageEntry
 from inyoka.portal.user import User
 from inyoka.utils.logger import logger
+from inyoka.utils.sessions import online_counts
 from inyoka.utils.storage import storage
 
 
@@ -28,7 +29,7 @@ def check_for_user_record():
     Checks whether the current session count is a new record.
     """
     record = int(storage.get('session_record', 0))
-    session_count = len(cache.keys('sessioninfo:*'))
+    session_count = online_counts()['all']
     if session_count > record:
         storage['session_record'] = str(session_count)
         storage['session_record_time'] = int(time())
@@ -89,3 +90,16 @@ def clean_privmsg_folders():
     """Clean private message folders."""
     logger.info("Deleting private messages after end of cache duration")
     PrivateMessageEntry.clean_private_message_folders()
+
+
+@shared_task
+def update_search_index(kind, object_id):
+    """
+    Update the search index for an object, see `inyoka.portal.search`.
+    `kind` ``'topic'`` updates the documents of the posts of a topic.
+    """
+    from inyoka.portal import search
+    if kind == 'topic':
+        search.update_topic(object_id)
+    else:
+        search.index_object(kind, object_id)
@@ -62,6 +62,8 @@ urlpatterns = [
     path('privmsg/<int:entry_id>/', views.privmsg),
     re_path(r'^privmsg/(?P<folder>[a-z]+)/(?P<entry_id>\d+)/$', views.privmsg),
     path('whoisonline/', views.whoisonline),
+    path('search/', views.search),
+    path('search/<int:page>/', views.search),
     path('inyoka/', views.about_inyoka),
     path('register/', views.register),
     re_path(r'^activate/(?P<username>[^/]+)/(?P<activation_key>.*?)/$', views.activate),
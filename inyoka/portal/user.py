@@ -398,6 +398,14 @@ class User(AbstractBaseUser, PermissionsMixin, GuardianUserMixin):
         from inyoka.forum.models import ReadStatus
         return ReadStatus(self.forum_read_status)
 
+    def forum_privileges(self):
+        """
+        Return a dictionary mapping forum ids to the privilege bits of this
+        user, see :mod:`inyoka.forum.acl`.
+        """
+        from inyoka.forum.acl import get_privileges
+        return get_privileges(self)
+
     @property
     def rendered_userpage(self):
         if hasattr(self, 'userpage'):
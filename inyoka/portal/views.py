@@ -46,6 +46,7 @@ from PIL import Image
 
 from inyoka.forum.models import Forum
 from inyoka.ikhaya.models import Article, Category, Event
+from inyoka.portal import search as search_index
 from inyoka.portal.forms import (
     NOTIFICATION_CHOICES,
     ConfigurationForm,
@@ -81,6 +82,7 @@ from inyoka.portal.models import (
     Linkmap,
     PrivateMessage,
     PrivateMessageEntry,
+    SearchDocument,
     StaticFile,
     StaticPage,
     Subscription,
@@ -103,7 +105,12 @@ from inyoka.utils.http import (
 from inyoka.utils.mail import send_mail
 from inyoka.utils.notification import send_notification
 from inyoka.utils.pagination import Pagination
-from inyoka.utils.sessions import get_sessions, get_user_record, make_permanent
+from inyoka.utils.sessions import (
+    get_sessions,
+    get_user_record,
+    make_permanent,
+    online_counts,
+)
 from inyoka.utils.sortable import Sortable
 from inyoka.utils.storage import storage
 from inyoka.utils.templating import flash_message
@@ -198,7 +205,7 @@ def index(request):
     return {
         'welcome_message_rendered': storage['welcome_message_rendered'],
         'ikhaya_latest': list(ikhaya_latest),
-        'sessions': get_sessions(),
+        'sessions': online_counts(),
         'record': record,
         'record_time': record_time,
         'events': cache.get_or_set('portal/calendar', partial(Event.objects.get_upcoming, 4), 300),
@@ -224,6 +231,35 @@ def whoisonline(request):
     }
 
 
+@require_safe
+@templated('portal/search.html')
+def search(request, page=1):
+    """Search forum posts, wiki pages and Ikhaya articles."""
+    query = request.GET.get('query', '').strip()
+    area = request.GET.get('area')
+    if area not in search_index.KINDS:
+        area = None
+
+    document_ids = []
+    if query:
+        document_ids = search_index.search(query, request.user,
+                                           kinds=[area] if area else None)
+    pagination = Pagination(request, document_ids, page, 20,
+                            link=href('portal', 'search'))
+    page_ids = pagination.get_queryset()
+    documents = SearchDocument.objects.in_bulk(page_ids)
+
+    return {
+        'query': query,
+        'area': area,
+        'areas': search_index.KINDS,
+        'documents': [documents[document_id] for document_id in page_ids
+                      if document_id in documents],
+        'total': len(document_ids),
+        'pagination': pagination,
+    }
+
+
 @sensitive_variables("data")
 @sensitive_post_parameters()
 @templated('portal/register.html')
@@ -1327,7 +1363,7 @@ def feedselector(request, app=None):
             forms[fapp] = None
     if forms['forum'] is not None:
         anonymous_user = User.objects.get_anonymous_user()
-        forums = [forum for forum in Forum.objects.get_cached() if anonymous_user.has_perm('forum.view_forum', forum)]
+        forums = Forum.objects.get_forums_filtered(anonymous_user)
         forms['forum'].fields['forum'].choices = [('', _('Please choose'))] + \
             [(f.slug, f.name) for f in forums]
     if forms['ikhaya'] is not None:
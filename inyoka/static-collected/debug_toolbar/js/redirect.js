@@ -0,0 +1 @@
+/tmp/rv/lib/python3.11/site-packages/debug_toolbar/static/debug_toolbar/js/redirect.js
\ No newline at end of file
@@ -0,0 +1 @@
+/root/package/inyoka/static/js/WikiEditor.js
\ No newline at end of file
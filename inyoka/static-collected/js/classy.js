@@ -0,0 +1 @@
+/root/package/inyoka/static/js/classy.js
\ No newline at end of file
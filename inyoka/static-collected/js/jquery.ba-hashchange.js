@@ -0,0 +1 @@
+/root/package/inyoka/static/js/jquery.ba-hashchange.js
\ No newline at end of file
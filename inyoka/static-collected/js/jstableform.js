@@ -0,0 +1 @@
+/root/package/inyoka/static/js/jstableform.js
\ No newline at end of file
@@ -8,15 +8,19 @@
     :license: BSD, see LICENSE for more details.
 """
 import json
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
 from datetime import timezone
 
 from django.core.cache import cache, caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
 from django.core.serializers.json import DjangoJSONEncoder
-from django.db import models
+from django.db import connections, models
 from django.db.models.functions import TruncDate
 from django.db.models.signals import post_save as model_post_save_signal
 
-from inyoka.markup.base import RenderContext, parse
+from inyoka.markup.base import RenderContext
+from inyoka.markup.cache import instruction_cache, render_cached
 from inyoka.utils.forms import JabberFormField
 from inyoka.utils.highlight import highlight_code
 
@@ -170,6 +174,37 @@ class JSONField(models.TextField):
         setattr(cls, self.name, SimpleDescriptor(self))
 
 
+def _run_in_context():
+    """
+    Return a function that calls its argument in a copy of the current
+    context, so that worker threads see the active language and request.
+    """
+    context = copy_context()
+
+    def run(callback):
+        try:
+            return context.copy().run(callback)
+        finally:
+            connections.close_all()
+    return run
+
+
+def prefetch_rendered(instances, field_name, max_workers=None):
+    """
+    Render the markup field `field_name` of all `instances` in one go.
+
+    Example::
+
+        prefetch_rendered(posts, 'text')
+
+    See :meth:`BaseMarkupField.prefetch_rendered`.
+    """
+    instances = list(instances)
+    if instances:
+        field = instances[0]._meta.get_field(field_name)
+        field.prefetch_rendered(instances, max_workers)
+
+
 class BaseMarkupField(models.TextField):
     """
     Base Class for fields that needs to be rendered.
@@ -196,6 +231,52 @@ class BaseMarkupField(models.TextField):
             field=name,
         )
 
+    def remove_compiled_from_cache(self, inst_self, field_name):
+        """
+        Hook to drop intermediate results that are cached independently of
+        the model instance.
+        """
+
+    def prefetch_rendered(self, instances, max_workers=None):
+        """
+        Fetch the rendered content of all `instances` with one round trip
+        to the cache.
+
+        The missing contents are rendered, in `max_workers` threads if
+        given, and written back at once.  The contents are stored on the
+        instances, so that ``instance.<name>_rendered`` does not ask the
+        cache again.
+        """
+        name = self.name
+        attname = f'_{name}_rendered'
+
+        by_key = {}
+        for instance in instances:
+            key = self.get_redis_key(self.model, instance, name)
+            by_key.setdefault(key, []).append(instance)
+        if not by_key:
+            return
+
+        contents = content_cache.get_many(list(by_key))
+
+        missing = [key for key in by_key if key not in contents]
+        if missing:
+            callbacks = [self.get_content_create_callback(by_key[key][0], name)
+                         for key in missing]
+            if max_workers and max_workers > 1 and len(missing) > 1:
+                with ThreadPoolExecutor(max_workers) as executor:
+                    rendered = list(executor.map(_run_in_context(), callbacks))
+            else:
+                rendered = [callback() for callback in callbacks]
+            rendered = dict(zip(missing, rendered))
+            timeout = DEFAULT_TIMEOUT if self.redis_timeout is None else self.redis_timeout
+            content_cache.set_many(rendered, timeout)
+            contents.update(rendered)
+
+        for key, group in by_key.items():
+            for instance in group:
+                instance.__dict__[attname] = contents[key]
+
     def contribute_to_class(self, cls, name):
         super().contribute_to_class(cls, name)
 
@@ -221,6 +302,9 @@ class BaseMarkupField(models.TextField):
             """
             Renders the content of the field.
             """
+            if f'_{name}_rendered' in inst_self.__dict__:
+                return inst_self.__dict__[f'_{name}_rendered']
+
             key = self.get_redis_key(cls, inst_self, name)
 
             create_content = self.get_content_create_callback(inst_self, name)
@@ -235,8 +319,10 @@ class BaseMarkupField(models.TextField):
             return (value is not None, value)
 
         def remove_from_cache(inst_self):
+            inst_self.__dict__.pop(f'_{name}_rendered', None)
             key = self.get_redis_key(cls, inst_self, name)
             content_cache.delete(key)
+            self.remove_compiled_from_cache(inst_self, name)
 
         setattr(cls, f'is_{name}_in_cache', is_in_cache)
         setattr(cls, f'remove_{name}_from_cache', remove_from_cache)
@@ -293,11 +379,14 @@ class InyokaMarkupField(BaseMarkupField):
                     simplified=self.simplify,
                     **context)
 
-            node = parse(text, wiki_force_existing=self.force_existing)
-            return node.render(context, format='html')
+            return render_cached(text, context, 'html', self.force_existing)
 
         return get_field_rendered
 
+    def remove_compiled_from_cache(self, inst_self, field_name):
+        instruction_cache.invalidate(getattr(inst_self, field_name, None) or '',
+                                     'html', self.force_existing)
+
     def get_content_create_callback(self, inst_self, field_name):
         """
         Returns a callable, that renders the content.
@@ -0,0 +1,46 @@
+"""
+    inyoka.utils.delta
+    ~~~~~~~~~~~~~~~~~~
+
+    Line based deltas between two texts.  A delta stores only the lines of
+    the target text that are not in the base text, all other lines are
+    referenced by their position in the base text.  The delta is compressed
+    with zlib.
+
+    :copyright: (c) 2007-2025 by the Inyoka Team, see AUTHORS for more details.
+    :license: BSD, see LICENSE for more details.
+"""
+import json
+import zlib
+from difflib import SequenceMatcher
+
+
+def make_delta(base, text):
+    """
+    Return a delta that turns `base` into `text`, as bytes.
+
+    The delta is a list of operations: A list ``[start, end]`` copies the
+    lines `start` to `end` of the base text, a string inserts itself.
+    """
+    base_lines = base.splitlines(True)
+    lines = text.splitlines(True)
+    operations = []
+    matcher = SequenceMatcher(None, base_lines, lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            operations.append([i1, i2])
+        elif j1 < j2:
+            operations.append(''.join(lines[j1:j2]))
+    return zlib.compress(json.dumps(operations, separators=(',', ':')).encode('utf-8'))
+
+
+def apply_delta(base, delta):
+    """Return the text that was passed to `make_delta` together with `base`."""
+    base_lines = base.splitlines(True)
+    result = []
+    for operation in json.loads(zlib.decompress(delta).decode('utf-8')):
+        if isinstance(operation, str):
+            result.append(operation)
+        else:
+            result.extend(base_lines[operation[0]:operation[1]])
+    return ''.join(result)
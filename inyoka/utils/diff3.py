@@ -10,9 +10,9 @@
     :copyright: (c) by Florian Festi.
     :license: BSD, see LICENSE for more details.
 """
+import bisect
 import difflib
 import heapq
-import itertools
 import re
 
 from django.utils.html import escape
@@ -45,235 +45,77 @@ def merge(old, other, new, allow_conflicts=True, markers=None):
     return '\n'.join(stream_merge(old, other, new, allow_conflicts, markers))
 
 
+def _as_lines(seq):
+    if isinstance(seq, str):
+        return seq.splitlines()
+    elif not isinstance(seq, list):
+        return list(seq)
+    return seq
+
+
+def _line_mapping(old, other):
+    """
+    Return a list that maps every line of `old` to the index of the matching
+    line in `other` or to ``-1`` if the line was changed.
+    """
+    mapping = [-1] * len(old)
+    for i, j, size in PatienceSequenceMatcher(old, other).get_matching_blocks():
+        mapping[i:i + size] = range(j, j + size)
+    return mapping
+
+
 def stream_merge(old, other, new, allow_conflicts=True, markers=None):
     """
     Merges three strings or lists of lines.  The return values is an iterator.
     Per default conflict markers are added to the source, you can however set
     :param allow_conflicts: to `False` which will get you a `DiffConflict`
     exception on the first encountered conflict.
+
+    Both `other` and `new` are matched against `old` (see
+    `PatienceSequenceMatcher`).  Lines of `old` that are unchanged in both
+    split the texts into chunks.  A chunk is taken from the side that changed
+    it, if both changed it differently it's a conflict.
     """
-    if isinstance(old, str):
-        old = old.splitlines()
-    elif not isinstance(old, list):
-        old = list(old)
-    if isinstance(other, str):
-        other = other.splitlines()
-    elif not isinstance(other, list):
-        other = list(other)
-    if isinstance(new, str):
-        new = new.splitlines()
-    elif not isinstance(new, list):
-        new = list(new)
+    old = _as_lines(old)
+    other = _as_lines(other)
+    new = _as_lines(new)
     left_marker, middle_marker, right_marker = markers or DEFAULT_MARKERS
 
-    old_lineno = other_lineno = new_lineno = 0
-    old_len = len(old)
-    other_len = len(other)
-    new_len = len(new)
-
-    while (old_lineno < old_len and
-            other_lineno < other_len and
-            new_lineno < new_len):
-
-        # unchanged
-        if old[old_lineno] == other[other_lineno] == new[new_lineno]:
-            yield old[old_lineno]
-            old_lineno += 1
-            other_lineno += 1
-            new_lineno += 1
-            continue
+    other_mapping = _line_mapping(old, other)
+    new_mapping = _line_mapping(old, new)
+    # lines of `old` that are unchanged in both texts
+    stable = [index for index in range(len(old))
+              if other_mapping[index] >= 0 and new_mapping[index] >= 0]
+    stable.append(len(old))
+    other_mapping.append(len(other))
+    new_mapping.append(len(new))
 
-        new_match = find_match(old, new, old_lineno, new_lineno)
-        other_match = find_match(old, other, old_lineno, other_lineno)
-
-        # new is changed
-        if new_match != (old_lineno, new_lineno):
-            new_changed_lines = new_match[0] - old_lineno
-
-            # other is unchanged
-            if match(old, other, old_lineno, other_lineno,
-                     new_changed_lines) == new_changed_lines:
-                yield from new[new_lineno:new_match[1]]
-                old_lineno = new_match[0]
-                new_lineno = new_match[1]
-                other_lineno += new_changed_lines
-
-            # both changed, conflict!
-            else:
-                if not allow_conflicts:
-                    raise DiffConflict(old_lineno, other_lineno, new_lineno)
-                old_m, other_m, new_m = tripple_match(old, other, new,
-                                                      other_match, new_match)
-                yield left_marker
-                yield from other[other_lineno:other_m]
-                yield middle_marker
-                yield from new[new_lineno:new_m]
-                yield right_marker
-                old_lineno = old_m
-                other_lineno = other_m
-                new_lineno = new_m
-
-        # other is changed
-        else:
-            other_changed_lines = other_match[0] - other_lineno
-
-            # new is unchanged
-            if match(old, new, old_lineno, new_lineno,
-                     other_changed_lines) == other_changed_lines:
-                yield from other[other_lineno:other_match[1]]
-                old_lineno = other_match[0]
-                other_lineno = other_match[1]
-                new_lineno += other_changed_lines
-
-            # both changed, conflict!
-            else:
-                if not allow_conflicts:
-                    raise DiffConflict(old_lineno, other_lineno, new_lineno)
-
-                old_m, other_m, new_m = tripple_match(old, other, new,
-                                                      other_match, new_match)
-                yield left_marker
-                yield from other[other_lineno:other_m]
-                yield middle_marker
-                yield from new[new_lineno:new_m]
-                yield right_marker
-                old_lineno = old_m
-                other_lineno = other_m
-                new_lineno = new_m
-
-    # all finished
-    if (old_lineno == old_len and
-            other_lineno == other_len and
-            new_lineno == new_len):
-        return
-
-    # new added lines
-    if old_lineno == old_len and other_lineno == other_len:
-        yield from new[new_lineno:]
-
-    # other added lines
-    elif old_lineno == old_len and new_lineno == new_len:
-        yield from other[other_lineno:]
-
-    # conflict
-    elif not (
-        (new_lineno == new_len and
-         (old_len - old_lineno == other_len - other_lineno) and
-         match(old, other, old_lineno, other_lineno, old_len - old_lineno)
-         == old_len - old_lineno) and
-        (other_lineno == other_len and
-         (old_len - old_lineno == new_len - new_lineno) and
-         match(old, new, old_lineno, new_lineno, old_len - old_lineno)
-         == old_len - old_lineno)):
-        if new == other:
-            yield from new[new_lineno:]
+    old_lineno = other_lineno = new_lineno = 0
+    for old_end in stable:
+        other_end = other_mapping[old_end]
+        new_end = new_mapping[old_end]
+
+        old_chunk = old[old_lineno:old_end]
+        other_chunk = other[other_lineno:other_end]
+        new_chunk = new[new_lineno:new_end]
+        if other_chunk == old_chunk or other_chunk == new_chunk:
+            yield from new_chunk
+        elif new_chunk == old_chunk:
+            yield from other_chunk
         else:
             if not allow_conflicts:
                 raise DiffConflict(old_lineno, other_lineno, new_lineno)
             yield left_marker
-            yield from other[other_lineno:]
+            yield from other_chunk
             yield middle_marker
-            yield from new[new_lineno:]
+            yield from new_chunk
             yield right_marker
 
-
-def tripple_match(old, other, new, other_match, new_match):
-    """
-    Find next matching pattern unchanged in both other and new return the
-    position in all three lists.  Unlike `merge` this only operates on
-    lists.
-    """
-    while True:
-        difference = new_match[0] - other_match[0]
-
-        # new changed more lines
-        if difference > 0:
-            match_len = match(old, other, other_match[0], other_match[1],
-                              difference)
-            if match_len == difference:
-                return new_match[0], other_match[1] + difference, new_match[1]
-            other_match = find_match(old, other,
-                                     other_match[0] + match_len,
-                                     other_match[1] + match_len)
-
-        # other changed more lines
-        elif difference < 0:
-            difference = -difference
-            match_len = match(old, new, new_match[0], new_match[1],
-                              difference)
-            if match_len == difference:
-                return (other_match[0], other_match[1],
-                        new_match[0] + difference)
-            new_match = find_match(old, new,
-                                   new_match[0] + match_len,
-                                   new_match[1] + match_len)
-
-        # both conflicts change same number of lines
-        # or no match till the end
-        else:
-            return new_match[0], other_match[1], new_match[1]
-
-
-def match(list1, list2, nr1, nr2, maxcount=3):
-    """
-    Return the number matching items after the given positions maximum
-    maxcount lines are are processed.  Unlike `merge` this only operates
-    on lists.
-    """
-    i = 0
-    len1 = len(list1)
-    len2 = len(list2)
-    while nr1 < len1 and nr2 < len2 and list1[nr1] == list2[nr2]:
-        nr1 += 1
-        nr2 += 1
-        i += 1
-        if i >= maxcount and maxcount > 0:
-            break
-    return i
-
-
-def find_match(list1, list2, nr1, nr2, mincount=3):
-    """
-    searches next matching pattern with lenght mincount
-    if no pattern is found len of the both lists is returned
-    """
-    idx1 = nr1
-    idx2 = nr2
-    len1 = len(list1)
-    len2 = len(list2)
-    hit1 = hit2 = None
-
-    while idx1 < len1 or idx2 < len2:
-        i = nr1
-        while i <= idx1:
-            hit_count = match(list1, list2, i, idx2, mincount)
-            if hit_count >= mincount:
-                hit1 = (i, idx2)
-                break
-            i += 1
-
-        i = nr2
-        while i < idx2:
-            hit_count = match(list1, list2, idx1, i, mincount)
-            if hit_count >= mincount:
-                hit2 = (idx1, i)
-                break
-            i += 1
-
-        if hit1 or hit2:
-            break
-        if idx1 < len1:
-            idx1 += 1
-        if idx2 < len2:
-            idx2 += 1
-
-    if hit1 and hit2:
-        return hit1
-    elif hit1:
-        return hit1
-    elif hit2:
-        return hit2
-    return len1, len2
+        if old_end < len(old):
+            yield old[old_end]
+        old_lineno = old_end + 1
+        other_lineno = other_end + 1
+        new_lineno = new_end + 1
 
 
 def get_close_matches(name, matches, n=10, cutoff=0.6):
@@ -294,6 +136,160 @@ def get_close_matches(name, matches, n=10, cutoff=0.6):
     return heapq.nlargest(n, result)
 
 
+def _longest_increasing(pairs):
+    """
+    Return the longest subsequence of the ``(i, j)`` `pairs` (sorted by `i`)
+    with increasing `j`, found with patience sorting.
+    """
+    tails = []
+    tail_indexes = []
+    previous = [None] * len(pairs)
+    for index, (__, j) in enumerate(pairs):
+        position = bisect.bisect_left(tails, j)
+        if position:
+            previous[index] = tail_indexes[position - 1]
+        if position == len(tails):
+            tails.append(j)
+            tail_indexes.append(index)
+        else:
+            tails[position] = j
+            tail_indexes[position] = index
+
+    result = []
+    index = tail_indexes[-1] if tail_indexes else None
+    while index is not None:
+        result.append(pairs[index])
+        index = previous[index]
+    result.reverse()
+    return result
+
+
+def _unique_lines(seq, lo, hi):
+    """Map the lines that occur exactly once in ``seq[lo:hi]`` to their index."""
+    positions = {}
+    for index in range(lo, hi):
+        line = seq[index]
+        positions[line] = None if line in positions else index
+    return positions
+
+
+def patience_matching_blocks(a, b):
+    """
+    Return the matching blocks of the sequences `a` and `b` like
+    `difflib.SequenceMatcher.get_matching_blocks` does, but use the patience
+    diff algorithm:  Lines that are unique in both sequences are matched
+    first and the ranges in between are diffed recursively.  Only ranges
+    without any unique line are passed to `difflib.SequenceMatcher`.
+
+    Lines are compared by their hash, so `a` and `b` should contain
+    integers for long texts (see `PatienceSequenceMatcher`).
+    """
+    blocks = []
+    ranges = [(0, len(a), 0, len(b))]
+    while ranges:
+        alo, ahi, blo, bhi = ranges.pop()
+
+        # common prefix and suffix
+        size = 0
+        while alo + size < ahi and blo + size < bhi and a[alo + size] == b[blo + size]:
+            size += 1
+        if size:
+            blocks.append((alo, blo, size))
+            alo += size
+            blo += size
+        size = 0
+        while alo < ahi - size and blo < bhi - size and a[ahi - size - 1] == b[bhi - size - 1]:
+            size += 1
+        if size:
+            blocks.append((ahi - size, bhi - size, size))
+            ahi -= size
+            bhi -= size
+        if alo == ahi or blo == bhi:
+            continue
+
+        unique_a = _unique_lines(a, alo, ahi)
+        unique_b = _unique_lines(b, blo, bhi)
+        pairs = sorted((i, unique_b[line]) for line, i in unique_a.items()
+                       if i is not None and unique_b.get(line) is not None)
+        anchors = _longest_increasing(pairs)
+        if not anchors:
+            matcher = difflib.SequenceMatcher(None, a[alo:ahi], b[blo:bhi], autojunk=False)
+            blocks.extend((alo + i, blo + j, size)
+                          for i, j, size in matcher.get_matching_blocks() if size)
+            continue
+
+        for i, j in anchors:
+            ranges.append((alo, i, blo, j))
+            blocks.append((i, j, 1))
+            alo, blo = i + 1, j + 1
+        ranges.append((alo, ahi, blo, bhi))
+
+    # sort and join adjacent blocks
+    result = []
+    for i, j, size in sorted(blocks):
+        if result and result[-1][0] + result[-1][2] == i and result[-1][1] + result[-1][2] == j:
+            result[-1] = (result[-1][0], result[-1][1], result[-1][2] + size)
+        else:
+            result.append((i, j, size))
+    result.append((len(a), len(b), 0))
+    return [difflib.Match(*block) for block in result]
+
+
+class PatienceSequenceMatcher(difflib.SequenceMatcher):
+    """
+    A `difflib.SequenceMatcher` for lists of lines that uses the patience
+    diff algorithm (see `patience_matching_blocks`).  It is much faster for
+    long texts and the results are closer to what a human expects.
+    """
+
+    def __init__(self, a=(), b=()):
+        lines = {}
+        super().__init__(None, [lines.setdefault(line, len(lines)) for line in a],
+                         [lines.setdefault(line, len(lines)) for line in b],
+                         autojunk=False)
+
+    def get_matching_blocks(self):
+        if self.matching_blocks is None:
+            self.matching_blocks = patience_matching_blocks(self.a, self.b)
+        return self.matching_blocks
+
+
+def _format_range(start, stop):
+    """Convert a range to the "ed" format of unified diffs."""
+    beginning = start + 1
+    length = stop - start
+    if length == 1:
+        return '%d' % beginning
+    if not length:
+        beginning -= 1
+    return '%d,%d' % (beginning, length)
+
+
+def generate_udiff_hunks(old, new, context_lines=4):
+    """
+    Generate the hunks of an udiff out of two texts, that is the udiff
+    without the two lines with the titles.  See `generate_udiff`.
+    """
+    old = old.splitlines()
+    new = new.splitlines()
+    matcher = PatienceSequenceMatcher(old, new)
+    for group in matcher.get_grouped_opcodes(context_lines):
+        first, last = group[0], group[-1]
+        yield '@@ -%s +%s @@' % (_format_range(first[1], last[2]),
+                                 _format_range(first[3], last[4]))
+        for tag, i1, i2, j1, j2 in group:
+            if tag == 'equal':
+                for line in old[i1:i2]:
+                    yield ' ' + line
+                continue
+            if tag in ('replace', 'delete'):
+                for line in old[i1:i2]:
+                    yield '-' + line
+            if tag in ('replace', 'insert'):
+                for line in new[j1:j2]:
+                    yield '+' + line
+
+
 def generate_udiff(old, new, old_title='', new_title='',
                    context_lines=4):
     """
@@ -301,20 +297,16 @@ def generate_udiff(old, new, old_title='', new_title='',
     used on the diff.  `context_lines` defaults to 5 and represents the
     number of lines used in an udiff around a changed line.
     """
-    udiff = difflib.unified_diff(
-        old.splitlines(),
-        new.splitlines(),
-        fromfile=old_title,
-        tofile=new_title,
-        lineterm='',
-        n=context_lines)
-    try:
-        title_diff_1 = next(udiff)
-        title_diff_2 = next(udiff)
-        return '\n'.join(itertools.chain([title_diff_1, title_diff_2], udiff))
-    except StopIteration:
+    hunks = '\n'.join(generate_udiff_hunks(old, new, context_lines))
+    if not hunks:
         # Content did't cange
         return ''
+    return join_udiff(hunks, old_title, new_title)
+
+
+def join_udiff(hunks, old_title='', new_title=''):
+    """Add the lines with the titles to the `hunks` of an udiff."""
+    return '--- %s\n+++ %s\n%s' % (old_title, new_title, hunks)
 
 
 def prepare_udiff(udiff):
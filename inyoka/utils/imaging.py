@@ -8,8 +8,10 @@
     :license: BSD, see LICENSE for more details.
 """
 import os
+from hashlib import sha1
 
 from django.conf import settings
+from django.core.cache import cache
 from django.utils.encoding import force_str
 from PIL import Image
 
@@ -117,3 +119,47 @@ def get_thumbnail(location, destination, width=None, height=None, force=False):
     # Return none if there were errors in thumbnail rendering, that way we can
     # raise 404 exceptions instead of raising 500 exceptions for the user.
     return destination
+
+
+def get_content_hash(location):
+    """
+    Return the SHA1 hash of the content of the file `location` in the media
+    root.  The hash is cached for the modification time and the size of the
+    file, so a file that is replaced in place is hashed again.
+    """
+    filename = os.path.join(settings.MEDIA_ROOT, location)
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    key = 'imaging/content_hash/%s/%d/%d' % (
+        sha1(force_str(location).encode('utf-8')).hexdigest(),
+        stat.st_mtime_ns, stat.st_size)
+    content_hash = cache.get(key)
+    if content_hash is None:
+        content = sha1()
+        try:
+            with open(filename, 'rb') as fobj:
+                for chunk in iter(lambda: fobj.read(1 << 16), b''):
+                    content.update(chunk)
+        except OSError:
+            return None
+        content_hash = content.hexdigest()
+        # one week, the keys of replaced files are not used anymore
+        cache.set(key, content_hash, 60 * 60 * 24 * 7)
+    return content_hash
+
+
+def get_shared_thumbnail(location, folder, width=None, height=None, force=False):
+    """
+    Like `get_thumbnail` but the name of the thumbnail is derived from the
+    content of the image, so identical images share their thumbnails.  The
+    thumbnail is stored below `folder` in the media root.
+    """
+    content_hash = get_content_hash(location)
+    if content_hash is None:
+        return None
+    dimension = '%sx%s%s' % (width or '', height or '', force and 'f' or '')
+    destination = os.path.join(folder, content_hash[:1], content_hash[:2],
+                               '%si%s' % (content_hash, dimension))
+    return get_thumbnail(location, destination, width, height, force)
@@ -8,17 +8,22 @@
     :license: BSD, see LICENSE for more details.
 """
 from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
 from django.core.mail import send_mail as django_send_mail
 
 from inyoka.utils.logger import logger
 
 
+def is_valid_recipient(address):
+    # Do not attempt to send to invalid email addresses
+    # (may occur for disabled users)
+    return not address.endswith('.invalid') and '@' in address
+
+
 def send_mail(subject, message, sender, to):
     assert len(to) == 1
 
-    # Do not attempt to send to invalid email addresses
-    # (may occur for disabled users)
-    if to[0].endswith('.invalid') or '@' not in to[0]:
+    if not is_valid_recipient(to[0]):
         return
 
     logger.debug(
@@ -30,6 +35,28 @@ def send_mail(subject, message, sender, to):
                          fail_silently=not settings.DEBUG)
 
 
+def send_mass_mail(datatuple):
+    """
+    Send the mails of `datatuple`, a sequence of ``(subject, message, sender,
+    recipient)`` tuples, through a single connection.  Return the number of
+    sent mails.
+    """
+    messages = []
+    for subject, message, sender, to in datatuple:
+        if not is_valid_recipient(to):
+            continue
+        logger.debug(
+            "Subject: %s\nMessage:%s\n\nSender: %s\nTo: %s" %
+                    (subject, message, sender, [to])
+        )
+        messages.append(EmailMessage(subject, message, sender, [to]))
+
+    if settings.DEBUG_NOTIFICATIONS or not messages:
+        return 0
+    connection = get_connection(fail_silently=not settings.DEBUG)
+    return connection.send_messages(messages) or 0
+
+
 def is_blocked_host(email_or_host):
     """
     This function checks the email or host against a blacklist of hosts that
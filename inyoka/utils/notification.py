@@ -12,7 +12,11 @@ from django.template.loader import render_to_string
 
 from inyoka.portal.models import Subscription
 from inyoka.utils.logger import logger
-from inyoka.utils.mail import send_mail
+from inyoka.utils.mail import send_mail, send_mass_mail
+
+#: Rendered in place of the username, so that a mail template is rendered
+#: only once for all subscribers, see `notify_subscriptions`.
+USERNAME_PLACEHOLDER = '\x00username\x00'
 
 
 def send_notification(user, template_name=None, subject=None, args=None):
@@ -34,24 +38,47 @@ def send_notification(user, template_name=None, subject=None, args=None):
                   settings.INYOKA_SYSTEM_USER_EMAIL, [user.email])
 
 
-def notify_about_subscription(sub, template=None, subject=None, args=None):
+@shared_task
+def notify_subscriptions(subscription_ids, template=None, subject=None, args=None):
+    """
+    Notify the users of the subscriptions `subscription_ids` by mail.  The
+    template is rendered once and all mails are sent through one connection.
+    """
     args = args or {}
     forum_id = args.get('forum_id')
-
-    if not sub.can_read(forum_id):
-        # don't send subscriptions to user that don't have read
-        # access to the resource
-        return
-    if template == 'topic_split' and 'topic_split' not in sub.user.settings.get('notifications', ('topic_split',)):
-        return
-
-    send_notification(sub.user, template, subject, args)
+    subscriptions = Subscription.objects.filter(id__in=subscription_ids) \
+                                        .select_related('user', 'content_type') \
+                                        .prefetch_related('content_object')
+
+    message = render_to_string(f'mails/{template}.txt',
+                               dict(args, username=USERNAME_PLACEHOLDER))
+    mails = []
+    for sub in subscriptions:
+        user = sub.user
+        if user.is_deleted or not sub.can_read(forum_id):
+            # don't send subscriptions to user that don't have read
+            # access to the resource
+            continue
+        if template == 'topic_split' and 'topic_split' not in user.settings.get('notifications', ('topic_split',)):
+            continue
+        if 'mail' not in user.settings.get('notify', ['mail']):
+            continue
+        mails.append((settings.EMAIL_SUBJECT_PREFIX + subject,
+                      message.replace(USERNAME_PLACEHOLDER, user.username),
+                      settings.INYOKA_SYSTEM_USER_EMAIL, user.email))
+    return send_mass_mail(mails)
 
 
 @shared_task
 def queue_notifications(request_user_id, template=None, subject=None, args=None,
                         include_notified=False, exclude_current_user=True,
                         filter=None, exclude=None, callback=None):
+    """
+    Notify the users of the subscriptions matching `filter` and return the
+    ids of the notified users.  The subscriptions are split into chunks of
+    ``NOTIFICATION_CHUNK_SIZE``, the first chunk is notified in this task and
+    the others by `notify_subscriptions` tasks in parallel.
+    """
     assert filter is not None
     assert args is not None
 
@@ -69,23 +96,27 @@ def queue_notifications(request_user_id, template=None, subject=None, args=None,
         subscriptions = subscriptions.exclude(user_id=request_user_id)
 
     notified_users = set()
-    notified = set()
+    notified = []
 
-    for subscription in subscriptions.all():
-        user = subscription.user
-        if user.id in notified_users:
+    for subscription_id, user_id in subscriptions.order_by('id').values_list('id', 'user_id'):
+        if user_id in notified_users:
             continue
+        notified_users.add(user_id)
+        notified.append(subscription_id)
 
-        notified_users.add(user.id)
-        if callable(args):
-            args = args(subscription)
-        args.update({'username': user.username})
-        notify_about_subscription(subscription, template, subject, args)
-        notified.add(subscription.id)
+    if callable(args) and notified:
+        args = args(Subscription.objects.get(id=notified[0]))
 
     if not include_notified:
         Subscription.objects.filter(id__in=notified).update(notified=True)
 
+    size = settings.NOTIFICATION_CHUNK_SIZE
+    chunks = [notified[i:i + size] for i in range(0, len(notified), size)]
+    for chunk in chunks[1:]:
+        notify_subscriptions.delay(chunk, template, subject, args)
+    if chunks:
+        notify_subscriptions(chunks[0], template, subject, args)
+
     if exclude and 'user_id__in' in exclude:
         notified_users.update(set(exclude['user_id__in']))
 
@@ -29,6 +29,13 @@
     statement. In this case you can use the `rownum_column` argument.
     To get all items on one page, set `one_page=True` or `per_page=0`.
 
+    Deep pages are expensive with an offset, too.  Pass the ordering of a
+    queryset as `keyset` (e.g. ``('-pub_date', '-id')``, the last column has
+    to be unique) to seek to the previous, next and last page by the column
+    values of the neighbouring objects instead.  Those are passed as a signed
+    `cursor` in the URL.  The first `offset_pages` pages are still linked by
+    their number.
+
     URL to the first and last page will be accessible through `pagination.first`
     and `pagination.last`.
 
@@ -52,19 +59,24 @@
     :copyright: (c) 2007-2025 by the Inyoka Team, see AUTHORS for more details.
     :license: BSD, see LICENSE for more details.
 """
+from datetime import date
 
-
+from django.core import signing
+from django.db.models import Q
 from django.http import Http404
 from django.utils.encoding import force_str
 
 from inyoka.utils.urls import urlencode
 
+_CURSOR_SALT = 'inyoka.utils.pagination'
+
 
 class Pagination:
     """ Handle pagination """
 
     def __init__(self, request, query, page=1, per_page=10, link=None, total=None,
-            rownum_column=None, max_pages=None, one_page=False):
+            rownum_column=None, max_pages=None, one_page=False, keyset=None,
+            offset_pages=10):
         """ Create pagination object
 
             :param request: The current request.
@@ -76,6 +88,8 @@ class Pagination:
             :param rownum_column: Name of the column used to order items.
             :param max_pages: Maximum number of pages.
             :param one_page: If set, show all elements on one page
+            :param keyset: Columns the query is ordered by, enables the keyset mode.
+            :param offset_pages: Number of pages linked by number in keyset mode.
         """
 
         self.request = request
@@ -85,8 +99,11 @@ class Pagination:
         self.base_link = self._get_base_link(link)
         self.total = self._get_total(total)
         self.rownum_column = rownum_column
+        self.keyset = tuple(keyset) if keyset else None
+        self.offset_pages = offset_pages
 
         self._queryset = None
+        self._bounds = None
         self._first = None
         self._last = None
         self._next = None
@@ -99,7 +116,10 @@ class Pagination:
         else:
             self.pages = max(0, (self.total - 1)) // self.per_page + 1
 
-        if max_pages and self.pages > max_pages:
+        # the last page can only be reached by a cursor if it is the end of
+        # the query, a capped last page is reached by its offset
+        self.capped = bool(max_pages and self.pages > max_pages)
+        if self.capped:
             self.pages = max_pages
 
         if self.page > self.pages or self.page < 1:
@@ -111,6 +131,14 @@ class Pagination:
         enc = lambda v: force_str(v).encode('utf-8') if isinstance(v, str) else v
         self.params = {enc(k): enc(v) for k, v in self.request.GET.items()}
 
+        self.cursor = self.params.pop(b'cursor', None)
+        self._cursor = None
+        if self.keyset and self.cursor:
+            try:
+                self._cursor = signing.loads(force_str(self.cursor), salt=_CURSOR_SALT)
+            except signing.BadSignature:
+                raise Http404()
+
     def _get_base_link(self, link):
         if link is None:
             link = self.request.path
@@ -136,7 +164,9 @@ class Pagination:
         index_first = (self.page - 1) * self.per_page
         index_last = index_first + self.per_page
 
-        if self.rownum_column:
+        if self.keyset:
+            self._queryset = self._get_keyset_queryset(index_first, index_last)
+        elif self.rownum_column:
             expr = {f'{self.rownum_column}__gte': index_first,
                     f'{self.rownum_column}__lt': index_last}
             self._queryset = self.query.filter(**expr)
@@ -145,6 +175,81 @@ class Pagination:
 
         return self._queryset
 
+    def _get_keyset_queryset(self, index_first, index_last):
+        query = self.query.order_by(*self.keyset)
+        names = [field.lstrip('-') for field in self.keyset]
+
+        if self._cursor is None:
+            query = query[index_first:index_last]
+            self._bounds_query = (query.values_list(*names), False)
+            return query
+
+        backwards, values = self._cursor
+        count = self.per_page
+        if values is None:
+            # the last page, which might not be complete
+            count = min(self.total - (self.pages - 1) * self.per_page, self.per_page)
+        else:
+            query = query.filter(self._get_keyset_filter(values, backwards))
+
+        if not backwards:
+            query = query[:count]
+            self._bounds_query = (query.values_list(*names), False)
+            return query
+
+        query = query.reverse()[:count]
+        self._bounds_query = (query.values_list(*names), True)
+        return list(query)[::-1]
+
+    def _get_keyset_filter(self, values, backwards):
+        """Return a filter for the objects after (or before) `values`."""
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.keyset, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') != backwards else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def _get_bounds(self):
+        """Return the keyset values of the first and the last object on this page."""
+        if self._bounds is None:
+            self.get_queryset()
+            query, backwards = self._bounds_query
+            rows = list(query)
+            if backwards:
+                rows.reverse()
+            self._bounds = (rows[0], rows[-1]) if rows else (None, None)
+        return self._bounds
+
+    def _generate_cursor_link(self, page, backwards, values):
+        if values is not None:
+            values = [value.isoformat() if isinstance(value, date) else value
+                      for value in values]
+        params = dict(self.params)
+        params['cursor'] = signing.dumps((backwards, values), salt=_CURSOR_SALT)
+        return self.generate_link(page, params)
+
+    def _generate_page_link(self, page):
+        """
+        Return the url to `page` or None if it can only be reached by an
+        offset in keyset mode.
+        """
+        if not self.keyset or page <= self.offset_pages:
+            return self.generate_link(page, self.params)
+        if page == self.page:
+            if self.cursor:
+                return self.generate_link(page, dict(self.params, cursor=self.cursor))
+            return self.generate_link(page, self.params)
+        if page == self.pages:
+            return self.last
+        if page == self.page - 1:
+            return self.prev
+        if page == self.page + 1:
+            return self.next
+        return None
+
     def generate_link(self, page, params):
         """ Get link for page number
 
@@ -156,8 +261,8 @@ class Pagination:
             url = self.base_link
         else:
             url = f'{self.base_link}{page}/'
-        if self.params:
-            url = url + f'?{urlencode(self.params)}'
+        if params:
+            url = url + f'?{urlencode(params)}'
         return url
 
     @property
@@ -172,7 +277,10 @@ class Pagination:
         """ Return the url to the last page """
 
         if self._last is None:
-            self._last = self.generate_link(self.pages, self.params)
+            if self.keyset and self.pages > self.offset_pages and not self.capped:
+                self._last = self._generate_cursor_link(self.pages, True, None)
+            else:
+                self._last = self.generate_link(self.pages, self.params)
         return self._last
 
     @property
@@ -182,7 +290,11 @@ class Pagination:
         if self.page <= 1:
             return False
         if self._prev is None:
-            self._prev = self.generate_link(self.page - 1, self.params)
+            if self.keyset and self.page - 1 > self.offset_pages:
+                first = self._get_bounds()[0]
+                self._prev = first is not None and self._generate_cursor_link(self.page - 1, True, first)
+            else:
+                self._prev = self.generate_link(self.page - 1, self.params)
         return self._prev
 
     @property
@@ -192,7 +304,11 @@ class Pagination:
         if self.page >= self.pages:
             return False
         if self._next is None:
-            self._next = self.generate_link(self.page + 1, self.params)
+            if self.keyset and self.page + 1 > self.offset_pages:
+                last = self._get_bounds()[1]
+                self._next = last is not None and self._generate_cursor_link(self.page + 1, False, last)
+            else:
+                self._next = self.generate_link(self.page + 1, self.params)
         return self._next
 
     def list(self, threshold=2):
@@ -205,14 +321,18 @@ class Pagination:
                  keys 'url' and 'page'.
         """
 
+        was_ellipsis = False
         for num in range(1, self.pages + 1):
+            url = None
             if (num <= threshold or num > (self.pages - threshold) or
                     abs(self.page - num) < threshold):
+                url = self._generate_page_link(num)
+            if url is not None:
                 was_ellipsis = False
                 yield {
                     'type': 'current' if self.page == num else 'link',
                     'page': num,
-                    'url': self.generate_link(num, self.params)
+                    'url': url
                 }
             elif not was_ellipsis:
                 was_ellipsis = True
@@ -4,6 +4,12 @@
 
     Session related utility functions.
 
+    The active sessions are tracked in two redis sorted sets, one for
+    anonymous and one for registered sessions, with the session ids as
+    members scored by the time they were last seen.  Expired sessions are
+    trimmed before counting, so the number of online users is the size of
+    the sets and no scan over all keys is needed.  Only the infos of
+    registered sessions are stored, as only those are listed.
 
     :copyright: (c) 2007-2025 by the Inyoka Team, see AUTHORS for more details.
     :license: BSD, see LICENSE for more details.
@@ -22,6 +28,13 @@ from inyoka.utils.urls import url_for
 
 SESSION_DELTA = 300
 
+ANONYMOUS_SESSIONS_KEY = 'sessioninfo/anonymous'
+REGISTERED_SESSIONS_KEY = 'sessioninfo/registered'
+
+
+def _get_info_key(sid):
+    return cache.make_key('sessioninfo:%s' % sid)
+
 
 def set_session_info(request):
     """Set the session info."""
@@ -37,8 +50,7 @@ def set_session_info(request):
     if request.session.new:
         return
 
-    key = 'sessioninfo:%s' % request.session['sid']
-
+    sid = request.session['sid']
     session = {
         'id': None,
         'username': None,
@@ -54,7 +66,17 @@ def set_session_info(request):
         session['text'] = request.user.username
         session['link'] = url_for(request.user)
 
-    cache.set(key, session, timeout=SESSION_DELTA)
+    if session['anonymous']:
+        add_key, remove_key = ANONYMOUS_SESSIONS_KEY, REGISTERED_SESSIONS_KEY
+    else:
+        add_key, remove_key = REGISTERED_SESSIONS_KEY, ANONYMOUS_SESSIONS_KEY
+
+    pipe = cache.client.get_client().pipeline(transaction=False)
+    pipe.zadd(cache.make_key(add_key), {sid: time()})
+    pipe.zrem(cache.make_key(remove_key), sid)
+    if not session['anonymous']:
+        pipe.set(_get_info_key(sid), cache.client.encode(session), ex=SESSION_DELTA)
+    pipe.execute()
 
 
 class SurgeProtectionMixin:
@@ -105,20 +127,39 @@ def get_user_record(values=None):
     return record, timestamp
 
 
-def get_sessions(order_by='-last_change'):
-    """Get a simple list of active sessions for the portal index."""
-    sessions = [session[1] for session in cache.get_many(cache.keys('sessioninfo:*')).items()]
-
-    anonymous = sum(x['anonymous'] for x in sessions)
+def online_counts():
+    """
+    Return a dict with the number of ``anonymous``, ``registered`` and
+    ``all`` active sessions.
+    """
+    expired = time() - SESSION_DELTA
+    pipe = cache.client.get_client().pipeline()
+    for key in (ANONYMOUS_SESSIONS_KEY, REGISTERED_SESSIONS_KEY):
+        pipe.zremrangebyscore(cache.make_key(key), '-inf', expired)
+        pipe.zcard(cache.make_key(key))
+    __, anonymous, __, registered = pipe.execute()
     return {
         'anonymous': anonymous,
-        'registered': len(sessions) - anonymous,
-        'all': len(sessions),
-        'sessions': sessions,
-        'registered_sessions': [s for s in sessions if not s['anonymous']]
+        'registered': registered,
+        'all': anonymous + registered,
     }
 
 
+def get_sessions():
+    """
+    Get the numbers of active sessions and the registered sessions, most
+    recently active first, for the portal index.
+    """
+    counts = online_counts()
+    redis = cache.client.get_client()
+    sids = redis.zrevrange(cache.make_key(REGISTERED_SESSIONS_KEY), 0, -1)
+    sessions = []
+    if sids:
+        infos = redis.mget([_get_info_key(sid.decode()) for sid in sids])
+        sessions = [cache.client.decode(info) for info in infos if info is not None]
+    return dict(counts, registered_sessions=sessions)
+
+
 def make_permanent(request):
     """Make this session a permanent one."""
     request.session['_perm'] = True
@@ -20,6 +20,7 @@ from django.test import TestCase as _TestCase
 from django.test.client import Client
 
 from inyoka.portal.user import User
+from inyoka.utils.local import local_manager
 from inyoka.utils.spam import (
     get_comment_check_url,
     get_mark_ham_url,
@@ -163,12 +164,13 @@ class TestCase(_TestCase):
     """
     Default TestCase for all Inyoka tests.
 
-    Deletes the content cache after each run.
+    Deletes the content cache and the request local data after each run.
     """
 
     def _post_teardown(self):
         """Flush cache"""
         super()._post_teardown()
+        local_manager.cleanup()
         content_cache = caches['content']
         content_cache.delete_pattern("*")
         default_cache = caches['default']
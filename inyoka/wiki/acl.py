@@ -20,15 +20,23 @@
     changed in a way the user is not allowed to change it.  This module
     provides a function called `test_changes_allowed` that checks for that.
 
+    The rules are compiled into an `ACLMatcher` once per request.  It indexes
+    the rules by subject and by the literal prefix of their page pattern, so
+    a privilege check only runs the patterns that can match at all, and it
+    remembers the matching rules of every checked page.
+
 
     :copyright: (c) 2007-2025 by the Inyoka Team, see AUTHORS for more details.
     :license: BSD, see LICENSE for more details.
 """
+import re
+
 from django.core.exceptions import PermissionDenied
 from django.http import HttpResponseRedirect
 
 from inyoka.portal.user import User
 from inyoka.utils.decorators import patch_wrapper
+from inyoka.utils.local import local as local_cache
 from inyoka.utils.text import normalize_pagename
 from inyoka.utils.urls import href
 from inyoka.wiki.models import Page
@@ -133,11 +141,12 @@ class MultiPrivilegeTest:
     def __init__(self, user):
         self.user = user
         self.groups = set(self.user.groups.values_list('name', flat=True))
-        self.owned_pages = set(Page.objects.get_owned(self.groups))
+        owners = {self.user.username} | {'@' + group for group in self.groups}
+        self.owned_pages = Page.objects.get_owned(owners)
 
     def get_groups(self, page_name):
         if page_name in self.owned_pages:
-            return self.groups & {GROUP_OWNER}
+            return self.groups | {GROUP_OWNER}
         return self.groups
 
     def get_privilege_flags(self, page_name):
@@ -153,6 +162,98 @@ class MultiPrivilegeTest:
         return has_privilege(self.user, page_name, privilege, groups)
 
 
+_escape_re = re.compile(r'\\(.)', re.S)
+_non_ascii_re = re.compile(r'[^\x00-\x7f]')
+
+#: the non-ASCII letters the case-insensitive ACL patterns match with ASCII
+#: letters, see the documentation of `re.IGNORECASE`.
+_ascii_case_fixes = str.maketrans('\u0130\u0131\u017f\u212a', 'iisk')
+
+
+def _get_literal_prefix(pattern):
+    """
+    Return the lowercased ASCII part of an ACL pattern before its first
+    wildcard.  The patterns are compiled by `AccessControlList.extract_data`.
+    """
+    prefix = pattern.pattern[1:-1].split('.*?', 1)[0]
+    prefix = _escape_re.sub(r'\1', prefix)
+    return _non_ascii_re.split(prefix, 1)[0].lower()
+
+
+class ACLMatcher:
+    """
+    The compiled ACL rules of `storage.acl`.
+
+    The rules are grouped by subject and indexed by the literal prefix of
+    their patterns, so only the patterns of rules whose prefix matches the
+    page name are run.  The matching rules of a user and a page are
+    remembered, they don't depend on the groups of the user.
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+        #: subject -> {prefix: [rule index, ...]}
+        self.subjects = {}
+        for index, (pattern, subject, __, __) in enumerate(rules):
+            prefixes = self.subjects.setdefault(subject, {})
+            prefixes.setdefault(_get_literal_prefix(pattern), []).append(index)
+        self.prefix_lengths = {subject: sorted({len(prefix) for prefix in prefixes})
+                               for subject, prefixes in self.subjects.items()}
+        self.group_subjects = [subject for subject in self.subjects
+                               if subject.startswith('@')]
+        self._matches = {}
+
+    def _find_candidates(self, subject, page_name):
+        prefixes = self.subjects.get(subject)
+        if not prefixes:
+            return []
+        candidates = []
+        for length in self.prefix_lengths[subject]:
+            if length > len(page_name):
+                break
+            candidates.extend(prefixes.get(page_name[:length], ()))
+        return candidates
+
+    def get_matches(self, username, page_name):
+        """
+        Return the matching rules of `username` and its potential groups for
+        a normalized page name, in the order of the ACL, as tuples in the
+        form ``(group, add_privs, del_privs)``.  `group` is `None` for rules
+        of the user itself.
+        """
+        key = (username, page_name)
+        if key in self._matches:
+            return self._matches[key]
+
+        lowered = page_name.translate(_ascii_case_fixes).lower()
+        candidates = self._find_candidates(username, lowered)
+        for subject in self.group_subjects:
+            candidates.extend(self._find_candidates(subject, lowered))
+
+        matches = []
+        for index in sorted(candidates):
+            pattern, subject, add_privs, del_privs = self.rules[index]
+            if pattern.match(page_name) is not None:
+                group = subject[1:] if subject.startswith('@') else None
+                matches.append((group, add_privs, del_privs))
+        self._matches[key] = matches = tuple(matches)
+        return matches
+
+
+def get_matcher():
+    """
+    Return the `ACLMatcher` of the current ACL rules or `None` if there are
+    no rules.  The matcher is kept for the current request.
+    """
+    rules = storage.acl
+    if not rules:
+        return None
+    matcher = getattr(local_cache, 'wiki_acl_matcher', None)
+    if matcher is None or matcher.rules is not rules:
+        matcher = local_cache.wiki_acl_matcher = ACLMatcher(rules)
+    return matcher
+
+
 def get_privilege_flags(user, page_name, groups=None):
     """
     Return an integer with the privilege flags for a user for the given
@@ -170,18 +271,27 @@ def get_privilege_flags(user, page_name, groups=None):
 
     page_name = normalize_pagename(page_name)
 
-    rules = storage.acl
-    if not rules:
+    matcher = get_matcher()
+    if matcher is None:
         return PRIV_DEFAULT
     privileges = PRIV_NONE
-    for pattern, subject, add_privs, del_privs in rules:
-        if (subject == user.username or
-            (subject.startswith('@') and subject[1:] in groups)) and \
-                pattern.match(page_name) is not None:
+    for group, add_privs, del_privs in matcher.get_matches(user.username, page_name):
+        if group is None or group in groups:
             privileges = (privileges | add_privs) & ~del_privs
     return privileges
 
 
+def filter_readable(user, page_names):
+    """
+    Return the names of `page_names` that `user` is allowed to read.  This
+    loads the groups and owned pages of the user only once, so use it to
+    filter lists of pages.
+    """
+    privileges = MultiPrivilegeTest(user)
+    return [name for name in page_names
+            if privileges.get_privilege_flags(name) & PRIV_READ]
+
+
 def get_privileges(user, page_name, groups=None):
     """
     Get a dict with the privileges a user has for a page (or doesn't).  `user`
@@ -0,0 +1,63 @@
+"""
+    inyoka.wiki.management.commands.benchmark_lexer
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Compares the markup lexer engines (see the ``MARKUP_LEXER`` setting) on
+    the largest wiki pages.  The token streams of both engines are checked
+    to be identical, the speed is reported in tokens per second.
+
+    :copyright: (c) 2007-2025 by the Inyoka Team, see AUTHORS for more details.
+    :license: BSD, see LICENSE for more details.
+"""
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models.functions import Length
+
+from inyoka.markup.lexer import Lexer
+from inyoka.wiki.models import Page
+
+ENGINES = ('sequential', 'combined')
+
+
+def tokenize(text, engine):
+    return list(Lexer(engine).tokenize(text))
+
+
+class Command(BaseCommand):
+    help = 'Compare the speed of the markup lexer engines on the largest wiki pages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-p', '--pages', type=int, default=20,
+            help='Number of pages to lex, starting with the largest one.')
+        parser.add_argument('-r', '--rounds', type=int, default=3,
+            help='Number of times every page is lexed per engine.')
+
+    def handle(self, *args, **options):
+        pages = Page.objects.filter(last_rev__isnull=False) \
+                            .annotate(length=Length('last_rev__text__value')) \
+                            .order_by('-length') \
+                            .values_list('name', 'last_rev__text__value')[:options['pages']]
+        pages = list(pages)
+        if not pages:
+            raise CommandError('There are no wiki pages.')
+
+        timings = dict.fromkeys(ENGINES, 0.0)
+        token_count = 0
+        for name, text in pages:
+            streams = {engine: tokenize(text, engine) for engine in ENGINES}
+            if streams['sequential'] != streams['combined']:
+                raise CommandError(f'The engines produce different tokens for {name}')
+            token_count += len(streams['sequential']) * options['rounds']
+
+            for engine in ENGINES:
+                start = perf_counter()
+                for __ in range(options['rounds']):
+                    tokenize(text, engine)
+                timings[engine] += perf_counter() - start
+
+        self.stdout.write('%d pages, %d characters, %d tokens' % (
+            len(pages), sum(len(text) for __, text in pages), token_count))
+        for engine in ENGINES:
+            self.stdout.write('%-10s %8.3fs %12.0f tokens/s' % (
+                engine, timings[engine], token_count / timings[engine]))
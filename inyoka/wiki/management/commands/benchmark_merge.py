@@ -0,0 +1,82 @@
+"""
+    inyoka.wiki.management.commands.benchmark_merge
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Measures the three-way merge of `inyoka.utils.diff3` on concurrent edits
+    of the largest wiki pages.  The edits are generated from a fixed seed, so
+    the corpus is the same for every run on the same database.
+
+    :copyright: (c) 2007-2025 by the Inyoka Team, see AUTHORS for more details.
+    :license: BSD, see LICENSE for more details.
+"""
+import random
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models.functions import Length
+
+from inyoka.utils.diff3 import DEFAULT_MARKERS, merge
+from inyoka.wiki.models import Page
+
+
+def make_edit(rng, lines, changes, block_size):
+    """Return a copy of `lines` with `changes` random edits of up to `block_size` lines."""
+    lines = list(lines)
+    for index in range(changes):
+        position = rng.randint(0, len(lines))
+        size = rng.randint(1, block_size)
+        action = rng.choice(('insert', 'delete', 'replace'))
+        if action != 'insert':
+            del lines[position:position + size]
+        if action != 'delete':
+            lines[position:position] = ['edit %d.%d' % (index, line) for line in range(size)]
+    return lines
+
+
+class Command(BaseCommand):
+    help = 'Measure the three-way merge on concurrent edits of the largest wiki pages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-p', '--pages', type=int, default=20,
+            help='Number of pages to merge, starting with the largest one.')
+        parser.add_argument('-c', '--changes', type=int, default=10,
+            help='Number of changes of every concurrent edit.')
+        parser.add_argument('-b', '--block-size', type=int, default=5,
+            help='Maximum number of lines of a change.')
+        parser.add_argument('-r', '--rounds', type=int, default=3,
+            help='Number of times every edit is merged.')
+        parser.add_argument('-s', '--seed', type=int, default=0,
+            help='Seed of the generated edits.')
+
+    def handle(self, *args, **options):
+        pages = Page.objects.filter(last_rev__isnull=False) \
+                            .annotate(length=Length('last_rev__text__value')) \
+                            .order_by('-length') \
+                            .values_list('name', 'last_rev__text__value')[:options['pages']]
+        pages = list(pages)
+        if not pages:
+            raise CommandError('There are no wiki pages.')
+
+        rng = random.Random(options['seed'])
+        corpus = []
+        for name, text in pages:
+            lines = text.splitlines()
+            corpus.append((name, lines,
+                           make_edit(rng, lines, options['changes'], options['block_size']),
+                           make_edit(rng, lines, options['changes'], options['block_size'])))
+
+        total = 0.0
+        conflicts = 0
+        for name, old, other, new in corpus:
+            start = perf_counter()
+            for __ in range(options['rounds']):
+                result = merge(old, other, new)
+            duration = (perf_counter() - start) / options['rounds']
+            total += duration
+            conflicts += result.count(DEFAULT_MARKERS[0])
+            if options['verbosity'] >= 2:
+                self.stdout.write('%-60s %6d lines %8.4fs' % (name, len(old), duration))
+
+        self.stdout.write('%d pages, %d lines, %d conflicts, %.4fs per merge' % (
+            len(corpus), sum(len(old) for __, old, __, __ in corpus), conflicts,
+            total / len(corpus)))
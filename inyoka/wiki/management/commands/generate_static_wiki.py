@@ -6,15 +6,24 @@
     Creates a snapshot of all wiki pages in HTML format. Requires
     BeautifulSoup4 to be installed.
 
+    The snapshot contains a manifest with the revision of every written page
+    and of the templates it includes.  With ``--incremental`` only pages that
+    changed since the last snapshot, the pages linking to created or deleted
+    pages and the pages of a new render epoch are written again.  With
+    ``--jobs`` the pages are rendered by a pool of processes.
+
     :copyright: (c) 2007-2025 by the Inyoka Team, see AUTHORS for more details.
     :license: BSD, see LICENSE for more details.
 """
 
 
 import datetime
+import json
+import multiprocessing
+from collections import defaultdict
 from functools import partial
 from hashlib import sha1
-from os import chmod, mkdir, path, unlink, walk
+from os import chmod, getpid, makedirs, mkdir, path, replace, unlink, walk
 from re import compile, escape, sub
 from shutil import copy, copytree, rmtree
 from urllib.parse import unquote as url_unquote
@@ -22,6 +31,7 @@ from urllib.parse import unquote as url_unquote
 from bs4 import BeautifulSoup
 from django.conf import settings
 from django.core.management.base import BaseCommand
+from django.db import connections
 from django.template.defaultfilters import date
 from django.template.loader import render_to_string
 from django.utils.encoding import force_str
@@ -32,12 +42,13 @@ from inyoka.portal.user import User
 from inyoka.utils.terminal import ProgressBar, percentize
 from inyoka.utils.text import normalize_pagename
 from inyoka.utils.urls import href
-from inyoka.wiki.acl import has_privilege
+from inyoka.wiki.acl import filter_readable
 from inyoka.wiki.exceptions import CaseSensitiveException
-from inyoka.wiki.models import Page
+from inyoka.wiki.models import MetaData, Page
 
 FOLDER = 'static_wiki'
 INCLUDE_IMAGES = False
+MANIFEST = '.manifest.json'
 
 UU_DE_DOMAIN = 'ubuntuusers.de'
 UU_DE = 'http://%s' + UU_DE_DOMAIN + '/'
@@ -83,6 +94,14 @@ verbosity = 0
 BeautifulSoup = partial(BeautifulSoup, features='lxml')
 
 
+def _write_page(name):
+    """Write a page in a process of the pool, see `Command.write_pages`."""
+    return _pool_command.write_page(name, _pool_user)
+
+
+_pool_command = _pool_user = None
+
+
 class DummyRequest:
     """Small helper class to render pages without having a real request"""
     def __init__(self, user):
@@ -105,6 +124,12 @@ class Command(BaseCommand):
         parser.add_argument('--images', action='store_true',
             help='If given, images will be included in the static wiki.')
 
+        parser.add_argument('--incremental', action='store_true',
+            help='Only write the pages that changed since the last snapshot.')
+
+        parser.add_argument('-j', '--jobs', type=int, default=1,
+            help='Number of processes that render the pages.')
+
     def handle(self, *args, **options):
         global verbosity
         verbosity = int(options['verbosity'])
@@ -120,11 +145,11 @@ class Command(BaseCommand):
         if verbosity >= 1:
             print("Starting Export")
 
-        global SNAPSHOT_DATE, SNAPSHOT_MESSAGE
+        global SNAPSHOT_DATE
         activate(settings.LANGUAGE_CODE)
         SNAPSHOT_DATE = date(datetime.date.today(), settings.DATE_FORMAT)
-        SNAPSHOT_MESSAGE = SNAPSHOT_MESSAGE % (SNAPSHOT_DATE, '%s')
-        self.create_snapshot()
+        self.snapshot_message = SNAPSHOT_MESSAGE % (SNAPSHOT_DATE, '%s')
+        self.create_snapshot(options['incremental'], options['jobs'])
 
         if verbosity >= 1:
             print("Export complete")
@@ -155,8 +180,11 @@ class Command(BaseCommand):
         })
 
     def _write_file(self, pth, content):
-        with open(pth, 'w+') as fobj:
+        # write atomically, pages are written by several processes
+        tmp = '%s.%d' % (pth, getpid())
+        with open(tmp, 'w+') as fobj:
             fobj.write(content)
+        replace(tmp, pth)
 
     def save_file(self, url, is_main_page=False, is_static=False):
         if not INCLUDE_IMAGES and not is_static and not is_main_page:
@@ -220,9 +248,8 @@ class Command(BaseCommand):
 
                         _re = compile(r'\?[0-9a-f]{32}')
                         content = _re.sub('', content)
-                        with open(abs_path, 'w') as f:
-                            f.write(content)
-                            UPDATED_SRCS.add(rel_path)
+                        self._write_file(abs_path, content)
+                        UPDATED_SRCS.add(rel_path)
 
         def _handle_favicon(self, tag):
             rel_path = self.save_file(tag['href'], is_main_page, True)
@@ -326,7 +353,7 @@ class Command(BaseCommand):
             a['href'] = str.replace(a['href'], settings.BASE_DOMAIN_NAME, UU_DE_DOMAIN, 1)
 
     def handle_snapshot_message(self, soup, pre, is_main_page, page_name):
-        tag = BeautifulSoup(SNAPSHOT_MESSAGE % path.join(UU_WIKI, page_name))
+        tag = BeautifulSoup(self.snapshot_message % path.join(UU_WIKI, page_name))
         soup.find(id='main').insert(0, tag)
 
     def handle_redirect_page(self, soup, pre, target):
@@ -351,19 +378,126 @@ class Command(BaseCommand):
                 handle_non_wiki_link,
                 handle_snapshot_message]
 
-    def create_snapshot(self):
+    def load_manifest(self):
+        """Return the manifest of the last snapshot or `None`."""
+        try:
+            with open(path.join(FOLDER, MANIFEST)) as fobj:
+                manifest = json.load(fobj)
+        except (OSError, ValueError):
+            return None
+        if manifest.get('images') != INCLUDE_IMAGES:
+            return None
+        return manifest['pages']
+
+    def get_fingerprints(self, names):
+        """
+        Return a dict of page name -> string that changes whenever the page
+        has to be written again: If it or one of the templates it includes
+        gets a new revision or a new render epoch starts.
+        """
+        epoch = Page.objects.get_render_epoch()
+        revisions = dict(Page.objects.values_list('name', 'last_rev_id'))
+        templates = defaultdict(list)
+        for name, template in MetaData.objects.filter(key='X-Attach') \
+                                              .values_list('page__name', 'value'):
+            templates[name].append(template)
+        return {name: '{epoch}/{revision}/{dependencies}'.format(
+                    epoch=epoch,
+                    revision=revisions.get(name),
+                    dependencies=','.join('%s:%s' % (template, revisions.get(template))
+                                          for template in sorted(templates[name])))
+                for name in names}
+
+    def write_page(self, name, user):
+        """Render the page `name` and write it to the snapshot."""
+        parts = 0
+        is_main_page = False
+
+        try:
+            page = Page.objects.get_by_name(name, False, True)
+        except CaseSensitiveException as e:
+            page = e.page
+        except Page.DoesNotExist:
+            return
+
+        if page.name == settings.WIKI_MAIN_PAGE:
+            is_main_page = True
+
+        if page.rev.attachment:
+            # page is an attachment
+            return
+        if len(page.trace) > 1:
+            # page is a subpage
+            # create subdirectories
+            for part in page.trace[:-1]:
+                pth = path.join(FOLDER, 'files', *self.fix_path(part).split('/'))
+                makedirs(pth, exist_ok=True)
+                parts += 1
+
+        content = self.fetch_page(page, user=user, settings=settings)
+        if content is None:
+            return
+        soup = BeautifulSoup(content)
+
+        # Apply the handlers from above to modify the page content
+        for handler in self.HANDLERS:
+            handler(self, soup, self._pre(parts), is_main_page, page.name)
+
+        # If a page is a redirect page, add a forward link
+        redirect = page.metadata.get('X-Redirect')
+        if redirect:
+            self.handle_redirect_page(soup, self._pre(parts), redirect)
+
+        content = str(soup)
+
+        self._write_file(path.join(FOLDER, 'files', '%s.html' %
+                                               self.fix_path(page.name)), content)
+
+        if is_main_page:
+            content = compile(r'(src|href)="\./([^"]+)"') \
+                .sub(lambda m: '%s="./files/%s"' %
+                               (m.groups()[0], m.groups()[1]), content)
+            self._write_file(path.join(FOLDER, 'index.html'), content)
+
+    def write_pages(self, names, user, jobs):
+        """
+        Write the pages `names`, with a pool of `jobs` processes if it is
+        greater than one.
+        """
+        if verbosity >= 1 and names:
+            pb = ProgressBar(40)
+            percents = iter(percentize(len(names)))
+
+        if jobs > 1:
+            global _pool_command, _pool_user
+            _pool_command, _pool_user = self, user
+            # the processes must not share the database connections
+            connections.close_all()
+            with multiprocessing.get_context('fork').Pool(jobs) as pool:
+                for __ in pool.imap_unordered(_write_page, names, chunksize=10):
+                    if verbosity >= 1:
+                        pb.update(next(percents))
+        else:
+            for name in names:
+                self.write_page(name, user)
+                if verbosity >= 1:
+                    pb.update(next(percents))
+
+    def create_snapshot(self, incremental=False, jobs=1):
         user = User.objects.get_anonymous_user()
 
+        manifest = self.load_manifest() if incremental else None
+
         # create the folder structure
         if not path.exists(FOLDER):
             mkdir(FOLDER)
-        else:
+        elif manifest is None:
             for root, dirs, files in walk(FOLDER):
                 for f in files:
                     unlink(path.join(root, f))
                 for d in dirs:
                     rmtree(path.join(root, d))
-        mkdir(path.join(FOLDER, 'files'))
+        makedirs(path.join(FOLDER, 'files', 'img'), exist_ok=True)
 
         img = partial(path.join, settings.STATIC_ROOT, 'img')
         static_paths = ((img('icons'), 'icons'),
@@ -378,11 +512,11 @@ class Command(BaseCommand):
         for pth in static_paths:
             _pth = pth[0] if isinstance(pth, _iterables) else pth
             if path.isdir(_pth):
-                copytree(_pth, path.join(FOLDER, 'files', 'img', pth[1]))
+                copytree(_pth, path.join(FOLDER, 'files', 'img', pth[1]), dirs_exist_ok=True)
             else:
                 copy(_pth, path.join(FOLDER, 'files', 'img'))
         attachment_folder = path.join(FOLDER, 'files', '_')
-        mkdir(attachment_folder)
+        makedirs(attachment_folder, exist_ok=True)
 
         license_content = self._static_page('lizenz', user=user, settings=settings)
         license_soup = BeautifulSoup(license_content)
@@ -392,87 +526,48 @@ class Command(BaseCommand):
         license_content = str(license_soup)
         self._write_file(path.join(FOLDER, 'files', self.license_file), license_content)
 
-        if verbosity >= 1:
-            pb = ProgressBar(40)
-
-        unsorted = Page.objects.get_page_list(existing_only=True)
-        todo = set()
+        unsorted = filter_readable(user, Page.objects.get_page_list(existing_only=True))
+        # pages are written case insensitive
+        pages = {}
         num_excluded = 0
         # sort out excluded pages
         for page in unsorted:
-            page = page.lower()
+            lowered = page.lower()
             do_add = True
             for exclude in EXCLUDE_PAGES:
-                if page.startswith(exclude):
+                if lowered.startswith(exclude):
                     do_add = False
                     num_excluded += 1
                     break
             if do_add:
-                todo.add(page)
-
-        def _fetch_and_write(name):
-            parts = 0
-            is_main_page = False
-
-            if not has_privilege(user, name, 'read'):
-                return
-
-            try:
-                page = Page.objects.get_by_name(name, False, True)
-            except CaseSensitiveException as e:
-                page = e.page
-            except Page.DoesNotExist:
-                return
-
-            if page.name == settings.WIKI_MAIN_PAGE:
-                is_main_page = True
-
-            if page.rev.attachment:
-                # page is an attachment
-                return
-            if len(page.trace) > 1:
-                # page is a subpage
-                # create subdirectories
-                for part in page.trace[:-1]:
-                    pth = path.join(FOLDER, 'files', *self.fix_path(part).split('/'))
-                    if not path.exists(pth):
-                        mkdir(pth)
-                    parts += 1
-
-            content = self.fetch_page(page, user=user, settings=settings)
-            if content is None:
-                return
-            soup = BeautifulSoup(content)
-
-            # Apply the handlers from above to modify the page content
-            for handler in self.HANDLERS:
-                handler(self, soup, self._pre(parts), is_main_page, page.name)
-
-            # If a page is a redirect page, add a forward link
-            redirect = page.metadata.get('X-Redirect')
-            if redirect:
-                self.handle_redirect_page(soup, self._pre(parts), redirect)
-
-            content = str(soup)
-
-            self._write_file(path.join(FOLDER, 'files', '%s.html' %
-                                                   self.fix_path(page.name)), content)
-
-            if is_main_page:
-                content = compile(r'(src|href)="\./([^"]+)"') \
-                    .sub(lambda m: '%s="./files/%s"' %
-                                   (m.groups()[0], m.groups()[1]), content)
-                self._write_file(path.join(FOLDER, 'index.html'), content)
-
-        if len(todo) == 0:
-            percents = []
+                pages[lowered] = page
+
+        fingerprints = self.get_fingerprints(pages.values())
+        if manifest is None:
+            todo = sorted(fingerprints)
         else:
-            percents = list(percentize(len(todo)))
-        for percent, name in zip(percents, todo):
-            _fetch_and_write(name)
-            if verbosity >= 1:
-                pb.update(percent)
+            todo = {name for name, fingerprint in fingerprints.items()
+                    if manifest.get(name) != fingerprint}
+            # links to created or deleted pages change
+            created = set(fingerprints) - set(manifest)
+            deleted = set(manifest) - set(fingerprints)
+            if created or deleted:
+                linking = MetaData.objects.filter(key='X-Link', value__in=created | deleted) \
+                                          .values_list('page__name', flat=True)
+                todo.update(name for name in linking if name in fingerprints)
+            for name in deleted:
+                pth = path.join(FOLDER, 'files', '%s.html' % self.fix_path(name))
+                if path.exists(pth):
+                    unlink(pth)
+            todo = sorted(todo)
+
+        self.write_pages(todo, user, jobs)
+
+        self._write_file(path.join(FOLDER, MANIFEST), json.dumps({
+            'images': INCLUDE_IMAGES,
+            'pages': fingerprints,
+        }))
 
         if verbosity >= 1:
-            print("\nCreated Wikisnapshot with %s pages; excluded %s pages"
-                % (len(todo), num_excluded))
+            print("\nCreated Wikisnapshot with %s pages, wrote %s pages; excluded %s pages"
+                % (len(fingerprints), len(todo), num_excluded))
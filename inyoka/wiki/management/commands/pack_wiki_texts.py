@@ -0,0 +1,39 @@
+"""
+    inyoka.wiki.management.commands.pack_wiki_texts
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Stores the texts of old wiki revisions as deltas against the next newer
+    text of the page, see `TextManager.pack`.  Can be run again at any time
+    to pack the revisions created in the meantime.
+
+    :copyright: (c) 2007-2025 by the Inyoka Team, see AUTHORS for more details.
+    :license: BSD, see LICENSE for more details.
+"""
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from inyoka.wiki.models import Page, Text
+
+
+class Command(BaseCommand):
+    help = 'Store the texts of old wiki revisions as deltas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('pages', nargs='*', metavar='PAGE',
+            help='Names of the pages to pack, all pages by default.')
+
+    def handle(self, *args, **options):
+        pages = Page.objects.annotate(revision_count=Count('revisions')) \
+                            .filter(revision_count__gt=1) \
+                            .order_by('name')
+        if options['pages']:
+            pages = pages.filter(name__in=options['pages'])
+
+        packed = 0
+        for page in pages:
+            count = Text.objects.pack(page)
+            if count and options['verbosity'] >= 2:
+                self.stdout.write(f'{page.name}: {count} texts')
+            packed += count
+
+        self.stdout.write(f'{packed} texts stored as delta')
@@ -0,0 +1,24 @@
+# Generated by Django 5.2 on 2025-12-10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wiki', '0008_create_wiki_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='text',
+            name='base',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='wiki.text'),
+        ),
+        migrations.AddField(
+            model_name='text',
+            name='delta',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
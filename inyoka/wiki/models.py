@@ -82,13 +82,14 @@ import time
 from collections import defaultdict
 from functools import partial
 from hashlib import sha1
+from uuid import uuid4
 
 import magic
 from django.apps import apps
 from django.conf import settings
 from django.core.cache import cache
-from django.db import models
-from django.db.models import Count
+from django.db import models, transaction
+from django.db.models import Count, OuterRef, Subquery
 from django.db.models.functions import Upper
 from django.template.loader import render_to_string
 from django.utils import timezone as dj_timezone
@@ -100,11 +101,18 @@ from werkzeug.utils import secure_filename
 
 from inyoka.markup import base as markup
 from inyoka.markup import nodes, templates
+from inyoka.markup.cache import PARSER_VERSION, instruction_cache
 from inyoka.markup.parsertools import MultiMap
 from inyoka.utils.database import InyokaMarkupField
 from inyoka.utils.dates import datetime_to_timezone, format_datetime
 from inyoka.utils.decorators import deferred
-from inyoka.utils.diff3 import generate_udiff, get_close_matches, prepare_udiff
+from inyoka.utils.delta import apply_delta, make_delta
+from inyoka.utils.diff3 import (
+    generate_udiff_hunks,
+    get_close_matches,
+    join_udiff,
+    prepare_udiff,
+)
 from inyoka.utils.highlight import highlight_code
 from inyoka.utils.html import striptags
 from inyoka.utils.local import local as local_cache
@@ -112,12 +120,15 @@ from inyoka.utils.logger import logger
 from inyoka.utils.text import (
     get_pagetitle,
     join_pagename,
+    normalize_pagename,
     wiki_slugify,
 )
 from inyoka.utils.urls import href
 from inyoka.wiki.exceptions import CaseSensitiveException
 from inyoka.wiki.tasks import (
+    prepare_diff,
     render_one_revision,
+    render_thumbnails,
     update_page_by_slug,
     update_related_pages,
 )
@@ -125,6 +136,12 @@ from inyoka.wiki.tasks import (
 # maximum number of bytes for metadata.  everything above is truncated
 MAX_METADATA = 2 << 8
 
+# the keys of the lines of `Diff.template_diff`
+DIFF_LINE_KEYS = ('old_lineno', 'new_lineno', 'action', 'line')
+
+# the `PageIndex` of this process, see `PageManager.get_page_index`
+_page_index = None
+
 
 def is_privileged_wiki_page(name):
     return any(name.startswith(n) for n in settings.WIKI_PRIVILEGED_PAGES)
@@ -133,6 +150,23 @@ def is_privileged_wiki_page(name):
 to_page_by_slug_key = lambda name: f'wiki/page_by_slug/{wiki_slugify(name)}'
 
 
+class PageIndex:
+    """
+    Immutable snapshot of the slugified names of all existing pages (without
+    attachments).  `version` identifies the generation of the snapshot.
+    """
+
+    def __init__(self, version, slugs):
+        self.version = version
+        self.slugs = frozenset(slugs)
+
+    def __contains__(self, name):
+        return wiki_slugify(name) in self.slugs
+
+    def __len__(self):
+        return len(self.slugs)
+
+
 class PageManager(models.Manager):
     """
     Because our table definitions are rather complex due to shared text,
@@ -144,18 +178,61 @@ class PageManager(models.Manager):
 
     def exists(self, name, cached=True):
         """
-        Returns `True` if `name` exists, the results are cached in a
-        request local object to avoid cache or db requests if possible.
+        Returns `True` if `name` exists, the lookup uses the `PageIndex` of
+        this process to avoid cache or db requests if possible.
 
         `name` gets slugified with `wiki_slugify()` before.
         """
         if cached:
-            if not hasattr(local_cache, 'slug_list'):
-                local_cache.slug_list = self.get_slug_list()
-            slug_list = local_cache('slug_list')
-        else:
-            slug_list = self.get_slug_list()
-        return wiki_slugify(name) in slug_list
+            return name in self.get_page_index()
+        return wiki_slugify(name) in self.get_slug_list()
+
+    def exists_many(self, names):
+        """
+        Return the set of the names in `names` that exist.  Like `exists`
+        but the index is only looked up once.
+        """
+        index = self.get_page_index()
+        return {name for name in names if name in index}
+
+    def get_page_index(self):
+        """
+        Return the `PageIndex` of all existing pages.
+
+        The index is kept per process and is only rebuilt if the version
+        stored in the cache changed, see `invalidate_page_index`.  The
+        version is checked once per request.
+        """
+        global _page_index
+        index = getattr(local_cache, 'wiki_page_index', None)
+        if index is None:
+            version = cache.get_or_set('wiki/page_index_version', lambda: uuid4().hex, None)
+            index = _page_index
+            if index is None or index.version != version:
+                index = _page_index = PageIndex(version, self.get_slug_list())
+            local_cache.wiki_page_index = index
+        return index
+
+    def invalidate_page_index(self):
+        """
+        Drop the cached page lists and force every process to rebuild its
+        `PageIndex`.
+
+        Inside of a transaction this is repeated once it is committed, as
+        other processes may have cached the lists without the changes in
+        the meantime.
+        """
+        self._clear_page_lists()
+        if transaction.get_connection().in_atomic_block:
+            transaction.on_commit(self._clear_page_lists)
+
+    def _clear_page_lists(self):
+        cache.delete_pattern('wiki/objects_*')
+        cache.set('wiki/page_index_version', uuid4().hex, None)
+        try:
+            delattr(local_cache, 'wiki_page_index')
+        except AttributeError:
+            pass
 
     def get_head(self, name, offset=0):
         """
@@ -347,7 +424,7 @@ class PageManager(models.Manager):
         if not owners:
             return []
         pages = MetaData.objects.filter(key='X-Owner', value__in=owners)\
-                                .values_list('page__name')
+                                .values_list('page__name', flat=True)
         return set(pages)
 
     def get_orphans(self):
@@ -509,18 +586,102 @@ class PageManager(models.Manager):
 
         return attachment.file.name
 
-    def render_all_pages(self) -> None:
+    def update_meta(self, pages) -> None:
+        """
+        Update the metadata and crosslinks of `pages` from their most recent
+        revisions, see `Page.update_meta`.
+
+        The revisions and the current metadata of all pages are fetched at
+        once and the difference is applied with a single DELETE and a single
+        INSERT in one transaction.
+        """
+        pages = {page.id: page for page in pages}
+        latest = Revision.objects.filter(page=OuterRef('pk')).order_by('-change_date')
+        revision_ids = self.filter(id__in=list(pages)) \
+                           .annotate(latest_rev=Subquery(latest.values('id')[:1])) \
+                           .values_list('id', 'latest_rev')
+        revisions = Revision.objects.select_related('text') \
+                                    .in_bulk([rev_id for __, rev_id in revision_ids if rev_id])
+
+        new_metadata = {}
+        for page_id, rev_id in revision_ids:
+            if rev_id:
+                new_metadata[page_id] = pages[page_id].find_metadata(revisions[rev_id])
+
+        to_remove = []
+        for id, page_id, key, value in MetaData.objects.filter(page__in=list(new_metadata)) \
+                                                       .values_list('id', 'page', 'key', 'value'):
+            item = (key, value)
+            if item in new_metadata[page_id]:
+                new_metadata[page_id].remove(item)
+            else:
+                to_remove.append(id)
+
+        to_add = [MetaData(page=pages[page_id], key=key, value=value)
+                  for page_id, metadata in new_metadata.items()
+                  for key, value in metadata]
+        if not to_remove and not to_add:
+            return
+        with transaction.atomic():
+            if to_remove:
+                MetaData.objects.filter(id__in=to_remove).delete()
+            MetaData.objects.bulk_create(to_add)
+
+    def render_all_pages(self, force: bool = False) -> None:
         """
         This method will rerender all wiki pages (only the newest revision of them and only non-privileged ones).
         If run on a schedule, it can guarantee that an up-to-date version is in the cache.
 
-        If a page is already in the cache, the cache entry will be dropped before rendering it.
+        Pages that did not change since they were rendered last are skipped,
+        see `render_pages`.  Pass `force` to render all pages again, for
+        example after macros changed.
+
+        The `render_all_pages` task renders the pages in parallel batches instead.
+        """
+        if force:
+            self.start_render_epoch()
+        self.render_pages(self.get_page_list(exclude_privileged=True))
 
-        The metadata of each page is also updated.
+    def get_render_epoch(self) -> str:
+        """
+        Return the current render epoch.  Pages rendered in an older epoch are
+        rendered again by `render_pages`.
         """
-        page_list = self.get_page_list(exclude_privileged=True)
+        epoch = cache.get_or_set('wiki/render_epoch', lambda: uuid4().hex, None)
+        return f'{epoch}/{PARSER_VERSION}'
+
+    def start_render_epoch(self) -> None:
+        """Make `render_pages` render all pages again."""
+        cache.set('wiki/render_epoch', uuid4().hex, None)
+
+    def get_render_fingerprint(self, page, epoch: str) -> str:
+        """
+        Return a string that changes whenever `page` has to be rendered again:
+        If the page or one of the templates it includes gets a new revision
+        or if a new render epoch starts.
+        """
+        templates = MetaData.objects.filter(page=page.id, key='X-Attach').values('value')
+        dependencies = self.filter(name__in=templates).values_list('name', 'last_rev_id')
+        return '{epoch}/{revision}/{dependencies}'.format(
+            epoch=epoch,
+            revision=page.rev.id,
+            dependencies=','.join(f'{name}:{revision}' for name, revision in sorted(dependencies)),
+        )
 
-        for name in page_list:
+    def render_pages(self, names) -> int:
+        """
+        Rerender the pages with the names `names` and update their metadata.
+        Return the number of pages that were rendered.
+
+        A page is skipped if neither the page nor its templates changed since
+        it was rendered last (see `get_render_fingerprint`) and the rendered
+        text is still in the cache.  So an interrupted run of
+        `render_all_pages` resumes where it stopped.
+        """
+        epoch = self.get_render_epoch()
+        rendered = 0
+
+        for name in names:
             try:
                 page = self.get_by_name(name, exclude_privileged=True)
             except CaseSensitiveException as e:
@@ -532,10 +693,16 @@ class PageManager(models.Manager):
                 # page is an attachment
                 continue
 
-            page.update_meta()
+            key = f'wiki/render_fingerprint/{page.id}'
+            if (cache.get(key) == self.get_render_fingerprint(page, epoch) and
+                    page.rev.text.is_value_in_cache()[0]):
+                continue
 
             page.rev.text.remove_value_from_cache()
 
+            # parses the text and caches the instructions for the rendering
+            page.update_meta()
+
             logger.info(f'# Start rendering {name}')
             start = time.perf_counter()
 
@@ -546,6 +713,12 @@ class PageManager(models.Manager):
             time_delta = end - start
             logger.info(f' Finished {name}, took {time_delta} seconds')
 
+            # update_meta may have found other templates
+            cache.set(key, self.get_render_fingerprint(page, epoch), None)
+            rendered += 1
+
+        return rendered
+
     def create(self, name, text, user=None, change_date=None,
                note=None, attachment=None, attachment_filename=None,
                deleted=False, remote_addr=None, update_meta=True):
@@ -654,7 +827,7 @@ class PageManager(models.Manager):
             lower_names = [name.lower() for name in names]
             cache.delete_many([f'wiki/page/{name}' for name in lower_names])
             cache.delete_many([to_page_by_slug_key(name) for name in lower_names])
-        cache.delete_pattern('wiki/objects_*')
+        self.invalidate_page_index()
         update_page_by_slug.delay()
 
 
@@ -675,6 +848,69 @@ class TextManager(models.Manager):
         return models.Manager.get_or_create(self, hash=hash,
                                             defaults={'value': value})
 
+    def reconstruct(self, text):
+        """
+        Return the value of `text` that is stored as a delta against the
+        text `text.base`.  Recently reconstructed values are cached.
+        """
+        key = f'wiki/text/{text.id}'
+        value = cache.get(key)
+        if value is None:
+            # reconstructs the base text as well, if necessary
+            base = self.get(id=text.base_id)
+            value = apply_delta(base.value, bytes(text.delta))
+            cache.set(key, value, settings.WIKI_CACHE_TIMEOUT)
+        return value
+
+    def pack(self, page):
+        """
+        Store the texts of old revisions of `page` as deltas against the text
+        of the next newer revision.  Return the number of texts stored as a
+        delta.
+
+        After ``WIKI_TEXT_SNAPSHOT_INTERVAL`` deltas a text is stored in full
+        again, so that reconstructing a text never needs more than that many
+        steps.  Texts that are the most recent text of a page or that are
+        used by other pages too are always stored in full.
+        """
+        text_ids = page.revisions.order_by('-id').values_list('text_id', flat=True)
+        # every text by its most recent revision, newest first
+        text_ids = list(dict.fromkeys(text_ids))
+
+        shared = set(Revision.objects.filter(text__in=text_ids)
+                                     .values('text')
+                                     .annotate(pages=Count('page', distinct=True))
+                                     .filter(pages__gt=1)
+                                     .values_list('text', flat=True))
+        heads = set(Page.objects.filter(last_rev__text__in=text_ids)
+                                .values_list('last_rev__text', flat=True))
+        texts = self.in_bulk(text_ids)
+
+        packed = 0
+        base = None
+        depth = 0
+        with transaction.atomic():
+            for text_id in text_ids:
+                text = texts[text_id]
+                delta = None
+                if (base is not None and text_id not in shared and text_id not in heads
+                        and depth < settings.WIKI_TEXT_SNAPSHOT_INTERVAL):
+                    delta = make_delta(base.value, text.value)
+                    if len(delta) >= len(text.value.encode('utf-8')):
+                        delta = None
+
+                if delta is not None:
+                    self.filter(id=text_id).update(value='', base=base, delta=delta)
+                    depth += 1
+                    packed += 1
+                else:
+                    if text.base_id is not None:
+                        text.unpack()
+                    depth = 0
+                base = text
+
+        return packed
+
 
 class RevisionManager(models.Manager):
     """Helper manager for revisions"""
@@ -723,16 +959,48 @@ class Diff:
         self.page = page
         self.old_rev = old
         self.new_rev = new
-        self.udiff = generate_udiff(old.text.value, new.text.value,
-                                    '%s (%s)' % (
+        hunks, chunks = self.prepare(old.text, new.text)
+        if hunks:
+            self.udiff = join_udiff(hunks, '%s (%s)' % (
                                         page.name,
                                         format_datetime(old.change_date)
                                     ), '%s (%s)' % (
                                         page.name,
                                         format_datetime(new.change_date)
                                     ))
-        diff = prepare_udiff(self.udiff)
-        self.template_diff = diff and diff[0] or {}
+        else:
+            self.udiff = ''
+        self.template_diff = chunks and {
+            'filename': page.name.split(None, 1)[0],
+            'old_revision': _('Old'),
+            'new_revision': _('New'),
+            'chunks': [[dict(zip(DIFF_LINE_KEYS, line)) for line in chunk]
+                       for chunk in chunks],
+        } or {}
+
+    @staticmethod
+    def prepare(old_text, new_text):
+        """
+        Return the hunks of the udiff between the two `Text` objects and the
+        chunks for the template, where every line is a tuple of the values
+        for `DIFF_LINE_KEYS`.
+
+        The result is cached by the hashes of the texts, the
+        `prepare_diff` task fills the cache for new revisions.
+        """
+        key = f'wiki/diff/{old_text.hash}/{new_text.hash}'
+        result = cache.get(key)
+        if result is None:
+            hunks = '\n'.join(generate_udiff_hunks(old_text.value, new_text.value))
+            chunks = []
+            if hunks:
+                diff = prepare_udiff(join_udiff(hunks))
+                if diff:
+                    chunks = [[tuple(line[key] for key in DIFF_LINE_KEYS) for line in chunk]
+                              for chunk in diff[0]['chunks']]
+            result = (hunks, chunks)
+            cache.set(key, result, settings.WIKI_DIFF_CACHE_TIMEOUT)
+        return result
 
     def render(self):
         """
@@ -771,6 +1039,24 @@ class Text(models.Model):
     objects = TextManager()
     value = InyokaMarkupField(application='wiki')
     hash = models.CharField(max_length=40, unique=True, db_index=True)
+    #: if set, `value` is stored as `delta` against this text, see
+    #: `TextManager.pack`
+    base = models.ForeignKey('self', null=True, blank=True, related_name='+',
+                             on_delete=models.PROTECT)
+    delta = models.BinaryField(null=True, blank=True)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if instance.__dict__.get('base_id') is not None and 'delta' in instance.__dict__:
+            instance.value = cls.objects.reconstruct(instance)
+        return instance
+
+    def unpack(self):
+        """Store this text in full again."""
+        Text.objects.filter(id=self.id).update(value=self.value, base=None, delta=None)
+        self.base = None
+        self.delta = None
 
     # TODO: Remove this method. It is not used for the real rendering!
     def parse(self, template_context=None, transformers=None):
@@ -788,28 +1074,12 @@ class Text(models.Model):
         """
         Return all sort of metadata that is available on this page.  This
         includes links, commented metadata and the simplified text.
-        """
-        tree = self.parse()
-        links = []
-        metadata = []
 
-        def walk(node):
-            for child in node.children:
-                if child.is_container:
-                    walk(child)
-                if child.__class__ is nodes.InternalLink:
-                    # the leading slash enforces an absolute link.
-                    links.append('/' + child.page)
-                elif child.__class__ is nodes.MetaData:
-                    for value in child.values:
-                        metadata.append((child.key, value))
-        walk(tree)
-
-        return {
-            'links': links,
-            'metadata': metadata,
-            'text': tree.text
-        }
+        The metadata is taken from the same parse as the rendered text, see
+        `inyoka.markup.cache.find_meta`.
+        """
+        field = self._meta.get_field('value')
+        return instruction_cache.get_meta(self.value, 'html', field.force_existing)
 
     def get_value_render_context_kwargs(self):
         """
@@ -931,19 +1201,35 @@ class Page(models.Model):
         """`True` if this is the main page."""
         return self.name == settings.WIKI_MAIN_PAGE
 
-    def update_meta(self):
+    def find_thumbnails(self):
         """
-        Update page metadata and crosslinks. This method always operates on the
-        most recent revision, never on the revision attached to the page. If
-        there is no revision in the database yet this method fails silently.
+        Return a set of ``(target, width, height)`` tuples of all pictures
+        with a size on the most recent revision of this page.  Pictures
+        included by templates are not found.
+        """
+        from inyoka.wiki.macros import Picture
 
-        Thus, the page create method has to call this after the revision was
-        saved manually.
+        thumbnails = set()
+
+        def walk(node):
+            for child in node.children:
+                if child.__class__ is nodes.Macro and \
+                   isinstance(child.macro, Picture) and \
+                   (child.macro.width or child.macro.height):
+                    target = normalize_pagename(child.macro.target, True)
+                    thumbnails.add((join_pagename(self.name, target),
+                                    child.macro.width, child.macro.height))
+                elif child.is_container:
+                    walk(child)
+        walk(self.last_rev.text.parse())
+        return thumbnails
+
+    def find_metadata(self, rev):
+        """
+        Return the set of ``(key, value)`` metadata of the revision `rev` of
+        this page as it is stored by `update_meta`.  Links and attachment
+        targets are absolute.
         """
-        try:
-            rev = self.revisions.latest()
-        except Revision.DoesNotExist:
-            return
         meta = rev.text.find_meta()
 
         # regular metadata and links
@@ -958,34 +1244,28 @@ class Page(models.Model):
         # add links as x-links
         new_metadata.update(('X-Link', link) for link in meta['links'])
 
-        # make links and attachment targets absolute
-        for t in list(new_metadata):
-            key, value = t
-            if key in ('X-Link', 'X-Attach'):
-                if t in new_metadata:
-                    new_metadata.remove(t)
-                new_metadata.add((key, join_pagename(self.name, value)))
-
-        qs = MetaData.objects.filter(page=self.id) \
-                             .values_list('id', 'key', 'value')
-        to_remove = []
-
-        for id, key, value in qs:
-            item = (key, value)
-            if item in new_metadata:
-                new_metadata.remove(item)
-            else:
-                to_remove.append(id)
-
-        if to_remove:
-            MetaData.objects.filter(id__in=to_remove).delete()
-
+        result = set()
         for key, value in new_metadata:
             # ignore keys that do not fetch into the column length.
             # Most commonly such metadata entries are broken comments...
             if len(key) > 30:
                 continue
-            MetaData(page=self, key=key, value=value[:MAX_METADATA]).save()
+            # make links and attachment targets absolute
+            if key in ('X-Link', 'X-Attach'):
+                value = join_pagename(self.name, value)
+            result.add((key, value[:MAX_METADATA]))
+        return result
+
+    def update_meta(self):
+        """
+        Update page metadata and crosslinks. This method always operates on the
+        most recent revision, never on the revision attached to the page. If
+        there is no revision in the database yet this method fails silently.
+
+        Thus, the page create method has to call this after the revision was
+        saved manually.  Use `PageManager.update_meta` for many pages.
+        """
+        Page.objects.update_meta([self])
 
     def update_related_pages(self, update_meta: bool=True) -> None:
         """
@@ -1001,16 +1281,23 @@ class Page(models.Model):
                         .filter(metadata__key__in=('X-Link', 'X-Attach'),
                                 metadata__value=self.name)
 
+        related_pages = list(related_pages)
         for p in related_pages:
             cache.delete(f'wiki/page/{p.name.lower()}')
             p.last_rev.text.remove_value_from_cache()
-            if update_meta:
-                p.update_meta()
 
         cache.delete(f'wiki/page/{self.name.lower()}')
         self.last_rev.text.remove_value_from_cache()
         if update_meta:
-            self.update_meta()
+            Page.objects.update_meta(related_pages + [self])
+
+        # only pages that include something can have pictures with a size
+        page_ids = MetaData.objects.filter(page__in=[p.id for p in related_pages] + [self.id],
+                                           key='X-Attach') \
+                                   .values_list('page', flat=True).distinct()
+        page_ids = list(page_ids)
+        if page_ids:
+            render_thumbnails.delay(page_ids)
 
     def save(self, update_meta=True, *args, **kwargs):
         """
@@ -1018,9 +1305,10 @@ class Page(models.Model):
         bound to the page object.  If you don't want to save the
         revision set it to `None` before calling `save()`.
         """
-        if self.id is None:
-            Page.objects.clean_cache()
+        created = self.id is None
         models.Model.save(self)
+        if created:
+            Page.objects.clean_cache()
         if self.rev is not None:
             self.rev.save()
         deferred.clear(self)
@@ -1142,6 +1430,8 @@ class Page(models.Model):
                             attachment=attachment, deleted=deleted,
                             remote_addr=remote_addr)
         self.rev.save()
+        if rev is not None and rev.text_id != text.id:
+            transaction.on_commit(partial(prepare_diff.delay, rev.text_id, text.id))
         self.last_rev = self.rev
         self.save(update_meta=update_meta)
 
@@ -1402,6 +1692,9 @@ class Revision(models.Model):
 
     def save(self, *args, **kwargs):
         """Save the revision and invalidate the cache."""
+        if self._state.adding and self.text.base_id is not None:
+            # the text of the most recent revision is always stored in full
+            self.text.unpack()
         models.Model.save(self, *args, **kwargs)
 
         cache.delete(f'wiki/page/{self.page.name.lower()}')
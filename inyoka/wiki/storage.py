@@ -64,6 +64,11 @@ class StorageManager:
                 delattr(local_cache, key)
             except AttributeError:
                 pass
+        # the compiled rules of `inyoka.wiki.acl.get_matcher`
+        try:
+            delattr(local_cache, 'wiki_acl_matcher')
+        except AttributeError:
+            pass
 
 
 class BaseStorage:
@@ -104,6 +109,8 @@ class BaseStorage:
 
         self.data = self.combine_data(objects)
         cache.set(key, self.data, settings.WIKI_CACHE_TIMEOUT)
+        # keep the very same object for the request, `get_matcher` relies on it
+        setattr(local_cache, local_key, self.data)
 
     def find_block(self, text):
         """Helper method that finds a processable block in the text."""
@@ -12,7 +12,7 @@ from collections import OrderedDict
 from datetime import timedelta
 from os import path, remove
 
-from celery import shared_task
+from celery import group, shared_task
 from django.conf import settings
 from django.core.cache import cache
 from django.db.models.functions import Now
@@ -70,6 +70,42 @@ def update_related_pages(page_id: int, update_meta: bool=True) -> None:
     page.update_related_pages(update_meta=update_meta)
 
 
+@shared_task
+def render_thumbnails(page_ids):
+    """
+    Renders the thumbnails of all pictures with a size on the pages, so that
+    the pages don't have to render them while they are viewed.
+    """
+    from inyoka.wiki.models import Page
+
+    thumbnails = set()
+    for page in Page.objects.select_related('last_rev__text').filter(id__in=page_ids):
+        thumbnails.update(page.find_thumbnails())
+
+    if thumbnails:
+        group(render_thumbnail.si(target, width, height)
+              for target, width, height in sorted(thumbnails)).apply_async()
+
+
+@shared_task
+def render_thumbnail(target, width, height):
+    from inyoka.wiki.views import fetch_real_target
+    fetch_real_target(target, width=width, height=height)
+
+
+@shared_task
+def prepare_diff(old_text_id: int, new_text_id: int) -> None:
+    """
+    Computes the diff between two texts, so that it's already cached when
+    the diff of a new revision is viewed.
+    """
+    from inyoka.wiki.models import Diff, Text
+    texts = Text.objects.in_bulk([old_text_id, new_text_id])
+    old_text, new_text = texts.get(old_text_id), texts.get(new_text_id)
+    if old_text is not None and new_text is not None:
+        Diff.prepare(old_text, new_text)
+
+
 @shared_task
 def update_recentchanges():
     """
@@ -103,12 +139,29 @@ def update_recentchanges():
 
 
 @shared_task
-def render_all_pages():
+def render_all_pages(force=False):
     """
     Prerenders all wiki pages.
+
+    The pages are split into batches of ``WIKI_RENDER_BATCH_SIZE`` pages that
+    are rendered by parallel `render_pages` tasks.  Unchanged pages are
+    skipped, pass `force` to render all of them again.
     """
     from inyoka.wiki.models import Page
-    Page.objects.render_all_pages()
+
+    if force:
+        Page.objects.start_render_epoch()
+
+    names = Page.objects.get_page_list(exclude_privileged=True)
+    size = settings.WIKI_RENDER_BATCH_SIZE
+    group(render_pages.si(names[index:index + size])
+          for index in range(0, len(names), size)).apply_async()
+
+
+@shared_task
+def render_pages(names):
+    from inyoka.wiki.models import Page
+    Page.objects.render_pages(names)
 
 
 @shared_task
@@ -31,7 +31,7 @@ from django.utils.translation import gettext as _
 from inyoka.utils.dates import _localtime
 from inyoka.utils.feeds import InyokaAtomFeed
 from inyoka.utils.http import templated
-from inyoka.utils.imaging import get_thumbnail
+from inyoka.utils.imaging import get_shared_thumbnail
 from inyoka.utils.text import join_pagename, normalize_pagename
 from inyoka.utils.urls import href, is_safe_domain, url_for
 from inyoka.wiki.acl import has_privilege
@@ -93,25 +93,47 @@ def get_attachment(request):
     return HttpResponseRedirect(target)
 
 
+def get_thumbnail_key(filename, dimension):
+    """
+    Return the cache key of the thumbnail index, see `fetch_real_target`,
+    or `None` if the file does not exist.  The key contains the modification
+    time and the size of the file, like the content hash of the thumbnail.
+    """
+    try:
+        stat = os.stat(os.path.join(settings.MEDIA_ROOT, filename))
+    except OSError:
+        return None
+    filename = force_str(filename).encode('utf-8')
+    return 'wiki/thumbnail/%s/%d/%d/%s' % (sha1(filename).hexdigest(), stat.st_mtime_ns,
+                                           stat.st_size, dimension)
+
+
 def fetch_real_target(target, width=None, height=None, force=False):
-    """Return the uri to a image"""
+    """
+    Return the uri to a image.
+
+    Thumbnails are looked up in an index in the cache, which is filled by
+    the `render_thumbnails` task after a page was saved.  Missing thumbnails
+    are rendered right away.
+    """
 
     if height or width:
         page_filename = Page.objects.attachment_for_page(target)
         if page_filename is None:
             return
 
-        page_filename = force_str(page_filename).encode('utf-8')
-        partial_hash = sha1(page_filename).hexdigest()
-
         dimension = '%sx%s%s' % (width or '',
                                  height or '',
-                                 force and '!' or '')
-        hash = '%s%s%s' % (partial_hash, 'i',
-                           dimension.replace('!', 'f'))
-        base_filename = os.path.join('wiki', 'thumbnails', hash[:1],
-                                     hash[:2], hash)
-        thumbnail = get_thumbnail(page_filename.decode(), base_filename, width, height, force)
+                                 force and 'f' or '')
+        key = get_thumbnail_key(page_filename, dimension)
+        if key is None:
+            return
+        thumbnail = cache.get(key)
+        if thumbnail is None:
+            thumbnail = get_shared_thumbnail(page_filename, os.path.join('wiki', 'thumbnails'),
+                                             width, height, force)
+            if thumbnail is not None:
+                cache.set(key, thumbnail, settings.WIKI_THUMBNAIL_INDEX_TIMEOUT)
 
         target = urljoin(settings.MEDIA_URL, thumbnail)
     else:
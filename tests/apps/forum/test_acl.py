@@ -0,0 +1,119 @@
+"""
+    tests.apps.forum.test_acl
+    ~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Test the precomputed forum privileges.
+
+    :copyright: (c) 2011-2025 by the Inyoka Team, see AUTHORS for more details.
+    :license: BSD, see LICENSE for more details.
+"""
+from django.conf import settings
+from django.contrib.auth.models import Group
+from guardian.shortcuts import assign_perm, remove_perm
+
+from inyoka.forum import acl
+from inyoka.forum.models import Forum
+from inyoka.portal.forms import GroupForumPermissionForm
+from inyoka.portal.user import User
+from inyoka.utils.test import TestCase
+
+
+class TestForumPrivileges(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.register_user('user', 'user@example.test', 'user', False)
+        self.anonymous = User.objects.get_anonymous_user()
+        self.registered = Group.objects.get(name=settings.INYOKA_REGISTERED_GROUP_NAME)
+        self.user.groups.add(self.registered)
+
+        self.category = Forum.objects.create(name='category')
+        self.forum = Forum.objects.create(name='forum', parent=self.category)
+
+        assign_perm('forum.view_forum', self.registered, self.category)
+        assign_perm('forum.view_forum', self.registered, self.forum)
+        assign_perm('forum.add_reply_forum', self.registered, self.forum)
+
+    def test_group_privileges(self):
+        privileges = self.user.forum_privileges()
+
+        self.assertEqual(privileges, {
+            self.category.id: acl.PRIVILEGE_BITS['forum.view_forum'],
+            self.forum.id: acl.PRIVILEGE_BITS['forum.view_forum'] |
+                           acl.PRIVILEGE_BITS['forum.add_reply_forum'],
+        })
+
+    def test_matches_has_perm(self):
+        privileges = self.user.forum_privileges()
+
+        for forum in (self.category, self.forum):
+            for privilege, bit in acl.PRIVILEGE_BITS.items():
+                self.assertEqual(bool(privileges.get(forum.id, 0) & bit),
+                                 self.user.has_perm(privilege, forum))
+
+    def test_user_privileges(self):
+        assign_perm('forum.moderate_forum', self.user, self.forum)
+
+        self.assertTrue(acl.has_privilege(self.user, self.forum, 'forum.moderate_forum'))
+        self.assertFalse(acl.has_privilege(self.user, self.category, 'forum.moderate_forum'))
+
+    def test_cached(self):
+        self.user.forum_privileges()
+
+        with self.assertNumQueries(0):
+            self.user.forum_privileges()
+
+    def test_invalidated_on_permission_change(self):
+        self.assertTrue(acl.has_privilege(self.user, self.forum, 'forum.add_reply_forum'))
+
+        remove_perm('forum.add_reply_forum', self.registered, self.forum)
+
+        self.assertFalse(acl.has_privilege(self.user, self.forum, 'forum.add_reply_forum'))
+
+    def test_invalidated_on_group_change(self):
+        self.assertTrue(acl.has_privilege(self.user, self.forum, 'forum.view_forum'))
+
+        self.user.groups.remove(self.registered)
+
+        self.assertFalse(acl.has_privilege(self.user, self.forum, 'forum.view_forum'))
+
+    def test_inactive_user(self):
+        self.user.status = User.STATUS_BANNED
+
+        self.assertEqual(self.user.forum_privileges(), {})
+
+    def test_superuser(self):
+        self.user.is_superuser = True
+
+        self.assertEqual(self.user.forum_privileges(), {
+            self.category.id: acl.PRIV_ALL,
+            self.forum.id: acl.PRIV_ALL,
+        })
+
+    def test_anonymous_kept_in_process(self):
+        assign_perm('forum.view_forum', self.anonymous, self.forum)
+        self.anonymous.forum_privileges()
+
+        with self.assertNumQueries(0):
+            self.assertTrue(acl.has_privilege(self.anonymous, self.forum, 'forum.view_forum'))
+
+    def test_group_form_materializes_privileges(self):
+        form = GroupForumPermissionForm({
+            f'forum_{self.forum.id}_permissions': ['forum.view_forum'],
+        }, instance=self.registered)
+        self.assertTrue(form.is_valid())
+        form.save()
+
+        with self.assertNumQueries(0):
+            privileges = acl.get_group_privileges([self.registered.id])
+        self.assertEqual(privileges, {
+            self.forum.id: acl.PRIVILEGE_BITS['forum.view_forum'],
+        })
+
+    def test_forums_filtered(self):
+        hidden = Forum.objects.create(name='hidden', parent=self.category)
+
+        self.assertEqual({f.id for f in Forum.objects.get_forums_filtered(self.user)},
+                         {self.category.id, self.forum.id})
+        self.assertEqual(Forum.objects.get_forums_filtered(self.user, reverse=True),
+                         [hidden])
@@ -7,6 +7,7 @@
     :copyright: (c) 2011-2025 by the Inyoka Team, see AUTHORS for more details.
     :license: BSD, see LICENSE for more details.
 """
+import pickle
 from unittest.mock import patch
 
 from django.conf import settings
@@ -14,7 +15,18 @@ from django.core.cache import cache
 from django.core.files.base import ContentFile
 from django.test.utils import override_settings
 
-from inyoka.forum.models import Attachment, Forum, Post, PostRevision, Topic
+from inyoka.forum.models import (
+    Attachment,
+    Forum,
+    ForumTree,
+    Post,
+    PostRevision,
+    ReadStatus,
+    Topic,
+    get_read_status_map,
+    mark_all_forums_read,
+)
+from inyoka.portal.user import User
 from inyoka.utils.test import TestCase
 from tests.apps.forum.forum_test_class import (
     ForumTestCase,
@@ -128,6 +140,72 @@ class TestForumModel(ForumTestCase):
         self.assertURLEqual(forum_url, expected_url)
 
 
+class TestForumTree(ForumTestCase):
+
+    def test_snapshot(self):
+        tree = ForumTree('v', [(4, None, 1), (1, None, 0), (2, 1, 1),
+                               (3, 1, 0), (5, 3, 0)])
+
+        self.assertEqual(tree.ids, (1, 3, 5, 2, 4))
+        self.assertEqual(tree.depths, (0, 1, 2, 1, 0))
+        self.assertEqual(tree.children(1), (3, 2))
+        self.assertEqual(tree.children(None), (1, 4))
+        self.assertEqual(tree.descendants(1), (3, 5, 2))
+        self.assertEqual(tree.descendants(4), ())
+        self.assertEqual(tree.ancestors(5), (3, 1))
+        self.assertEqual(tree.ancestors(1), ())
+        self.assertNotIn(6, tree)
+
+    def test_get_tree_is_reused(self):
+        tree = Forum.objects.get_tree()
+
+        with self.assertNumQueries(0):
+            self.assertIs(Forum.objects.get_tree(), tree)
+
+    def test_get_tree_rebuilt_on_new_forum(self):
+        tree = Forum.objects.get_tree()
+        new_forum = Forum.objects.create(name='new', parent=self.category)
+
+        self.assertIsNot(Forum.objects.get_tree(), tree)
+        self.assertIn(new_forum.id, Forum.objects.get_tree())
+        self.assertIn(new_forum, self.category.children)
+
+    def test_get_tree_kept_on_unrelated_change(self):
+        tree = Forum.objects.get_tree()
+        self.forum.description = 'changed'
+        self.forum.save()
+
+        self.assertIs(Forum.objects.get_tree(), tree)
+
+    def test_get_tree_rebuilt_on_move(self):
+        self.forum.parent = self.category
+        self.forum.save()
+
+        self.assertEqual(self.forum.parents, [self.category])
+        self.assertEqual(self.parent.descendants, [])
+
+    def test_parents_of_forum_missing_in_snapshot(self):
+        Forum.objects.get_tree()
+        # created by another process, this snapshot does not know it yet
+        with patch.object(Forum.objects, 'invalidate_tree'):
+            new_forum = Forum.objects.create(name='new', parent=self.category)
+
+        self.assertEqual(new_forum.parents, [self.category])
+
+    def test_tree_version_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Forum.objects.create(name='new', parent=self.category)
+            version = cache.get('forum/tree_version')
+
+        self.assertNotEqual(cache.get('forum/tree_version'), version)
+
+    def test_children_sorted_by_position(self):
+        second = Forum.objects.create(name='second', parent=self.category,
+                                      position=-1)
+
+        self.assertEqual(self.category.children, [second, self.parent])
+
+
 class TestPostModel(ForumTestCase):
 
     @override_settings(BASE_DOMAIN_NAME='inyoka.local')
@@ -157,6 +235,131 @@ class TestPostModel(ForumTestCase):
         self.assertEqual(post.get_text(), "&#x27;&#x27;&#x27;test&#x27;&#x27;&#x27;")
 
 
+class TestReadStatus(ForumTestCase):
+
+    def test_empty(self):
+        status = ReadStatus(b'')
+
+        self.assertEqual(status.data, {})
+        self.assertFalse(status(self.topic))
+        self.assertFalse(status(self.forum))
+
+    def test_serialize_roundtrip(self):
+        status = ReadStatus(b'')
+        status.data = {self.forum.id: (10, {12, 11}), self.parent.id: (None, {3})}
+
+        serialized = status.serialize()
+
+        self.assertTrue(serialized.startswith(ReadStatus.MAGIC))
+        self.assertEqual(ReadStatus(serialized).data,
+                         {self.forum.id: (10, {11, 12}), self.parent.id: (None, {3})})
+
+    def test_serialize_from_memoryview(self):
+        status = ReadStatus(b'')
+        status.data = {self.forum.id: (10, {12})}
+
+        loaded = ReadStatus(memoryview(status.serialize()))
+
+        self.assertEqual(loaded.data, {self.forum.id: (10, {12})})
+
+    def test_legacy_pickle_format(self):
+        self.topic.refresh_from_db()
+        legacy = pickle.dumps({self.forum.id: (self.topic.last_post_id, set())})
+
+        status = ReadStatus(legacy)
+
+        self.assertTrue(status(self.topic))
+        self.assertTrue(status.serialize().startswith(ReadStatus.MAGIC))
+
+    def test_unsupported_version(self):
+        with self.assertRaises(ValueError):
+            ReadStatus(ReadStatus.MAGIC + b'\xff')
+
+    def test_unchanged_rows_are_kept(self):
+        status = ReadStatus(b'')
+        status.data = {self.forum.id: (10, {12}), self.parent.id: (5, set())}
+        serialized = status.serialize()
+
+        self.assertEqual(ReadStatus(serialized).serialize(), serialized)
+
+    def test_mark_topic(self):
+        self.topic.refresh_from_db()
+        status = ReadStatus(b'')
+
+        self.assertTrue(status.mark(self.topic, self.user))
+        self.assertTrue(status(self.topic))
+        self.assertFalse(status.mark(self.topic, self.user))
+
+    def test_mark_last_topic_marks_forum(self):
+        status = ReadStatus(b'')
+        self.topic.refresh_from_db()
+
+        status.mark(self.topic, self.user)
+
+        self.forum.refresh_from_db()
+        self.assertTrue(status(self.forum))
+
+    def test_mark_topic_with_newer_unread_topic(self):
+        other_topic = Topic.objects.create(title='other', author=self.user,
+                                           forum=self.forum)
+        list(self.addPosts(1, other_topic))
+        self.topic.refresh_from_db()
+        self.topic.forum.children  # warm up the forum cache
+        status = ReadStatus(b'')
+
+        with self.assertNumQueries(0):
+            status.mark(self.topic, self.user)
+
+        self.assertTrue(status(self.topic))
+        self.assertFalse(status(other_topic))
+
+    def test_limit_unread(self):
+        status = ReadStatus(b'')
+        with self.settings(FORUM_LIMIT_UNREAD=4):
+            for post_id in range(1, 6):
+                status._ReadStatus__add_topics_read_state_to_forum(self.forum.id, post_id)
+
+        self.assertEqual(status.data[self.forum.id], (3, {3, 4, 5}))
+
+    def test_bulk_status(self):
+        other_topic = Topic.objects.create(title='other', author=self.user,
+                                           forum=self.forum)
+        list(self.addPosts(1, other_topic))
+        self.topic.refresh_from_db()
+        other_topic.refresh_from_db()
+        self.forum.refresh_from_db()
+        status = ReadStatus(b'')
+        status.mark(self.topic, self.user)
+
+        items = [self.forum, self.topic, other_topic, self.parent]
+        self.assertEqual(status.bulk_status(items),
+                         {item: status(item) for item in items})
+        self.assertEqual(status.bulk_status(items),
+                         {self.forum: False, self.topic: True,
+                          other_topic: False, self.parent: False})
+
+    def test_bulk_status_unknown_type(self):
+        with self.assertRaises(ValueError):
+            ReadStatus(b'').bulk_status([self.user])
+
+    def test_read_status_map_anonymous(self):
+        anonymous = User.objects.get_anonymous_user()
+
+        self.assertEqual(get_read_status_map(anonymous, [self.forum, self.topic]),
+                         {self.forum: True, self.topic: True})
+
+    def test_mark_all_forums_read(self):
+        with self.assertNumQueries(2):
+            mark_all_forums_read(self.user)
+
+        self.user.refresh_from_db()
+        status = ReadStatus(self.user.forum_read_status)
+        self.forum.refresh_from_db()
+        self.topic.refresh_from_db()
+        self.assertTrue(status(self.forum))
+        self.assertTrue(status(self.topic))
+
+
 class TestPostRevisionModel(TestCase):
 
     def test_text_rendered(self):
@@ -339,6 +542,69 @@ class PostDeletionTest(ForumTestCase):
         last_post_ids = [f.last_post_id for f in forums]
         self.assertEqual(last_post_ids, [self.last_post.pk, self.last_post.pk, self.last_post.pk])
 
+    def test_hidden_post_is_skipped(self):
+        Post.objects.filter(pk=self.second_last_post.pk).update(hidden=True)
+
+        Post.objects.get(pk=self.last_post.pk).delete()
+
+        self.forum.refresh_from_db()
+        self.category.refresh_from_db()
+        self.assertEqual(self.forum.last_post_id, self.topic_posts[-3].pk)
+        self.assertEqual(self.category.last_post_id, self.topic_posts[-3].pk)
+
+    def test_last_post_of_other_topic(self):
+        other_topic = Topic.objects.create(title='other', author=self.user, forum=self.parent)
+        other_posts = list(self.addPosts(2, other_topic))
+
+        Post.objects.get(pk=other_posts[-1].pk).delete()
+
+        self.forum.refresh_from_db()
+        self.parent.refresh_from_db()
+        self.category.refresh_from_db()
+        self.assertEqual(self.forum.last_post_id, self.last_post.pk)
+        self.assertEqual(self.parent.last_post_id, other_posts[0].pk)
+        self.assertEqual(self.category.last_post_id, other_posts[0].pk)
+
+
+class TestForumLastPost(ForumTestCase):
+
+    def test_push_keeps_newer_post(self):
+        newer = list(self.addPosts(1))[0]
+
+        Forum.objects.push_last_post([self.forum, self.parent], self.topic_posts[0])
+
+        self.forum.refresh_from_db()
+        self.parent.refresh_from_db()
+        self.assertEqual(self.forum.last_post_id, newer.pk)
+        self.assertEqual(self.parent.last_post_id, newer.pk)
+
+    def test_push_to_empty_forum(self):
+        empty = Forum.objects.create(name='empty', parent=self.category)
+
+        Forum.objects.push_last_post([empty], self.topic_posts[0])
+
+        empty.refresh_from_db()
+        self.assertEqual(empty.last_post_id, self.topic_posts[0].pk)
+
+    def test_update_uses_one_aggregate(self):
+        forums = [self.category, self.parent, self.forum]
+        Forum.objects.get_tree()
+
+        # One grouped aggregate, no update as nothing changed
+        with self.assertNumQueries(2):
+            Forum.objects.update_last_post(forums)
+        self.assertEqual([forum.last_post_id for forum in forums],
+                         [self.topic_posts[-1].pk] * 3)
+
+    def test_update_without_posts(self):
+        Forum.objects.update_last_post([self.category, self.parent, self.forum],
+                                       exclude_topic=self.topic)
+
+        self.category.refresh_from_db()
+        self.forum.refresh_from_db()
+        self.assertIsNone(self.category.last_post_id)
+        self.assertIsNone(self.forum.last_post_id)
+
 
 class TestTopic(ForumTestCase):
 
@@ -354,3 +620,48 @@ class TestTopic(ForumTestCase):
 
         self.topic.delete()
         mock.assert_called_once_with()
+
+
+class TestTopicViews(ForumTestCase):
+
+    def test_touch_is_buffered(self):
+        with self.assertNumQueries(0):
+            self.topic.touch()
+            self.topic.touch()
+
+        self.topic.refresh_from_db()
+        self.assertEqual(self.topic.view_count, 0)
+
+    def test_pending_views_are_shown(self):
+        self.topic.touch()
+        topics = [Topic.objects.get(id=self.topic.id)]
+
+        Topic.objects.add_pending_views(topics)
+
+        self.assertEqual(topics[0].view_count, 1)
+
+    def test_flush(self):
+        other = Topic.objects.create(title='other', author=self.user, forum=self.forum)
+        self.topic.touch()
+        self.topic.touch()
+        other.touch()
+
+        with self.assertNumQueries(1):
+            self.assertEqual(Topic.objects.flush_views(), 2)
+
+        self.topic.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(self.topic.view_count, 2)
+        self.assertEqual(other.view_count, 1)
+        self.assertEqual(Topic.objects.flush_views(), 0)
+
+    def test_flush_failure_keeps_views(self):
+        self.topic.touch()
+
+        with patch.object(Topic.objects, 'filter', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                Topic.objects.flush_views()
+
+        self.assertEqual(Topic.objects.flush_views(), 1)
+        self.topic.refresh_from_db()
+        self.assertEqual(self.topic.view_count, 1)
@@ -0,0 +1,134 @@
+"""
+    tests.apps.forum.test_unread
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Test the index of unread topics.
+
+    :copyright: (c) 2011-2025 by the Inyoka Team, see AUTHORS for more details.
+    :license: BSD, see LICENSE for more details.
+"""
+from unittest.mock import patch
+
+from django.core.cache import cache
+
+from inyoka.forum import acl, unread
+from inyoka.forum.models import Post, Topic
+from inyoka.forum.tasks import add_unread_topic
+from inyoka.forum.unread import UnreadTopics
+from inyoka.portal.user import User
+from tests.apps.forum.forum_test_class import ForumTestCase
+
+
+class TestUnreadTopics(ForumTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user.is_superuser = True
+        self.user.save()
+
+        # run the task of new posts right away
+        patcher = patch('inyoka.forum.tasks.add_unread_topic.delay',
+                        side_effect=add_unread_topic)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.other = Topic.objects.create(title='other', author=self.user, forum=self.forum)
+        list(self.addPosts(1, self.other))
+
+        self.author = User.objects.register_user('author', 'author@example.com', 'pwd', False)
+
+    def new_topic(self, author=None):
+        author = author or self.author
+        topic = Topic.objects.create(title='new', author=author, forum=self.forum)
+        with self.captureOnCommitCallbacks(execute=True):
+            Post.objects.create(text='new', author=author, topic=topic)
+        return topic
+
+    def test_lists_unread_topics(self):
+        topics = UnreadTopics(self.user)
+
+        self.assertEqual(topics[0:10], [self.other.id, self.topic.id])
+        self.assertEqual(topics.count(), 2)
+
+    def test_slices(self):
+        topics = UnreadTopics(self.user)
+
+        self.assertEqual(topics[0:1], [self.other.id])
+        self.assertEqual(topics[1:2], [self.topic.id])
+
+    def test_new_post_added(self):
+        UnreadTopics(self.user)
+
+        topic = self.new_topic()
+        with patch.object(unread, 'build_index') as mock:
+            topics = UnreadTopics(self.user)
+
+        mock.assert_not_called()
+        self.assertEqual(topics[0:10], [topic.id, self.other.id, self.topic.id])
+
+    def test_new_post_moves_topic(self):
+        UnreadTopics(self.user)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Post.objects.create(text='new', author=self.author, topic=self.topic)
+
+        self.assertEqual(UnreadTopics(self.user)[0:10], [self.topic.id, self.other.id])
+
+    def test_new_post_own(self):
+        UnreadTopics(self.user)
+
+        self.new_topic(self.user)
+
+        self.assertEqual(UnreadTopics(self.user)[0:10], [self.other.id, self.topic.id])
+
+    def test_new_post_hidden_forum(self):
+        other_user = User.objects.register_user('other', 'other@example.com', 'pwd', False)
+        UnreadTopics(other_user)
+        # the task computes privileges that are not cached anymore
+        acl.invalidate_user_privileges([other_user.id])
+
+        self.new_topic()
+
+        self.assertEqual(UnreadTopics(other_user).count(), 0)
+
+    def test_remove_read_topics(self):
+        UnreadTopics(self.user)
+        self.user._readstatus.mark(self.other, self.user)
+
+        topics = unread.remove_read_topics(self.user, [self.other, self.topic])
+
+        self.assertEqual(topics, [self.topic])
+        self.assertEqual(UnreadTopics(self.user)[0:10], [self.topic.id])
+
+    def test_read_topic_removed(self):
+        UnreadTopics(self.user)
+
+        self.other.mark_read(self.user)
+
+        self.assertEqual(UnreadTopics(self.user)[0:10], [self.topic.id])
+
+    def test_read_forum_invalidates(self):
+        UnreadTopics(self.user)
+
+        self.forum.refresh_from_db()
+        self.forum.mark_read(self.user)
+
+        self.assertEqual(UnreadTopics(self.user).count(), 0)
+
+    def test_incomplete_index_rebuilt(self):
+        UnreadTopics(self.user)
+        cache.client.get_client().delete(unread._get_key(self.user.id))
+
+        # creates an index that only contains the new topic
+        topic = self.new_topic()
+
+        self.assertEqual(UnreadTopics(self.user)[0:10],
+                         [topic.id, self.other.id, self.topic.id])
+
+    def test_size_limited(self):
+        with self.settings(FORUM_UNREAD_INDEX_SIZE=1):
+            UnreadTopics(self.user)
+            self.assertEqual(UnreadTopics(self.user)[0:10], [self.other.id])
+
+            topic = self.new_topic()
+            self.assertEqual(UnreadTopics(self.user)[0:10], [topic.id])
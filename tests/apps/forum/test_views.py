@@ -175,6 +175,16 @@ class TestViews(AntiSpamTestCaseMixin, TestCase):
                          self.num_topics_on_last_page)
         self.assertTrue(self.client.get("/last24/6/").status_code == 404)
 
+    def test_topiclist__newposts(self):
+        read = Topic.objects.create(title='read Topic', author=self.user, forum=self.forum2)
+        Post.objects.create(text='Post 1', author=self.user, topic=read, position=0)
+        read.refresh_from_db()
+        read.mark_read(self.admin)
+
+        response = self.client.get('/newposts/')
+
+        self.assertEqual(response.context['topics'], [self.topic])
+
     def test_topiclist__content(self):
         topic = Topic.objects.create(title='very old Topic', author=self.user,
                 forum=self.forum2)
@@ -1592,7 +1602,7 @@ class TestPostView(TestCase):
         self.assertEqual(response.status_code, 404)
 
     def test_number_queries(self):
-        with self.assertNumQueries(24):
+        with self.assertNumQueries(21):
             self.client.get(f'/post/{self.post.id}/', follow=True)
 
 
@@ -1643,7 +1653,7 @@ class TestFirstUnreadPost(TestCase):
                              f'http://forum.{settings.BASE_DOMAIN_NAME}/topic/a-test-topic/#post-{post2.id}')
 
     def test_number_queries(self):
-        with self.assertNumQueries(25):
+        with self.assertNumQueries(22):
             self.client.get(f'/topic/{self.topic.slug}/first_unread/', follow=True)
 
     def test_subforum(self):
@@ -1716,7 +1726,7 @@ class TestLastPost(TestCase):
         self.assertEqual(response.status_code, 404)
 
     def test_number_queries(self):
-        with self.assertNumQueries(24):
+        with self.assertNumQueries(21):
             self.client.get(f'/topic/{self.topic.slug}/last_post/', follow=True)
 
 
@@ -1810,7 +1820,7 @@ class TestPostFeed(TestCase):
         self.assertEqual(response.status_code, 200)
 
     def test_queries(self):
-        with self.assertNumQueries(9):
+        with self.assertNumQueries(8):
             self.client.get('/feeds/full/50/')
 
     def test_topic_hidden(self):
@@ -1923,7 +1933,7 @@ class TestPostForumFeed(TestCase):
         self.assertEqual(response.status_code, 200)
 
     def test_queries(self):
-        with self.assertNumQueries(9):
+        with self.assertNumQueries(8):
             self.client.get(f'/feeds/forum/{self.forum.name}/full/50/')
 
     def test_child_forum(self):
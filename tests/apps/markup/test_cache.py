@@ -0,0 +1,142 @@
+"""
+    tests.apps.markup.test_cache
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Test the cache for compiled instruction sets.
+
+    :copyright: (c) 2013-2025 by the Inyoka Team, see AUTHORS for more details.
+    :license: BSD, see LICENSE for more details.
+"""
+from pickle import PicklingError
+from unittest.mock import patch
+
+import freezegun
+from django.test import override_settings
+
+from inyoka.markup import cache as markup_cache
+from inyoka.markup.base import RenderContext, parse
+from inyoka.markup.cache import InstructionCache, render_cached
+from inyoka.markup.machine import Renderer
+from inyoka.utils.test import TestCase
+
+
+class TestCompiledInstructions(TestCase):
+
+    def test_static(self):
+        code = parse("''foo''").compile('html')
+
+        self.assertIsInstance(code, str)
+        self.assertEqual(Renderer(code).render(RenderContext()), '<p><em>foo</em></p>')
+
+    @freezegun.freeze_time('2025-01-02 03:04:05')
+    def test_dynamic(self):
+        node = parse("Heute ist [[Datum()]]")
+        context = RenderContext(application='wiki')
+
+        code = node.compile('html')
+
+        self.assertIsInstance(code, bytes)
+        self.assertEqual(Renderer(code).render(context), node.render(context, 'html'))
+
+
+@override_settings(MARKUP_INSTRUCTION_CACHE_LOCAL_TIMEOUT=60)
+class TestInstructionCache(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.cache = InstructionCache()
+
+    def test_parsed_once(self):
+        with patch.object(markup_cache, 'parse', wraps=parse) as mock:
+            first = self.cache.get_or_compile("''foo''")
+            second = self.cache.get_or_compile("''foo''")
+
+        self.assertEqual(mock.call_count, 1)
+        self.assertEqual(first, second)
+        self.assertEqual(self.cache.stats['misses'], 1)
+        self.assertEqual(self.cache.stats['local_hits'], 1)
+        self.assertEqual(self.cache.hit_rate, 0.5)
+
+    def test_shared_between_processes(self):
+        self.cache.get_or_compile("''foo''")
+        other = InstructionCache()
+
+        with patch.object(markup_cache, 'parse') as mock:
+            other.get_or_compile("''foo''")
+
+        mock.assert_not_called()
+        self.assertEqual(other.stats['shared_hits'], 1)
+
+    def test_key_depends_on_options(self):
+        self.assertNotEqual(self.cache.make_key('foo'),
+                            self.cache.make_key('foo', wiki_force_existing=True))
+        self.assertNotEqual(self.cache.make_key('foo'), self.cache.make_key('bar'))
+
+    @override_settings(MARKUP_INSTRUCTION_CACHE_SIZE=1024)
+    def test_lru_eviction(self):
+        texts = ['%s %s' % (index, 'x' * 30) for index in range(40)]
+        for text in texts:
+            self.cache.get_or_compile(text)
+        self.cache.get_or_compile(texts[-1])
+
+        self.assertLessEqual(self.cache._local_size, 1024)
+        self.assertGreater(self.cache.stats['evictions'], 0)
+        self.assertIn(self.cache.make_key(texts[-1]), self.cache._local)
+        self.assertNotIn(self.cache.make_key(texts[0]), self.cache._local)
+
+    @override_settings(MARKUP_INSTRUCTION_CACHE_SIZE=1024)
+    def test_large_entries_not_kept_locally(self):
+        self.cache.get_or_compile('x' * 1024)
+
+        self.assertEqual(self.cache._local_size, 0)
+
+    def test_invalidate(self):
+        self.cache.get_or_compile("''foo''")
+        self.cache.invalidate("''foo''")
+
+        self.cache.get_or_compile("''foo''")
+        self.assertEqual(self.cache.stats['misses'], 2)
+
+    def test_meta(self):
+        meta = self.cache.get_meta("#tag: foo\n[:Bar:] baz")
+
+        self.assertEqual(meta['links'], ['/Bar'])
+        self.assertEqual(meta['metadata'], [('tag', 'foo')])
+
+    def test_meta_and_instructions_parsed_once(self):
+        with patch.object(markup_cache, 'parse', wraps=parse) as mock:
+            self.cache.get_meta("#tag: foo\n''bar''")
+            self.cache.get_or_compile("#tag: foo\n''bar''")
+            self.cache.get_meta("#tag: foo\n''bar''")
+
+        self.assertEqual(mock.call_count, 1)
+
+    def test_invalidate_meta(self):
+        self.cache.get_meta("#tag: foo")
+        self.cache.invalidate("#tag: foo")
+
+        with patch.object(markup_cache, 'parse', wraps=parse) as mock:
+            self.cache.get_meta("#tag: foo")
+        self.assertEqual(mock.call_count, 1)
+
+    @freezegun.freeze_time('2025-01-02 03:04:05')
+    def test_not_pickleable(self):
+        with patch('inyoka.markup.machine.NodeCompiler.compile',
+                   side_effect=PicklingError('local object')):
+            code = self.cache.get_or_compile("''foo''")
+
+        self.assertEqual(code.render(RenderContext(), 'html'), '<p><em>foo</em></p>')
+
+    def test_compile_error(self):
+        with patch('inyoka.markup.machine.NodeCompiler.compile', side_effect=TypeError), \
+                self.assertRaises(TypeError):
+            self.cache.get_or_compile("''foo''")
+
+    def test_render_cached(self):
+        context = RenderContext(application='wiki')
+        text = "''foo'' [[Datum()]]"
+
+        self.assertEqual(render_cached(text, context),
+                         parse(text).render(context, 'html'))
+        self.assertEqual(render_cached(text, context),
+                         parse(text).render(context, 'html'))
@@ -9,8 +9,9 @@
     :license: BSD, see LICENSE for more details.
 """
 import unittest
+from random import Random
 
-from inyoka.markup.lexer import Lexer
+from inyoka.markup.lexer import Lexer, tokenize_block
 
 lexer = Lexer()
 
@@ -310,3 +311,43 @@ class TestLexer(unittest.TestCase):
     def test_control_characters_stripped(self):
         expect = lexer.tokenize('\x00\x07\x08\x0f').expect
         expect('eof')
+
+
+#: Pieces of markup that are randomly put together to compare the engines
+_markup_pieces = (
+    "'''", "''", '__', '`', '``', '[[', ']]', '(', ')', '[:', '[', ']',
+    ':', '{{{', '}}}', '{{|', '|}}', '||', '<', '>', '\\', '\\\\', '\n', ' ',
+    '= ', '=', '#', '##', '* ', '  * ', '[mark]', '[/mark]',
+    'http://example.com/a', '[color=red]', '[/color]', '((', '))', '--(',
+    ')--', '~-(', ')-~', '[@Vorlage(', '@]', "'a'", '"b"', ',', 'x=', 'text',
+    'ö', '\x01', '<!--', '-->', '----\n', '> ', '#!code ', '[raw]', '[/raw]',
+    '::', '[1]',
+)
+
+_documents = (
+    "= Headline =\n\nSome '''bold''' and ''italic''\n  * list\n  * [:Page:link]\n",
+    "{{{#!code python\nprint(1)\n}}}\n||<-2 cellstyle=\"x\">a||b||\n",
+    "[[Inhaltsverzeichnis(2)]]\n# tag: foo, bar\n[@Vorlage(Getestet, focal) @]\n",
+    "> quoted \\[[BR]] text\n>> deeper [http://example.com label]\n",
+    "{{|<title=\"Box\">\ncontent with [mark]highlight[/mark] \\\\ end|}}",
+)
+
+
+class TestLexerEngines(unittest.TestCase):
+    """The combined lexer has to produce exactly the same tokens."""
+
+    def assertSameTokens(self, text):
+        expected = list(tokenize_block(text, engine='sequential'))
+        expected_stream = list(Lexer('sequential').tokenize(text))
+        self.assertEqual(list(tokenize_block(text, engine='combined')), expected, repr(text))
+        self.assertEqual(list(Lexer('combined').tokenize(text)), expected_stream, repr(text))
+
+    def test_documents(self):
+        for text in _documents:
+            self.assertSameTokens(text)
+
+    def test_random_markup(self):
+        random = Random(42)
+        for __ in range(2000):
+            pieces = random.choices(_markup_pieces, k=random.randint(1, 40))
+            self.assertSameTokens(''.join(pieces))
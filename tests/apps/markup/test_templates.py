@@ -6,11 +6,15 @@
     :license: BSD, see LICENSE for more details.
 """
 import unittest
+from unittest.mock import patch
 
+from django.test import override_settings
 from django.utils import translation
 
 from inyoka.markup import templates
 from inyoka.markup.templates import NoneValue, Value
+from inyoka.utils.test import TestCase
+from inyoka.wiki.models import Page
 
 
 class TestWikiTemplates(unittest.TestCase):
@@ -397,3 +401,43 @@ class TestBinaryFunctions(unittest.TestCase):
 
         context = [('a', '1, 2, a, b, 1.2, 3.4'), ('b', ', ')]
         self.assertEqual(templates.process(code, context), '1X2XaXbX1.2X3.4')
+
+
+@override_settings(WIKI_TEMPLATE_CACHE_SIZE=2)
+class TestCompiledTemplates(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        templates._compiled_templates.clear()
+        self.template = Page.objects.create('Wiki/Templates/greeting',
+                                            'Hello <@ $arguments.0 @>')
+
+    def tearDown(self):
+        templates._compiled_templates.clear()
+        super().tearDown()
+
+    def expand(self, *arguments):
+        context = [('arguments', list(arguments))]
+        return templates.expand_page_template('Wiki/Templates/greeting', context).text
+
+    def test_parsed_once(self):
+        with patch.object(templates, 'Parser', wraps=templates.Parser) as mock:
+            self.assertEqual(self.expand('World'), 'Hello World')
+            self.assertEqual(self.expand('Moon'), 'Hello Moon')
+
+        self.assertEqual(mock.call_count, 1)
+
+    def test_new_revision(self):
+        self.expand('World')
+
+        self.template.edit('Bye <@ $arguments.0 @>', note='changed')
+        self.template = Page.objects.get_by_name('Wiki/Templates/greeting')
+
+        self.assertEqual(self.expand('World'), 'Bye World')
+
+    def test_size_limited(self):
+        for index in range(4):
+            templates.get_compiled_template(('page', index), 'text %d' % index)
+
+        self.assertEqual(list(templates._compiled_templates),
+                         [('page', 2), ('page', 3)])
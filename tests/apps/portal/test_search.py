@@ -0,0 +1,189 @@
+"""
+    tests.apps.portal.test_search
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Test the full-text search.
+
+    :copyright: (c) 2007-2025 by the Inyoka Team, see AUTHORS for more details.
+    :license: BSD, see LICENSE for more details.
+"""
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.conf import settings
+from django.core.management import call_command
+from django.test.utils import override_settings
+from django.utils import timezone as dj_timezone
+from guardian.shortcuts import assign_perm
+
+from inyoka.forum.models import Forum, Post, Topic
+from inyoka.ikhaya.models import Article, Category
+from inyoka.portal import search
+from inyoka.portal.models import SearchDocument, SearchPosting
+from inyoka.portal.user import User
+from inyoka.utils.test import InyokaClient, TestCase
+from inyoka.wiki.acl import MultiPrivilegeTest
+from inyoka.wiki.models import Page
+
+
+class TestSearch(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.register_user('admin', 'admin', 'admin', False)
+        self.admin.is_superuser = True
+        self.admin.save()
+        self.user = User.objects.register_user('user', 'user', 'user', False)
+
+        self.forum = Forum.objects.create(name='forum')
+        self.topic = Topic.objects.create(title='Grub error', author=self.admin, forum=self.forum)
+        self.post = Post.objects.create(text="'''grub''' fails after the kernel update",
+                                        author=self.admin, topic=self.topic)
+        self.page = Page.objects.create('Grub', 'How to repair the grub boot loader')
+        self.article = Article.objects.create(
+            author=self.admin, subject='Released', intro='The new kernel',
+            text='The kernel brings a new grub', public=True,
+            publication_datetime=dj_timezone.now() - timedelta(days=1),
+            category=Category.objects.create(name='News'))
+        search.rebuild_index()
+
+    def search_kinds(self, query, user=None, kinds=None):
+        ids = search.search(query, user or self.admin, kinds)
+        documents = SearchDocument.objects.in_bulk(ids)
+        return [(documents[id].kind, documents[id].object_id) for id in ids]
+
+    def test_tokenize(self):
+        self.assertEqual(search.tokenize("Grub's ÜBER-Boot a"), ['grub', 'über', 'boot'])
+
+    def test_rebuild_index(self):
+        # the default 'Wiki/Index' page is indexed as well
+        self.assertEqual(SearchDocument.objects.count(), 4)
+        document = SearchDocument.objects.get(kind='forum', object_id=self.post.id)
+        self.assertEqual(document.title, 'Grub error')
+        self.assertEqual(document.url, self.post.get_absolute_url())
+        self.assertEqual(document.excerpt, 'grub fails after the kernel update')
+        self.assertEqual(document.forum_id, self.forum.id)
+        self.assertEqual(SearchPosting.objects.get(document=document, term='grub').frequency, 2)
+
+    def test_all_terms_required(self):
+        self.assertEqual(self.search_kinds('kernel grub'),
+                         [('ikhaya', self.article.id), ('forum', self.post.id)])
+        self.assertEqual(self.search_kinds('grub boot'), [('wiki', self.page.id)])
+        self.assertEqual(self.search_kinds('grub unknown'), [])
+        self.assertEqual(self.search_kinds('a'), [])
+
+    def test_ranking(self):
+        ids = search.search('grub', self.admin)
+        self.assertEqual(len(ids), 3)
+        # the longest document with the fewest occurrences is the worst match
+        self.assertEqual(SearchDocument.objects.get(id=ids[-1]).kind, 'ikhaya')
+
+    def test_kinds(self):
+        self.assertEqual(self.search_kinds('grub', kinds=['wiki']), [('wiki', self.page.id)])
+
+    def test_index_object(self):
+        self.post.text = 'kernel panic'
+        self.post.save()
+        search.index_object('forum', self.post.id)
+
+        self.assertEqual(self.search_kinds('panic'), [('forum', self.post.id)])
+        self.assertEqual(self.search_kinds('fails'), [])
+
+    def test_index_object__deleted(self):
+        self.article.delete()
+        search.index_object('ikhaya', self.article.id)
+
+        self.assertFalse(SearchDocument.objects.filter(kind='ikhaya').exists())
+
+    def test_update_topic(self):
+        other = Forum.objects.create(name='other')
+        self.topic.title = 'Boot error'
+        self.topic.forum = other
+        self.topic.save()
+        search.update_topic(self.topic.id)
+
+        document = SearchDocument.objects.get(kind='forum', object_id=self.post.id)
+        self.assertEqual((document.title, document.forum_id), ('Boot error', other.id))
+
+    def test_forum_privileges(self):
+        self.assertEqual(self.search_kinds('grub', user=self.user),
+                         [('wiki', self.page.id), ('ikhaya', self.article.id)])
+
+        assign_perm('forum.view_forum', self.user, self.forum)
+        self.assertIn(('forum', self.post.id), self.search_kinds('grub', user=self.user))
+
+    def test_hidden_posts(self):
+        assign_perm('forum.view_forum', self.user, self.forum)
+        self.topic.hidden = True
+        self.topic.save()
+        search.update_topic(self.topic.id)
+
+        self.assertNotIn(('forum', self.post.id), self.search_kinds('grub', user=self.user))
+        assign_perm('forum.moderate_forum', self.user, self.forum)
+        self.assertIn(('forum', self.post.id), self.search_kinds('grub', user=self.user))
+
+    def test_unpublished_articles(self):
+        self.article.publication_datetime = dj_timezone.now() + timedelta(days=1)
+        self.article.save()
+        search.index_object('ikhaya', self.article.id)
+
+        self.assertEqual(self.search_kinds('released', user=self.user), [])
+        self.assertEqual(self.search_kinds('released'), [('ikhaya', self.article.id)])
+
+    def test_wiki_privileges(self):
+        with patch.object(MultiPrivilegeTest, 'has_privilege', return_value=False):
+            self.assertEqual(self.search_kinds('repair'), [])
+
+    @override_settings(SEARCH_MAX_CANDIDATES=1)
+    def test_max_candidates(self):
+        self.assertEqual(len(search.search('grub', self.admin)), 1)
+
+    def test_signals(self):
+        with patch('inyoka.portal.tasks.update_search_index.delay') as delay, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.post.save()
+            self.topic.save(update_fields=['sticky'])
+            self.topic.save(update_fields=['hidden'])
+            self.page.edit(text='new text', note='')
+
+        calls = {call.args for call in delay.call_args_list}
+        self.assertEqual(calls, {('forum', self.post.id), ('topic', self.topic.id),
+                                 ('wiki', self.page.id)})
+        # only the save of a search relevant field updates the topic
+        self.assertEqual(delay.call_args_list.count((('topic', self.topic.id),)), 1)
+
+    def test_rebuild_search_index_command(self):
+        SearchDocument.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_search_index', 'wiki', stdout=out)
+
+        self.assertEqual(out.getvalue(), 'Indexed 2 documents\n')
+        self.assertEqual(set(SearchDocument.objects.values_list('kind', flat=True)), {'wiki'})
+
+
+class TestSearchView(TestCase):
+
+    client_class = InyokaClient
+
+    def setUp(self):
+        super().setUp()
+        self.client.defaults['HTTP_HOST'] = settings.BASE_DOMAIN_NAME
+        Page.objects.create('Grub', 'How to repair the grub boot loader')
+        search.rebuild_index()
+
+    def test_search(self):
+        response = self.client.get('/search/', {'query': 'grub'})
+
+        self.assertContains(response, 'How to repair the grub boot loader')
+
+    def test_area(self):
+        response = self.client.get('/search/', {'query': 'grub', 'area': 'forum'})
+
+        self.assertNotContains(response, 'How to repair the grub boot loader')
+
+    def test_empty_query(self):
+        response = self.client.get('/search/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['documents'], [])
@@ -7,12 +7,22 @@
     :copyright: (c) 2012-2025 by the Inyoka Team, see AUTHORS for more details.
     :license: BSD, see LICENSE for more details.
 """
+from django.contrib.auth.models import Group
 from django.core.cache import cache
 
 from inyoka.portal.user import User
 from inyoka.utils.test import TestCase
-from inyoka.wiki.acl import PRIV_ALL, PRIV_READ, get_privilege_flags
+from inyoka.wiki.acl import (
+    PRIV_ALL,
+    PRIV_EDIT,
+    PRIV_NONE,
+    PRIV_READ,
+    filter_readable,
+    get_matcher,
+    get_privilege_flags,
+)
 from inyoka.wiki.models import Page
+from inyoka.wiki.storage import storage
 
 
 class TestWikiAcl(TestCase):
@@ -53,3 +63,61 @@ test_user=-edit,-create,-attach,-manage,-delete
         self.assertEqual(get_privilege_flags('test_user', 'wild cards2/test b'), PRIV_READ)
 
         cache.delete('wiki/storage/Access-Control-List')
+
+
+class TestAclMatcher(TestCase):
+    acl = """
+#X-Behave: Access-Control-List
+{{{
+[*]
+@editors=read,edit
+test_user=read
+
+[Secret*]
+test_user=none
+
+[Secret/Public]
+test_user=read
+
+[Own*]
+@owner=all
+}}}
+"""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('test_user', 'test2@example.com')
+        Page.objects.create('ACL', self.acl, self.user)
+
+    def tearDown(self):
+        storage.clear_cache()
+        super().tearDown()
+
+    def test_order_of_rules(self):
+        self.assertEqual(get_privilege_flags(self.user, 'Page'), PRIV_READ)
+        self.assertEqual(get_privilege_flags(self.user, 'secret/page'), PRIV_NONE)
+        self.assertEqual(get_privilege_flags(self.user, 'Secret/Public'), PRIV_READ)
+
+    def test_groups(self):
+        self.user.groups.add(Group.objects.create(name='editors'))
+
+        self.assertEqual(get_privilege_flags(self.user, 'Page'), PRIV_READ | PRIV_EDIT)
+        # matches are independent of the groups of the user
+        self.assertEqual(get_privilege_flags(self.user, 'Page', groups=set()), PRIV_READ)
+
+    def test_owner(self):
+        Page.objects.create('Own', '#X-Owner: test_user\ntext', self.user)
+
+        self.assertEqual(get_privilege_flags(self.user, 'Own'), PRIV_ALL)
+        self.assertEqual(get_privilege_flags(self.user, 'Own/Other'), PRIV_READ)
+
+    def test_filter_readable(self):
+        Page.objects.create('Own', '#X-Owner: test_user\ntext', self.user)
+        self.assertEqual(filter_readable(self.user, ['Page', 'Secret/A', 'Secret/Public', 'Own']),
+                         ['Page', 'Secret/Public', 'Own'])
+
+    def test_invalidation(self):
+        matcher = get_matcher()
+        self.assertIs(get_matcher(), matcher)
+        storage.clear_cache()
+        self.assertIsNot(get_matcher(), matcher)
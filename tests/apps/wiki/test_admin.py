@@ -7,7 +7,11 @@
     :copyright: (c) 2007-2025 by the Inyoka Team, see AUTHORS for more details.
     :license: BSD, see LICENSE for more details.
 """
+import json
+from io import StringIO
+from os import path
 from shutil import rmtree
+from unittest.mock import Mock, patch
 
 from django.conf import settings
 from django.core import management
@@ -18,6 +22,22 @@ from inyoka.utils.test import TestCase
 from inyoka.wiki.models import Page
 
 
+class InlinePool:
+    """Stands in for a `multiprocessing.Pool` and runs everything right away."""
+
+    def __init__(self, processes):
+        self.processes = processes
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def imap_unordered(self, func, iterable, chunksize=1):
+        return map(func, iterable)
+
+
 class TestAdminCommands(TestCase):
 
     def setUp(self):
@@ -35,3 +55,69 @@ class TestAdminCommands(TestCase):
     def test_generate_static_wiki(self):
         management.call_command('generate_static_wiki', verbosity=0, path='test_static_wiki')
 
+    def test_generate_static_wiki__incremental(self):
+        management.call_command('generate_static_wiki', verbosity=0, path='test_static_wiki')
+        with open(path.join('test_static_wiki', '.manifest.json')) as fobj:
+            self.assertIn('test', json.load(fobj)['pages'])
+        with open(path.join('test_static_wiki', 'files', 'test.html'), 'w') as fobj:
+            fobj.write('unchanged')
+
+        Page.objects.create(name='other', text='[:test:]')
+        management.call_command('generate_static_wiki', verbosity=0, path='test_static_wiki',
+                                incremental=True)
+
+        with open(path.join('test_static_wiki', 'files', 'test.html')) as fobj:
+            self.assertEqual(fobj.read(), 'unchanged')
+        self.assertTrue(path.exists(path.join('test_static_wiki', 'files', 'other.html')))
+
+    def test_generate_static_wiki__incremental_links(self):
+        Page.objects.create(name='linking', text='[:new:]')
+        management.call_command('generate_static_wiki', verbosity=0, path='test_static_wiki')
+        with open(path.join('test_static_wiki', 'files', 'linking.html'), 'w') as fobj:
+            fobj.write('outdated')
+
+        Page.objects.create(name='new', text='text')
+        management.call_command('generate_static_wiki', verbosity=0, path='test_static_wiki',
+                                incremental=True)
+
+        with open(path.join('test_static_wiki', 'files', 'linking.html')) as fobj:
+            self.assertNotEqual(fobj.read(), 'outdated')
+
+    def test_generate_static_wiki__twice(self):
+        management.call_command('generate_static_wiki', verbosity=0, path='test_static_wiki')
+        management.call_command('generate_static_wiki', verbosity=0, path='test_static_wiki')
+
+        with open(path.join('test_static_wiki', 'files', 'test.html')) as fobj:
+            self.assertIn('wiki.ubuntuusers.de', fobj.read())
+
+    def test_generate_static_wiki__jobs(self):
+        Page.objects.create(name='other', text='Testbar')
+
+        # run the pool in this process, it has to see the data of the test
+        context = Mock()
+        context.Pool = InlinePool
+        with patch('inyoka.wiki.management.commands.generate_static_wiki.connections'), \
+                patch('multiprocessing.get_context', return_value=context):
+            management.call_command('generate_static_wiki', verbosity=0,
+                                    path='test_static_wiki', jobs=2)
+
+        for name in ('test', 'other'):
+            self.assertTrue(path.exists(path.join('test_static_wiki', 'files', f'{name}.html')))
+
+
+class TestBenchmarkLexer(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        user = User.objects.create_user('test_user', 'test2@inyoka.local')
+        Page.objects.create(name='big', text="= Headline =\n\n'''bold''' [:Page:] " * 50, user=user)
+        Page.objects.create(name='small', text='Testfoo', user=user)
+
+    def test_benchmark_lexer(self):
+        out = StringIO()
+        management.call_command('benchmark_lexer', pages=1, rounds=1, stdout=out)
+
+        lines = out.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith('1 pages, 1700 characters'))
+        self.assertTrue(lines[1].startswith('sequential'))
+        self.assertTrue(lines[2].startswith('combined'))
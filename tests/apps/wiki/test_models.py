@@ -1,14 +1,23 @@
+from io import StringIO
 from os import path
 from unittest.mock import patch
 
+from django.conf import settings
+from django.core import management
 from django.core.cache import cache
 from django.core.files import File
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
 
 from inyoka.markup.parsertools import MultiMap
+from inyoka.portal.user import User
+from inyoka.utils.imaging import get_content_hash
+from inyoka.utils.local import local as local_cache
 from inyoka.utils.test import TestCase
+from inyoka.wiki import tasks
 from inyoka.wiki.exceptions import CaseSensitiveException
-from inyoka.wiki.models import Attachment, Page
+from inyoka.wiki.models import Attachment, MetaData, Page, Text
+from inyoka.wiki.views import fetch_real_target
 
 BASE_PATH = path.dirname(__file__)
 
@@ -74,8 +83,75 @@ class TestPage(TestCase):
         with self.assertNumQueries(7):
             template.update_related_pages()
 
+    def test_update_meta__diff(self):
+        page = Page.objects.create('test1', '#tag: a\n#tag: b\n[:other:]')
+        ids = dict(MetaData.objects.filter(page=page).values_list('value', 'id'))
+
+        page.edit('#tag: a\n#tag: c\n[:other:]', note='changed tag')
+        page.update_meta()
+
+        metadata = dict(MetaData.objects.filter(page=page).values_list('value', 'id'))
+        self.assertEqual(set(metadata), {'a', 'c', 'other'})
+        # unchanged rows are kept
+        self.assertEqual(metadata['a'], ids['a'])
+        self.assertEqual(metadata['other'], ids['other'])
+
+    def test_update_meta__many_pages(self):
+        # the old tags are removed from the metadata
+        pages = [Page.objects.create(f'page{i}', f'#tag: old{i}') for i in range(3)]
+        for page in pages:
+            page.edit(f'#tag: new\n[:page{page.id}:]', note='changed tag', update_meta=False)
+        # the links are looked up while the texts are compiled
+        Page.objects.get_page_index()
+
+        # revisions, texts, metadata, savepoint, delete, insert, release
+        with self.assertNumQueries(7):
+            Page.objects.update_meta(pages)
+
+        for page in pages:
+            page = Page.objects.get(id=page.id)
+            self.assertEqual(page.metadata['tag'], ['new'])
+            self.assertEqual(len(page.metadata), 2)
+
 
 class TestPageManager(TestCase):
+    def test_exists(self):
+        Page.objects.create('Foo Bar', 'content')
+
+        self.assertTrue(Page.objects.exists('foo_bar'))
+        self.assertFalse(Page.objects.exists('Baz'))
+
+    def test_exists_many(self):
+        Page.objects.create('Foo', 'content')
+        Page.objects.create('Bar', 'content')
+
+        self.assertEqual(Page.objects.exists_many(['Foo', 'bar', 'Baz']), {'Foo', 'bar'})
+
+    def test_page_index__new_page(self):
+        self.assertFalse(Page.objects.exists('Foo'))
+        Page.objects.create('Foo', 'content')
+
+        self.assertTrue(Page.objects.exists('Foo'))
+
+    def test_page_index__version_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Page.objects.create('Foo', 'content')
+            # another process might build its index before the commit
+            version = Page.objects.get_page_index().version
+            cache.set('wiki/objects_slugs', [])
+
+        self.assertNotEqual(Page.objects.get_page_index().version, version)
+        self.assertTrue(Page.objects.exists('Foo'))
+
+    def test_page_index__shared(self):
+        Page.objects.create('Foo', 'content')
+        Page.objects.get_page_index()
+        delattr(local_cache, 'wiki_page_index')
+
+        with self.assertNumQueries(0), patch.object(Page.objects, 'get_slug_list') as mock:
+            self.assertTrue(Page.objects.exists('Foo'))
+        mock.assert_not_called()
+
     def test_get_by_name_case_sensitive(self):
         """
         Tests that get_by_name does not ignore case.
@@ -214,6 +290,194 @@ class TestPageManager(TestCase):
         self.assertEqual(len(page.metadata), 3)
         self.assertEqual(page.metadata['tag'], ['foo'])
 
+    def test_render_pages__unchanged_skipped(self):
+        Page.objects.create('test1', '[:test1:] content')
+        Page.objects.create('test2', 'test content')
+
+        self.assertEqual(Page.objects.render_pages(['test1']), 1)
+        self.assertEqual(Page.objects.render_pages(['test1', 'test2']), 1)
+        self.assertEqual(Page.objects.render_pages(['test1', 'test2']), 0)
+
+    def test_render_pages__page_changed(self):
+        page = Page.objects.create('test1', 'content')
+        Page.objects.render_pages(['test1'])
+
+        page.edit('new content', note='changed content')
+
+        self.assertEqual(Page.objects.render_pages(['test1']), 1)
+
+    def test_render_pages__template_changed(self):
+        template = Page.objects.create('Wiki/Templates/template', 'Foo')
+        Page.objects.create('test1', '[[Vorlage(template)]]')
+        Page.objects.render_pages(['test1'])
+
+        template.edit('Bar', note='changed content')
+
+        self.assertEqual(Page.objects.render_pages(['test1']), 1)
+
+    def test_render_pages__rendered_text_expired(self):
+        page = Page.objects.create('test1', 'content')
+        Page.objects.render_pages(['test1'])
+
+        page.rev.text.remove_value_from_cache()
+
+        self.assertEqual(Page.objects.render_pages(['test1']), 1)
+
+    def test_render_all_pages__force(self):
+        Page.objects.create('test1', 'content')
+        Page.objects.render_all_pages()
+
+        Page.objects.start_render_epoch()
+
+        self.assertEqual(Page.objects.render_pages(['test1']), 1)
+
+    @override_settings(WIKI_RENDER_BATCH_SIZE=2)
+    def test_render_all_pages_task__batches(self):
+        for name in ('test1', 'test2'):
+            Page.objects.create(name, 'content')
+
+        with patch('inyoka.wiki.tasks.group') as mock:
+            tasks.render_all_pages()
+
+        batches = [signature.args[0] for signature in mock.call_args.args[0]]
+        self.assertEqual(batches, [['Wiki/Index', 'test1'], ['test2']])
+
+
+class TestDiff(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.page = Page.objects.create('Foo', 'foo\nbar')
+        self.old_rev = self.page.rev
+        self.page.edit('foo\nbaz', note='edit')
+
+    def test_compare(self):
+        diff = Page.objects.compare('Foo', self.old_rev.id)
+
+        self.assertTrue(diff.udiff.endswith('@@ -1,2 +1,2 @@\n foo\n-bar\n+baz'))
+        self.assertEqual([line['action'] for line in diff.template_diff['chunks'][0]],
+                         ['unmod', 'del', 'add'])
+
+    def test_compare__unchanged(self):
+        diff = Page.objects.compare('Foo', self.old_rev.id, self.old_rev.id)
+
+        self.assertEqual(diff.udiff, '')
+        self.assertEqual(diff.template_diff, {})
+
+    def test_compare__cached(self):
+        diff = Page.objects.compare('Foo', self.old_rev.id)
+
+        with patch('inyoka.wiki.models.generate_udiff_hunks') as mock:
+            cached = Page.objects.compare('Foo', self.old_rev.id)
+        mock.assert_not_called()
+        self.assertEqual(cached.udiff, diff.udiff)
+        self.assertEqual(cached.template_diff, diff.template_diff)
+
+    def test_prepare_diff(self):
+        tasks.prepare_diff(self.old_rev.text_id, self.page.rev.text_id)
+
+        with patch('inyoka.wiki.models.generate_udiff_hunks') as mock:
+            Page.objects.compare('Foo', self.old_rev.id)
+        mock.assert_not_called()
+
+    def test_prepare_diff__after_commit(self):
+        with patch('inyoka.wiki.tasks.prepare_diff.delay') as mock:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.page.edit('foo\nqux', note='edit')
+                mock.assert_not_called()
+            mock.assert_called_once()
+
+    def test_prepare_diff__missing_text(self):
+        with patch('inyoka.wiki.models.Diff.prepare') as mock:
+            tasks.prepare_diff(self.old_rev.text_id, 0)
+        mock.assert_not_called()
+
+
+class TestTextPacking(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.values = [''.join(f'line {i}\n' for i in range(100)) + f'revision {n}'
+                       for n in range(5)]
+        self.page = Page.objects.create('Foo', self.values[0])
+        for value in self.values[1:]:
+            self.page.edit(value, note='edit')
+
+    def get_texts(self):
+        return [Text.objects.get(revisions__id=revision.id)
+                for revision in self.page.revisions.order_by('id')]
+
+    def test_pack(self):
+        self.assertEqual(Text.objects.pack(self.page), 4)
+
+        cache.clear()
+        texts = self.get_texts()
+        self.assertEqual([text.value for text in texts], self.values)
+        self.assertEqual(Text.objects.filter(base__isnull=False).count(), 4)
+        self.assertEqual(Text.objects.filter(value='').count(), 4)
+        # the most recent text is stored in full
+        self.assertIsNone(texts[-1].base_id)
+
+    @override_settings(WIKI_TEXT_SNAPSHOT_INTERVAL=2)
+    def test_pack__snapshots(self):
+        self.assertEqual(Text.objects.pack(self.page), 3)
+
+        texts = self.get_texts()
+        self.assertEqual([text.base_id is None for text in texts],
+                         [False, True, False, False, True])
+        self.assertEqual([text.value for text in texts], self.values)
+
+    def test_pack__twice(self):
+        Text.objects.pack(self.page)
+        Text.objects.pack(self.page)
+
+        self.assertEqual([text.value for text in self.get_texts()], self.values)
+
+    def test_pack__shared_text(self):
+        Page.objects.create('Bar', self.values[1])
+
+        self.assertEqual(Text.objects.pack(self.page), 3)
+        self.assertIsNone(Text.objects.get(value=self.values[1]).base_id)
+
+    def test_pack_wiki_texts(self):
+        Page.objects.create('Bar', 'only one revision')
+        out = StringIO()
+
+        management.call_command('pack_wiki_texts', stdout=out)
+
+        self.assertEqual(out.getvalue(), '4 texts stored as delta\n')
+        cache.clear()
+        self.assertEqual([text.value for text in self.get_texts()], self.values)
+
+    def test_pack_wiki_texts__pages(self):
+        out = StringIO()
+
+        management.call_command('pack_wiki_texts', 'Bar', stdout=out)
+
+        self.assertEqual(out.getvalue(), '0 texts stored as delta\n')
+        self.assertFalse(Text.objects.filter(base__isnull=False).exists())
+
+    def test_revert(self):
+        Text.objects.pack(self.page)
+
+        self.page.edit(self.values[0], note='revert')
+
+        text = Text.objects.get(revisions__id=self.page.last_rev.id)
+        self.assertIsNone(text.base_id)
+        self.assertEqual(text.value, self.values[0])
+        self.assertEqual(Page.objects.filter(name='Foo').values_list('last_rev__text__value', flat=True)[0],
+                         self.values[0])
+
+    def test_revert__revision(self):
+        Text.objects.pack(self.page)
+        revision = self.page.revisions.order_by('id')[0]
+
+        new_revision = revision.revert('revert', User.objects.get_system_user())
+
+        self.assertEqual(Page.objects.filter(name='Foo').values_list('last_rev__text__value', flat=True)[0],
+                         self.values[0])
+        self.assertIsNone(Text.objects.get(revisions__id=new_revision.id).base_id)
+
 
 class TestAttachment(TestCase):
 
@@ -315,3 +579,71 @@ class TestAttachment(TestCase):
 
         with self.assertNumQueries(2):
             Page.objects.attachment_for_page('Döwnloads/evil.png')
+
+
+class TestThumbnails(TestCase):
+
+    def create_attachment(self, name):
+        with open(path.join(BASE_PATH, 'evil.png'), 'rb') as f:
+            upload_object = SimpleUploadedFile(f.name, f.read())
+            return Page.objects.create(name, attachment_filename='evil.png', attachment=upload_object,
+                                       text='foo', note='create')
+
+    def test_find_thumbnails(self):
+        page = Page.objects.create('Foo', '[[Bild(bar.png, 100x50)]] [[Bild(baz.png)]] '
+                                          '[[Bild(/Other/baz.png, x20)]]')
+
+        self.assertEqual(page.find_thumbnails(), {('Foo/bar.png', 100, 50),
+                                                  ('Other/baz.png', None, 20)})
+
+    def test_render_thumbnails(self):
+        page = Page.objects.create('Foo', '[[Bild(bar.png, 100x50)]]')
+
+        with patch('inyoka.wiki.tasks.group') as mock:
+            tasks.render_thumbnails([page.id])
+
+        thumbnails = [signature.args for signature in mock.call_args.args[0]]
+        self.assertEqual(thumbnails, [('Foo/bar.png', 100, 50)])
+
+    def test_render_thumbnails__no_pictures(self):
+        page = Page.objects.create('Foo', 'no pictures')
+
+        with patch('inyoka.wiki.models.render_thumbnails.delay') as mock:
+            page.update_related_pages()
+        mock.assert_not_called()
+
+    def test_fetch_real_target__replaced_file(self):
+        self.create_attachment('test/evil.png')
+        target = fetch_real_target('test/evil.png', width=10)
+
+        location = Page.objects.attachment_for_page('test/evil.png')
+        with open(path.join(settings.MEDIA_ROOT, location), 'ab') as fobj:
+            fobj.write(b'changed')
+
+        self.assertNotEqual(fetch_real_target('test/evil.png', width=10), target)
+
+    def test_fetch_real_target__shared(self):
+        self.create_attachment('test/evil.png')
+        self.create_attachment('other/evil.png')
+
+        self.assertEqual(fetch_real_target('test/evil.png', width=10),
+                         fetch_real_target('other/evil.png', width=10))
+
+    def test_content_hash__replaced_file(self):
+        self.create_attachment('test/evil.png')
+        location = Page.objects.attachment_for_page('test/evil.png')
+        content_hash = get_content_hash(location)
+
+        filename = path.join(settings.MEDIA_ROOT, location)
+        with open(filename, 'ab') as fobj:
+            fobj.write(b'changed')
+
+        self.assertNotEqual(get_content_hash(location), content_hash)
+
+    def test_fetch_real_target__index(self):
+        self.create_attachment('test/evil.png')
+        target = fetch_real_target('test/evil.png', width=10)
+
+        with patch('inyoka.wiki.views.get_shared_thumbnail') as mock:
+            self.assertEqual(fetch_real_target('test/evil.png', width=10), target)
+        mock.assert_not_called()
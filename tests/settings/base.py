@@ -56,6 +56,11 @@ if os.environ.get('INYOKA_THEME') == 'theme-ubuntuusers':
 
 SECRET_KEY = 'test-secret-key'
 
+# the cache is flushed after every test, so don't keep anything per process
+FORUM_ANONYMOUS_PRIVILEGES_TIMEOUT = 0
+MARKUP_INSTRUCTION_CACHE_LOCAL_TIMEOUT = 0
+WIKI_TEMPLATE_CACHE_SIZE = 0
+
 INYOKA_AKISMET_KEY = 'inyokatestkey'
 INYOKA_AKISMET_URL = 'http://testserver/'
 
@@ -7,6 +7,11 @@
 """
 import datetime
 
+from django.utils import timezone as dj_timezone
+
+from inyoka.portal.models import PrivateMessage
+from inyoka.portal.user import User
+from inyoka.utils.database import content_cache, prefetch_rendered
 from inyoka.utils.test import TestCase
 
 from .models import JSONEntry
@@ -57,3 +62,60 @@ class JSONTest(TestCase):
         entry = self.manager.create(f={'k': 'åäö'})
         entry = self.manager.get(pk=entry.pk)
         self.assertEqual(entry.f, {'k': 'åäö'})
+
+
+class PrefetchRenderedTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        author = User.objects.register_user('author', 'author@example.test', 'author', False)
+        self.messages = [
+            PrivateMessage.objects.create(author=author, subject=str(index),
+                                          pub_date=dj_timezone.now(),
+                                          text="'''message %s'''" % index)
+            for index in range(3)
+        ]
+
+    def test_rendered(self):
+        prefetch_rendered(self.messages, 'text')
+
+        for index, message in enumerate(self.messages):
+            self.assertEqual(message.text_rendered,
+                             '<p><strong>message %s</strong></p>' % index)
+
+    def test_written_to_cache(self):
+        prefetch_rendered(self.messages, 'text')
+
+        self.assertEqual(content_cache.get('portal:privatemessage:%s:text' % self.messages[0].pk),
+                         '<p><strong>message 0</strong></p>')
+
+    def test_no_cache_lookups_afterwards(self):
+        content_cache.set('portal:privatemessage:%s:text' % self.messages[0].pk, 'cached')
+
+        prefetch_rendered(self.messages, 'text')
+        content_cache.clear()
+
+        self.assertEqual(self.messages[0].text_rendered, 'cached')
+        self.assertEqual(self.messages[1].text_rendered, '<p><strong>message 1</strong></p>')
+
+    def test_same_object_twice(self):
+        copy = PrivateMessage.objects.get(pk=self.messages[0].pk)
+
+        prefetch_rendered([self.messages[0], copy], 'text')
+
+        self.assertIn('_text_rendered', copy.__dict__)
+        self.assertEqual(copy.text_rendered, self.messages[0].text_rendered)
+
+    def test_worker_threads(self):
+        prefetch_rendered(self.messages, 'text', max_workers=2)
+
+        self.assertEqual(self.messages[2].text_rendered,
+                         '<p><strong>message 2</strong></p>')
+
+    def test_remove_from_cache(self):
+        prefetch_rendered(self.messages, 'text')
+        message = self.messages[0]
+        message.text = 'changed'
+
+        message.remove_text_from_cache()
+
+        self.assertEqual(message.text_rendered, '<p>changed</p>')
@@ -0,0 +1,38 @@
+"""
+    tests.utils.test_delta
+    ~~~~~~~~~~~~~~~~~~~~~~
+
+    Test the line based deltas.
+
+    :copyright: (c) 2007-2025 by the Inyoka Team, see AUTHORS for more details.
+    :license: BSD, see LICENSE for more details.
+"""
+from unittest import TestCase
+
+from inyoka.utils.delta import apply_delta, make_delta
+
+
+class TestDelta(TestCase):
+
+    def assertRoundTrip(self, base, text):
+        self.assertEqual(apply_delta(base, make_delta(base, text)), text)
+
+    def test_round_trip(self):
+        base = ''.join(f'line {i}\n' for i in range(100))
+        self.assertRoundTrip(base, base.replace('line 5\n', 'changed\n') + 'new line')
+        self.assertRoundTrip(base, base[:50])
+        self.assertRoundTrip(base, 'line 99\n' + base)
+
+    def test_empty(self):
+        self.assertRoundTrip('', 'foo\nbar')
+        self.assertRoundTrip('foo\nbar', '')
+        self.assertRoundTrip('', '')
+
+    def test_line_endings(self):
+        self.assertRoundTrip('foo\r\nbar\r\n', 'foo\r\nbaz\r\nbar')
+
+    def test_small(self):
+        base = ''.join(f'line {i}\n' for i in range(1000))
+        text = base.replace('line 500\n', '')
+
+        self.assertLess(len(make_delta(base, text)), len(text) // 10)
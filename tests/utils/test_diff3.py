@@ -0,0 +1,122 @@
+"""
+    tests.utils.test_diff3
+    ~~~~~~~~~~~~~~~~~~~~~~
+
+    Test the diff functions.
+
+    :copyright: (c) 2007-2025 by the Inyoka Team, see AUTHORS for more details.
+    :license: BSD, see LICENSE for more details.
+"""
+from unittest import TestCase
+
+from inyoka.utils.diff3 import (
+    DEFAULT_MARKERS,
+    DiffConflict,
+    generate_udiff,
+    merge,
+    patience_matching_blocks,
+    prepare_udiff,
+)
+
+LEFT, MIDDLE, RIGHT = DEFAULT_MARKERS
+
+
+class TestMerge(TestCase):
+
+    def test_unchanged(self):
+        self.assertEqual(merge('a\nb', 'a\nb', 'a\nb'), 'a\nb')
+
+    def test_one_side_changed(self):
+        self.assertEqual(merge('a\nb\nc', 'a\nx\nc', 'a\nb\nc'), 'a\nx\nc')
+        self.assertEqual(merge('a\nb\nc', 'a\nb\nc', 'a\nx\nc'), 'a\nx\nc')
+
+    def test_both_sides_changed(self):
+        old = 'a\nb\nc\nd\ne'
+        other = 'x\na\nb\nc\nd\ne'
+        new = 'a\nb\nc\ne\ny'
+
+        self.assertEqual(merge(old, other, new), 'x\na\nb\nc\ne\ny')
+
+    def test_same_change(self):
+        self.assertEqual(merge('a\nb\nc', 'a\nx\nc', 'a\nx\nc'), 'a\nx\nc')
+
+    def test_conflict(self):
+        result = merge('a\nb\nc', 'a\nx\nc', 'a\ny\nc')
+
+        self.assertEqual(result.splitlines(), ['a', LEFT, 'x', MIDDLE, 'y', RIGHT, 'c'])
+
+    def test_conflict__at_the_end(self):
+        result = merge('a', 'a\nx', 'a\ny')
+
+        self.assertEqual(result.splitlines(), ['a', LEFT, 'x', MIDDLE, 'y', RIGHT])
+
+    def test_conflict__not_allowed(self):
+        with self.assertRaises(DiffConflict) as context:
+            merge('a\nb\nc', 'a\nx\nc', 'a\ny\nc', allow_conflicts=False)
+
+        self.assertEqual((context.exception.old_lineno,
+                          context.exception.other_lineno,
+                          context.exception.new_lineno), (1, 1, 1))
+
+    def test_custom_markers(self):
+        result = merge('a', 'b', 'c', markers=('<', '=', '>'))
+
+        self.assertEqual(result, '<\nb\n=\nc\n>')
+
+    def test_lists(self):
+        self.assertEqual(merge(['a', 'b', 'c'], ['a', 'b', 'x'], ['y', 'b', 'c']), 'y\nb\nx')
+
+    def test_long_text(self):
+        old = ['line %d' % index for index in range(5000)]
+        other = old[:1000] + ['inserted'] * 500 + old[1000:]
+        new = old[:4000] + ['changed'] + old[4001:]
+
+        self.assertEqual(merge(old, other, new).splitlines(),
+                         other[:4500] + ['changed'] + other[4501:])
+
+
+class TestPatienceDiff(TestCase):
+
+    def assertValidBlocks(self, a, b):
+        blocks = patience_matching_blocks(a, b)
+        self.assertEqual(tuple(blocks[-1]), (len(a), len(b), 0))
+        end_a = end_b = 0
+        for i, j, size in blocks[:-1]:
+            self.assertGreaterEqual(i, end_a)
+            self.assertGreaterEqual(j, end_b)
+            self.assertEqual(a[i:i + size], b[j:j + size])
+            end_a, end_b = i + size, j + size
+        return blocks
+
+    def test_matching_blocks(self):
+        self.assertValidBlocks('abcdef', 'abxdef')
+        self.assertValidBlocks('', 'abc')
+        self.assertValidBlocks('abc', '')
+        self.assertValidBlocks('aaaa', 'aaa')
+        self.assertValidBlocks('abcabc', 'cbacba')
+
+    def test_unique_lines_are_anchors(self):
+        a = ['}', 'foo', '}', 'bar', '}']
+        b = ['}', 'bar', '}']
+        blocks = self.assertValidBlocks(a, b)
+        self.assertIn((3, 1, 2), [tuple(block) for block in blocks])
+
+    def test_generate_udiff(self):
+        udiff = generate_udiff('a\nb\nc', 'a\nx\nc', 'old', 'new')
+
+        self.assertEqual(udiff, '--- old\n+++ new\n@@ -1,3 +1,3 @@\n a\n-b\n+x\n c')
+
+    def test_generate_udiff__unchanged(self):
+        self.assertEqual(generate_udiff('a\nb', 'a\nb'), '')
+
+    def test_generate_udiff__context(self):
+        old = '\n'.join(str(i) for i in range(20))
+        new = old.replace('10', 'ten')
+
+        self.assertEqual(generate_udiff(old, new).splitlines()[2], '@@ -7,9 +7,9 @@')
+
+    def test_prepare_udiff(self):
+        chunks = prepare_udiff(generate_udiff('foo bar', 'foo baz', 'old', 'new'))[0]['chunks']
+
+        self.assertEqual([line['line'] for line in chunks[0]],
+                         ['foo ba<del>r</del>', 'foo ba<ins>z</ins>'])
@@ -7,11 +7,17 @@
     :copyright: (c) 2011-2025 by the Inyoka Team, see AUTHORS for more details.
     :license: BSD, see LICENSE for more details.
 """
+from unittest.mock import patch
+
 from django.core import mail
+from django.test import override_settings
 
+from inyoka.portal.models import Subscription
 from inyoka.portal.user import User
-from inyoka.utils.notification import send_notification
+from inyoka.utils import ctype
+from inyoka.utils.notification import queue_notifications, send_notification
 from inyoka.utils.test import TestCase
+from inyoka.wiki.models import Page
 
 
 class TestNotification(TestCase):
@@ -31,3 +37,51 @@ class TestNotification(TestCase):
         self.assertEqual(len(mail.outbox), 1)
         self.assertEqual(mail.outbox[0].subject, "inyokaproject.org: Deleted suggestion")
         self.assertNotIn('{', mail.outbox[0].body)
+
+
+class TestQueueNotifications(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.page = Page.objects.create('Page', 'text')
+        self.users = [User.objects.register_user(f'user{i}', f'user{i}@inyoka.test', 'user', False)
+                      for i in range(3)]
+        for user in self.users:
+            Subscription.objects.create(user=user, content_object=self.page)
+        self.filter = {'content_type_id': ctype(Page).pk, 'object_id': self.page.id}
+
+    def queue(self, **kwargs):
+        return queue_notifications(self.users[0].id, 'page_edited', 'Page edited',
+                                   {'page_name': 'Page'}, filter=self.filter, **kwargs)
+
+    def test_queue_notifications(self):
+        notified = self.queue()
+
+        self.assertEqual(set(notified), {self.users[1].id, self.users[2].id})
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox),
+                         ['user1@inyoka.test', 'user2@inyoka.test'])
+        self.assertIn('Hallo user1,', next(m.body for m in mail.outbox if m.to == ['user1@inyoka.test']))
+        self.assertIn('Seite „Page“', mail.outbox[0].body)
+        self.assertFalse(Subscription.objects.filter(user__in=self.users[1:], notified=False).exists())
+
+    def test_queue_notifications__once_per_user(self):
+        Subscription.objects.filter(user=self.users[1]).update(notified=True)
+        self.queue()
+
+        self.assertEqual([m.to[0] for m in mail.outbox], ['user2@inyoka.test'])
+
+    def test_queue_notifications__deleted_user(self):
+        self.users[1].status = User.STATUS_DELETED
+        self.users[1].save()
+        self.queue()
+
+        self.assertEqual([m.to[0] for m in mail.outbox], ['user2@inyoka.test'])
+
+    @override_settings(NOTIFICATION_CHUNK_SIZE=1)
+    def test_queue_notifications__chunks(self):
+        with patch('inyoka.utils.notification.notify_subscriptions.delay') as delay:
+            notified = self.queue()
+
+        self.assertEqual(len(notified), 2)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(delay.call_count, 1)
@@ -9,11 +9,17 @@
 """
 
 import unittest
+from datetime import timedelta
+from urllib.parse import urlsplit
 
 from django.http import Http404
 from django.test import RequestFactory
+from django.utils import timezone as dj_timezone
 
+from inyoka.planet.models import Blog, Entry
+from inyoka.portal.user import User
 from inyoka.utils.pagination import Pagination
+from inyoka.utils.test import TestCase
 
 
 class TestUtilsPagination(unittest.TestCase):
@@ -72,3 +78,71 @@ class TestUtilsPagination(unittest.TestCase):
         ]
         for l, e in zip(self.p.list(), expect):
             self.assertEqual(l, e)
+
+
+class TestKeysetPagination(TestCase):
+    def setUp(self):
+        super().setUp()
+        user = User.objects.register_user('testing', 'example@example.com', 'pwd', False)
+        blog = Blog.objects.create(name='Testblog', blog_url='http://example.com/',
+                                   feed_url='http://example.com/feed', user=user)
+        now = dj_timezone.now()
+        for index in range(11):
+            # two entries share every publication date
+            Entry.objects.create(blog=blog, url=f'http://example.com/{index}',
+                                 guid=f'http://example.com/{index}',
+                                 text='text', title='title',
+                                 pub_date=now - timedelta(minutes=index // 2),
+                                 updated=now)
+        self.ids = list(Entry.objects.order_by('-pub_date', '-id').values_list('id', flat=True))
+
+    def paginate(self, url, max_pages=None):
+        path = urlsplit(url).path.strip('/')
+        page = int(path) if path else 1
+        request = RequestFactory().get(url)
+        return Pagination(request, Entry.objects.all(), page, 3, '/',
+                          max_pages=max_pages, keyset=('-pub_date', '-id'),
+                          offset_pages=1)
+
+    def test_next(self):
+        pagination = self.paginate('/')
+        ids = []
+        while True:
+            ids.extend(entry.id for entry in pagination.get_queryset())
+            if not pagination.next:
+                break
+            self.assertIn('cursor=', pagination.next)
+            pagination = self.paginate(pagination.next)
+
+        self.assertEqual(ids, self.ids)
+        self.assertEqual(pagination.page, 4)
+
+    def test_prev(self):
+        pagination = self.paginate(self.paginate('/').last)
+        self.assertEqual(pagination.page, 4)
+
+        pages = []
+        while True:
+            pages.insert(0, [entry.id for entry in pagination.get_queryset()])
+            if not pagination.prev:
+                break
+            pagination = self.paginate(pagination.prev)
+
+        self.assertEqual(pages, [self.ids[0:3], self.ids[3:6], self.ids[6:9], self.ids[9:]])
+
+    def test_last__max_pages(self):
+        pagination = self.paginate(self.paginate('/', max_pages=3).last, max_pages=3)
+
+        self.assertEqual(pagination.page, 3)
+        self.assertEqual([entry.id for entry in pagination.get_queryset()], self.ids[6:9])
+
+    def test_list(self):
+        pagination = self.paginate(self.paginate('/').next)
+        links = [(link['type'], link.get('page')) for link in pagination.list()]
+
+        self.assertEqual(links, [('link', 1), ('current', 2), ('link', 3), ('link', 4)])
+        self.assertNotIn('cursor', pagination.first)
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(Http404):
+            self.paginate('/2/?cursor=invalid')
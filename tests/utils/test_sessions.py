@@ -0,0 +1,93 @@
+"""
+    tests.utils.test_sessions
+    ~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Test the tracking of the active sessions.
+
+    :copyright: (c) 2007-2025 by the Inyoka Team, see AUTHORS for more details.
+    :license: BSD, see LICENSE for more details.
+"""
+from unittest.mock import Mock, patch
+
+from django.core.cache import cache
+
+from inyoka.portal.tasks import check_for_user_record
+from inyoka.portal.user import User
+from inyoka.utils.sessions import (
+    SESSION_DELTA,
+    get_sessions,
+    online_counts,
+    set_session_info,
+)
+from inyoka.utils.storage import storage
+from inyoka.utils.test import TestCase
+
+
+class TestSessions(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.register_user('user', 'user', 'user', False)
+
+    def visit(self, sid, user=None):
+        request = Mock(subdomain='', user=user or User.objects.get_anonymous_user())
+        request.session = Mock(new=False)
+        request.session.__getitem__ = Mock(return_value=sid)
+        set_session_info(request)
+
+    def test_online_counts(self):
+        self.visit('a')
+        self.visit('b')
+        self.visit('c', self.user)
+        self.visit('a')
+
+        self.assertEqual(online_counts(), {'anonymous': 2, 'registered': 1, 'all': 3})
+
+    def test_login(self):
+        self.visit('a')
+        self.visit('a', self.user)
+
+        self.assertEqual(online_counts(), {'anonymous': 0, 'registered': 1, 'all': 1})
+
+    def test_expired_sessions(self):
+        with patch('inyoka.utils.sessions.time', return_value=1000):
+            self.visit('a')
+            self.visit('b', self.user)
+        self.visit('c')
+
+        self.assertEqual(online_counts(), {'anonymous': 1, 'registered': 0, 'all': 1})
+
+    def test_hidden_profile(self):
+        self.user.settings = {'hide_profile': True}
+        self.visit('a', self.user)
+
+        self.assertEqual(online_counts()['anonymous'], 1)
+
+    def test_get_sessions(self):
+        self.visit('a')
+        self.visit('b', self.user)
+
+        sessions = get_sessions()
+        self.assertEqual(sessions['all'], 2)
+        self.assertEqual([session['text'] for session in sessions['registered_sessions']],
+                         ['user'])
+
+    def test_get_sessions__expired_info(self):
+        self.visit('b', self.user)
+        cache.delete('sessioninfo:b')
+
+        self.assertEqual(get_sessions()['registered_sessions'], [])
+
+    def test_check_for_user_record(self):
+        storage['session_record'] = '1'
+        self.visit('a')
+        self.visit('b')
+        check_for_user_record()
+
+        self.assertEqual(storage['session_record'], '2')
+
+    def test_session_delta(self):
+        with patch('inyoka.utils.sessions.time', return_value=1000):
+            self.visit('a')
+        with patch('inyoka.utils.sessions.time', return_value=1000 + SESSION_DELTA - 1):
+            self.assertEqual(online_counts()['all'], 1)